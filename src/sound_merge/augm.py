@@ -1,42 +1,205 @@
 import random
+from typing import Optional, Sequence
 
-import matplotlib.pyplot as plt
 import numpy as np
 from pydub import AudioSegment  # type: ignore
-from scipy.signal import spectrogram  # type: ignore
+
+from sound_merge.loudness import activity_map, window_powers
+from sound_merge.reader import float32_to_segment
+from sound_merge.segment import ArraySegment, weighted_sum
+
+
+def random_silence_intervals(
+    length_ms: int,
+    total_silence_duration: int,
+    silence_interval_duration: int,
+    rng: Optional[np.random.Generator] = None,
+    candidates: Optional[Sequence[int]] = None,
+) -> list[int]:
+    """
+    Chooses the sorted start points in ms of the silence intervals of a segment.
+    Uses the random module unless a seeded Generator is given.
+    With candidates, e.g. from active_start_points, the start points are chosen among
+    them, unless there are none.
+    """
+    total_silence_duration = min(total_silence_duration, length_ms)
+    num_intervals = total_silence_duration // silence_interval_duration
+    population: Sequence[int] = range(0, max(length_ms - silence_interval_duration, 0))
+    if candidates is not None and len(candidates) > 0:
+        population = [int(start) for start in candidates]
+    num_intervals = min(num_intervals, len(population))
+    if rng is None:
+        return sorted(random.sample(population, num_intervals))
+    return sorted(
+        int(start) for start in rng.choice(population, num_intervals, replace=False)
+    )
+
+
+def active_start_points(
+    audio_segment,
+    silence_interval_duration: int,
+    threshold_dBFS: float,
+    hop_duration: int = 50,
+) -> np.ndarray:
+    """
+    Start points in ms of the silence intervals whose middle falls on an active window
+    of hop_duration ms, one reaching threshold_dBFS, so dropouts hit the signal rather
+    than its pauses. The activity map is computed in one pass over the samples.
+    """
+    segment = ArraySegment.from_audio(audio_segment)
+    hop_frames = max(int(hop_duration * segment.frame_rate / 1000), 1)
+    active = activity_map(window_powers(segment.samples, hop_frames), threshold_dBFS)
+    population = max(len(segment) - silence_interval_duration, 0)
+    if len(active) == 0 or population == 0:
+        return np.zeros(0, dtype=np.int64)
+    middles = np.arange(population) + silence_interval_duration // 2
+    windows = np.minimum(
+        middles * segment.frame_rate // 1000 // hop_frames, len(active) - 1
+    )
+    return np.flatnonzero(active[windows])
+
+
+def silence_envelope(
+    n_frames: int,
+    start_frames: Sequence[int],
+    interval_frames: int,
+    fade_frames: int,
+) -> np.ndarray:
+    """
+    Builds the gain envelope of silence intervals of equal length with linear fade ramps.
+
+    Every interval fades out over fade_frames before it and fades back in over fade_frames
+    after it, ramps are shortened at the edges of the segment. Overlapping intervals and
+    ramps take the lowest gain. Only the frames of the intervals and ramps are written.
+    """
+    envelope = np.ones(n_frames, dtype=np.float32)
+    ends = []
+    for start in start_frames:
+        end = min(start + interval_frames, n_frames)
+        ends.append(end)
+        fade_out = min(fade_frames, start)
+        if fade_out > 0 and start <= n_frames:
+            ramp = np.arange(fade_out, 0, -1, dtype=np.float32) / fade_out
+            np.minimum(
+                envelope[start - fade_out : start],
+                ramp,
+                out=envelope[start - fade_out : start],
+            )
+        fade_in = min(fade_frames, n_frames - end)
+        if fade_in > 0:
+            ramp = np.arange(fade_in, dtype=np.float32) / fade_in
+            np.minimum(
+                envelope[end : end + fade_in], ramp, out=envelope[end : end + fade_in]
+            )
+    for start, end in zip(start_frames, ends):
+        envelope[start:end] = 0.0
+    return envelope
 
 
 def random_silence_mask(
-    audio_segment, total_silence_duration, silence_interval_duration, fade_duration
+    audio_segment,
+    total_silence_duration,
+    silence_interval_duration,
+    fade_duration,
+    rng: Optional[np.random.Generator] = None,
+    activity_dBFS: Optional[float] = None,
 ):
     """
     Randomly masks audio_segment with silence intervals of specified lenght
-    """
-    total_silence_duration = min(total_silence_duration, len(audio_segment))
-    num_intervals = total_silence_duration // silence_interval_duration
 
-    start_points = sorted(
-        random.sample(
-            range(0, len(audio_segment) - silence_interval_duration), num_intervals
+    The intervals and fades are combined into one gain envelope, applied with a single
+    multiplication. Accepts AudioSegment or ArraySegment and returns the same type.
+    With activity_dBFS the intervals are placed over active regions, see
+    active_start_points.
+    """
+    candidates = None
+    if activity_dBFS is not None:
+        candidates = active_start_points(
+            audio_segment, silence_interval_duration, activity_dBFS
         )
+    start_points = random_silence_intervals(
+        len(audio_segment),
+        total_silence_duration,
+        silence_interval_duration,
+        rng,
+        candidates,
+    )
+    return apply_silence_mask(
+        audio_segment, start_points, silence_interval_duration, fade_duration
     )
-    modified_audio = audio_segment[:]
 
-    for start in start_points:
-        end = start + silence_interval_duration
-        start_audio = modified_audio[:start].fade_out(min(fade_duration, start))
 
-        end_audio = modified_audio[end:].fade_in(
-            min(fade_duration, len(modified_audio) - end)
-        )
+def apply_silence_mask(
+    audio_segment,
+    start_points: Sequence[int],
+    silence_interval_duration: int,
+    fade_duration: int,
+):
+    """
+    Masks audio_segment with silence intervals starting at the given points in ms
+    """
+    segment = ArraySegment.from_audio(audio_segment)
+    envelope = silence_envelope(
+        segment.frame_count(),
+        [int(start * segment.frame_rate / 1000) for start in start_points],
+        int(silence_interval_duration * segment.frame_rate / 1000),
+        int(fade_duration * segment.frame_rate / 1000),
+    )
+    masked = segment.with_samples(segment.samples * envelope[:, np.newaxis])
+    if isinstance(audio_segment, AudioSegment):
+        return masked.to_audio_segment(sample_width=audio_segment.sample_width)
+    return masked
+
 
-        modified_audio = (
-            start_audio
-            + AudioSegment.silent(duration=silence_interval_duration)
-            + end_audio
+def random_silence_mask_batch(
+    audio_segments: Sequence,
+    total_silence_duration: int,
+    silence_interval_duration: int,
+    fade_duration: int,
+    rng: Optional[np.random.Generator] = None,
+) -> list:
+    """
+    Applies random_silence_mask to every segment, drawing the intervals from one rng in
+    the order of the segments. Segments of equal length and format are masked together
+    in one multiplication.
+    """
+    start_points = [
+        random_silence_intervals(
+            len(audio_segment), total_silence_duration, silence_interval_duration, rng
         )
+        for audio_segment in audio_segments
+    ]
+    segments = [
+        ArraySegment.from_audio(audio_segment) for audio_segment in audio_segments
+    ]
+    groups: dict[tuple[int, int, int], list[int]] = {}
+    for i, segment in enumerate(segments):
+        key = (segment.frame_rate, segment.channels, segment.frame_count())
+        groups.setdefault(key, []).append(i)
 
-    return modified_audio
+    masked: list = [None] * len(segments)
+    for (frame_rate, _, n_frames), members in groups.items():
+        envelopes = np.stack(
+            [
+                silence_envelope(
+                    n_frames,
+                    [int(start * frame_rate / 1000) for start in start_points[i]],
+                    int(silence_interval_duration * frame_rate / 1000),
+                    int(fade_duration * frame_rate / 1000),
+                )
+                for i in members
+            ]
+        )
+        samples = np.stack([segments[i].samples for i in members])
+        samples = samples * envelopes[:, :, np.newaxis]
+        for i, masked_samples in zip(members, samples):
+            result = segments[i].with_samples(masked_samples)
+            original = audio_segments[i]
+            if isinstance(original, AudioSegment):
+                masked[i] = result.to_audio_segment(sample_width=original.sample_width)
+            else:
+                masked[i] = result
+    return masked
 
 
 def concatenate(
@@ -59,40 +222,27 @@ def mix_overlay(
 
 def mix(audio_segment1: AudioSegment, audio_segment2: AudioSegment) -> AudioSegment:
     """
-    Mixes two audio segments by adding them and normalizing by dividing by the max value
+    Mixes two audio segments by adding them and normalizing by dividing by the max value.
+    Accepts AudioSegment or MappedAudio, the samples are converted to float only once.
+    The second segment is converted to the frame rate and channels of the first one,
+    the result has the length and sample width of the first one.
     """
-    samples1 = (
-        np.array(audio_segment1.get_array_of_samples(), dtype=np.float32)
-        / audio_segment1.max_possible_amplitude
-    )
-    samples2 = (
-        np.array(audio_segment2.get_array_of_samples(), dtype=np.float32)
-        / audio_segment2.max_possible_amplitude
+    segment1 = ArraySegment.from_audio(audio_segment1)
+    segment2 = (
+        ArraySegment.from_audio(audio_segment2)
+        .set_channels(segment1.channels)
+        .set_frame_rate(segment1.frame_rate)
     )
+    mixed_samples = weighted_sum([segment1, segment2], [1.0, 1.0]).samples
 
-    if len(samples1) < len(samples2):
-        samples2 = samples2[: len(samples1)]
-    else:
-        samples2 = np.pad(samples2, (0, len(samples1) - len(samples2)), "constant")
-
-    mixed_samples = samples1 + samples2
-
-    peak = np.abs(mixed_samples).max()
+    peak = np.abs(mixed_samples).max() if mixed_samples.size else 0.0
     if peak > 1:
         mixed_samples /= peak
 
-    mixed_samples *= audio_segment1.max_possible_amplitude
-
-    # create a new audio segment from the mixed samples
-    mixed_audio_segment = AudioSegment(
-        data=mixed_samples.astype(np.int16).tobytes(),
-        sample_width=audio_segment1.sample_width,
-        frame_rate=audio_segment1.frame_rate,
-        channels=audio_segment1.channels,
+    return float32_to_segment(
+        mixed_samples, segment1.frame_rate, sample_width=audio_segment1.sample_width
     )
 
-    return mixed_audio_segment
-
 
 def random_segment(
     audio_segment: AudioSegment, length_s: float, **kwargs
@@ -105,39 +255,10 @@ def random_segment(
     return audio_segment[start : (start + length_ms)]
 
 
-def display_spectrogram(audio_segment: AudioSegment):
-    """
-    Displays the spectrogram of the audio segment
-    """
-    samples = np.array(audio_segment.get_array_of_samples())
-
-    num_channels = audio_segment.channels
-    if num_channels == 2:
-        samples = samples.reshape(-1, 2).mean(axis=1)
-
-    f, t, Sxx = spectrogram(samples, audio_segment.frame_rate)
-    plt.figure(figsize=(10, 4))
-    plt.pcolormesh(t, f, 10 * np.log10(Sxx), shading="gouraud")
-    plt.ylabel("Frequency [Hz]")
-    plt.xlabel("Time [sec]")
-    plt.title("Spectrogram")
-    plt.colorbar(label="Intensity [dB]")
-    plt.show()
-
-
-def display_waveform(audio_segment: AudioSegment):
-    """
-    Displays the waveform of the audio segment
-    """
-    samples = np.array(audio_segment.get_array_of_samples())
-
-    num_channels = audio_segment.channels
-    if num_channels == 2:
-        samples = samples.reshape(-1, 2).mean(axis=1)
+def __getattr__(name: str):
+    # the plotting functions moved to sound_merge.plotting, which imports matplotlib
+    if name in ("display_spectrogram", "display_waveform"):
+        from sound_merge import plotting
 
-    plt.figure(figsize=(10, 4))
-    plt.plot(samples)
-    plt.title("Wave File Plot")
-    plt.xlabel("Frame")
-    plt.ylabel("Amplitude")
-    plt.show()
+        return getattr(plotting, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
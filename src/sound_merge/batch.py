@@ -0,0 +1,218 @@
+"""
+This module mixes many mixtures at once: the sources of a batch are stacked into one
+float32 [batch, sources, frames, channels] array and normalization, gain, summation and
+peak limiting are whole-array NumPy operations
+"""
+
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+from sound_merge.segment import ArraySegment, db_to_gain
+
+
+def stack_sources(items: Sequence[Sequence], n_frames: Optional[int] = None):
+    """
+    Stacks the sources of every mixture into a [batch, sources, frames, channels] array.
+
+    Every mixture must have the same number of sources and all sources the same frame
+    rate and channels (see HarmonizeSegments). Sources are cut or padded with silence
+    to n_frames, by default the length of the first source of the first mixture.
+    Returns the array, the frame rate and the [batch, sources] number of frames of every
+    source before padding.
+    """
+    if len(items) == 0 or len(items[0]) == 0:
+        raise ValueError("At least one mixture with one source is required")
+    segments = [[ArraySegment.from_audio(source) for source in item] for item in items]
+    first = segments[0][0]
+    if n_frames is None:
+        n_frames = first.frame_count()
+
+    stacked = np.zeros(
+        (len(segments), len(segments[0]), n_frames, first.channels), dtype=np.float32
+    )
+    lengths = np.zeros(stacked.shape[:2], dtype=np.int64)
+    for b, item in enumerate(segments):
+        if len(item) != stacked.shape[1]:
+            raise ValueError(
+                f"All mixtures must have {stacked.shape[1]} sources, got {len(item)}"
+            )
+        for s, segment in enumerate(item):
+            if (segment.frame_rate, segment.channels) != (
+                first.frame_rate,
+                first.channels,
+            ):
+                raise ValueError(
+                    "Sources must have the same frame rate and channels, "
+                    f"got {segment.frame_rate} Hz/{segment.channels} ch and "
+                    f"{first.frame_rate} Hz/{first.channels} ch"
+                )
+            length = min(n_frames, segment.frame_count())
+            stacked[b, s, :length] = segment.samples[:length]
+            lengths[b, s] = length
+    return stacked, first.frame_rate, lengths
+
+
+def batch_dBFS(sources: np.ndarray, lengths: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    dBFS of every source of a [batch, sources, frames, channels] array, -inf if silent.
+    With lengths, padded sources are measured over their first lengths frames only.
+    """
+    if lengths is None:
+        lengths = np.full(sources.shape[:2], sources.shape[2])
+    energy = np.sum(np.square(sources), axis=(2, 3), dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 10 * np.log10(energy / (np.asarray(lengths) * sources.shape[3]))
+
+
+def source_power(
+    sources: np.ndarray,
+    lengths: Optional[np.ndarray] = None,
+    frame_length: int = 0,
+    active_range_db: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Mean square of every source of a [..., frames, channels] array, over the first
+    lengths frames of each. With frame_length and active_range_db only the frames of
+    frame_length samples within active_range_db of the loudest frame of the source are
+    measured, so pauses do not lower the power. Sources without any such frame are
+    measured completely.
+    """
+    if lengths is None:
+        lengths = np.full(sources.shape[:-2], sources.shape[-2])
+    lengths = np.asarray(lengths)
+    energy = np.mean(np.square(sources), axis=-1, dtype=np.float64)
+    power = energy.sum(axis=-1) / np.maximum(lengths, 1)
+    if active_range_db is None or frame_length <= 0:
+        return power
+
+    n_windows = energy.shape[-1] // frame_length
+    frames = energy[..., : n_windows * frame_length].reshape(
+        *energy.shape[:-1], n_windows, frame_length
+    )
+    frames = frames.mean(axis=-1)
+    valid = np.arange(n_windows) < (lengths // frame_length)[..., np.newaxis]
+    frames = np.where(valid, frames, 0.0)
+    floor = frames.max(axis=-1, keepdims=True) * 10 ** (-active_range_db / 10)
+    active = valid & (frames > 0) & (frames >= floor)
+    count = active.sum(axis=-1)
+    active_power = np.sum(frames * active, axis=-1) / np.maximum(count, 1)
+    return np.where(count > 0, active_power, power)
+
+
+def normalization_gains_db(
+    sources: np.ndarray, target_dBFS: float, lengths: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    [batch, sources] gains in dB that bring every source to target_dBFS,
+    silent sources get 0 dB
+    """
+    gains_db = target_dBFS - batch_dBFS(sources, lengths)
+    gains_db[~np.isfinite(gains_db)] = 0.0
+    return gains_db
+
+
+def mix_batch(
+    sources: np.ndarray,
+    target_dBFS: Optional[float] = None,
+    gains_db: Optional[Sequence[float]] = None,
+    peak_dBFS: Optional[float] = -1.0,
+    lengths: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Mixes a [batch, sources, frames, channels] array into [batch, frames, channels].
+
+    Every source is normalized to target_dBFS (if given), then gets its gain from
+    gains_db, one per source or a [batch, sources] array. Mixtures whose peak exceeds
+    peak_dBFS are scaled down to it, like WeightedMixSegments.
+    lengths are the unpadded source lengths returned by stack_sources.
+    """
+    total_db = np.zeros(sources.shape[:2], dtype=np.float64)
+    if target_dBFS is not None:
+        total_db += normalization_gains_db(sources, target_dBFS, lengths)
+    if gains_db is not None:
+        total_db += np.broadcast_to(
+            np.asarray(gains_db, dtype=np.float64), total_db.shape
+        )
+    weights = db_to_gain(total_db).astype(np.float32)
+
+    mixed = np.einsum("bs,bstc->btc", weights, sources)
+    if peak_dBFS is not None and mixed.size:
+        peaks = np.abs(mixed).max(axis=(1, 2))
+        ceiling = np.float32(db_to_gain(peak_dBFS))
+        scale = np.where(peaks > ceiling, ceiling / np.maximum(peaks, 1e-12), 1.0)
+        mixed *= scale.astype(np.float32)[:, np.newaxis, np.newaxis]
+    return mixed
+
+
+class SegmentBatch:
+    """
+    Mixtures of equal length as one float32 [batch, frames, channels] array.
+
+    The array can be handed to a data loader as is, single mixtures are ArraySegment
+    views into it.
+    """
+
+    __slots__ = ("samples", "frame_rate")
+
+    def __init__(self, samples: np.ndarray, frame_rate: int):
+        if samples.ndim != 3:
+            raise ValueError("Samples must be a [batch, frames, channels] array")
+        self.samples = samples
+        self.frame_rate = frame_rate
+
+    def __len__(self) -> int:
+        return self.samples.shape[0]
+
+    def __getitem__(self, i: int) -> ArraySegment:
+        return ArraySegment(self.samples[i], self.frame_rate)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def export(self, dest_files: Sequence[Path], format: str = "wav"):
+        """
+        Exports every mixture to the corresponding file
+        """
+        if len(dest_files) != len(self):
+            raise ValueError(f"Expected {len(self)} files, got {len(dest_files)}")
+        for segment, dest_file in zip(self, dest_files):
+            segment.export(dest_file, format=format)
+
+
+class BatchMixer:
+    """
+    Batch counterpart of NormalizeSegments followed by WeightedMixSegments.
+
+    Takes a list of mixtures, each a list of sources of the same format, and returns
+    a SegmentBatch with the length of the first source of the first mixture.
+    """
+
+    def __init__(
+        self,
+        target_dBFS: Optional[float] = None,
+        gains_db: Optional[Sequence[float]] = None,
+        peak_dBFS: Optional[float] = -1.0,
+    ):
+        self._target_dBFS = target_dBFS
+        self._gains_db = gains_db
+        self._peak_dBFS = peak_dBFS
+
+    def __call__(
+        self, items: Sequence[Sequence], n_frames: Optional[int] = None
+    ) -> SegmentBatch:
+        sources, frame_rate, lengths = stack_sources(items, n_frames)
+        if self._gains_db is not None and len(self._gains_db) != sources.shape[1]:
+            raise ValueError(
+                f"Expected {len(self._gains_db)} sources per mixture, "
+                f"got {sources.shape[1]}"
+            )
+        mixed = mix_batch(
+            sources,
+            target_dBFS=self._target_dBFS,
+            gains_db=self._gains_db,
+            peak_dBFS=self._peak_dBFS,
+            lengths=lengths,
+        )
+        return SegmentBatch(mixed, frame_rate)
@@ -3,20 +3,38 @@ This module contains the benchmark function that generates
 audio files from the given source directories
 """
 
+import os
 import random
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from copy import copy
 from pathlib import Path
-from typing import Iterable, Union, Callable, Generator
+from typing import Any, Iterable, Optional, Union, Callable, Generator
 
 import numpy as np
 from loguru import logger
-from mutagen.wave import WAVE
 
-from sound_merge.callables import (
-    PullAudioSegments,
-    RandomSegment,
-    NormalizeSegments,
-    MixSegments,
+from sound_merge.callables import RecordSources, SourceGroup
+from sound_merge.cache import CacheStats, DecodedAudioCache
+from sound_merge.index import SourceIndex
+from sound_merge.manifest import (
+    MANIFEST_FILENAME,
+    ManifestWriter,
+    collect_provenance,
+    read_manifest,
 )
+from sound_merge.pipeline import BackgroundWriter, StreamingPipeline
+from sound_merge.probe import check_format, probe
+from sound_merge.profiling import (
+    audio_bytes,
+    disable_profiling,
+    enable_profiling,
+    get_profiler,
+    stage,
+)
+from sound_merge.sampling import SourceSampler
+from sound_merge.shards import ShardWriter
+from sound_merge.spec import DEFAULT_PIPELINE, build_steps
 
 PathLike = Union[str, Path]
 
@@ -43,7 +61,8 @@ def choose_volume(coefs: list, distr: str) -> float:
 
 def calculate_db_loss(percent: float) -> float:
     """
-    Calculates the dB loss from the given percentage.
+    Calculates the dB loss of scaling the power to the given fraction, as the gain in
+    dB to apply: 0 or negative, e.g. -3.01 dB for 0.5.
     """
     if not 0 <= percent <= 1:
         raise ValueError("Percent must be between 0 and 1.")
@@ -53,7 +72,7 @@ def calculate_db_loss(percent: float) -> float:
         )
     if percent == 1:
         return 0
-    return -10 * np.log10(percent)
+    return 10 * np.log10(percent)
 
 
 def take_clean_audio(audio_directory: Path) -> list[Path]:
@@ -70,13 +89,13 @@ def take_clean_audio(audio_directory: Path) -> list[Path]:
 
 def filter_out_short_audio(audio_files: list[Path], duration_s: float) -> list[Path]:
     """
-    Filters out audio files that are shorter than the given duration using mutagen
+    Filters out audio files that are shorter than the given duration, reading only headers
     """
-    filtered = [
-        audio
-        for audio in audio_files
-        if audio and WAVE(audio).info.length >= duration_s  # type: ignore
-    ]
+    filtered = []
+    for audio in audio_files:
+        info = probe(audio) if audio else None
+        if info is not None and check_format(info, min_duration_s=duration_s):
+            filtered.append(audio)
     if len(filtered) == 0:
         raise ValueError("No audio files are long enough")
     return filtered
@@ -103,27 +122,74 @@ def path_generator(
     source_directories: Iterable[Path],
     check_file: Callable[[Path], bool],
     n_generations: int,
+    min_duration_s: float = 0.0,
+    **sampling,
 ) -> Generator[list[Path], None, None]:
-    path_pool = []
+    """
+    Yields n_generations lists of paths, one random file from each directory.
+    The directories are read through their persistent SourceIndex, and the files are
+    drawn by a SourceSampler with the sampling arguments (uniform by default).
+    """
+    samplers = []
     for directory in source_directories:
-        paths = [
-            path
-            for path in directory.rglob("*")
-            if path.is_file() and not path.name.startswith(".") and check_file(path)
-        ]
-        if len(paths) == 0:
+        index = SourceIndex.open(directory)
+        entries = index.filter(
+            min_duration_s=min_duration_s, check_file=lambda path, _: check_file(path)
+        )
+        if len(entries) == 0:
             raise FileNotFoundError(f"No audio files found in: {directory}")
-        path_pool.append(paths)
+        samplers.append((index, SourceSampler(entries, **sampling)))
 
     for _ in range(n_generations):
-        yield [random.choice(paths) for paths in path_pool]
+        yield [index.absolute(sampler.draw()) for index, sampler in samplers]
 
 
 def produce_benchmark(
-    source_directories: list[Path], destination_directory: Path, audio_file_count: int
+    source_directories: list[Union[Path, SourceGroup]],
+    destination_directory: Path,
+    audio_file_count: int,
+    workers: int = 1,
+    seed: Optional[int] = None,
+    chunksize: int = 16,
+    cache_bytes: int = 0,
+    cache_dir: Optional[Path] = None,
+    shard_items: int = 0,
+    profile: bool = False,
+    profile_export: Optional[Path] = None,
+    pipeline: Optional[dict] = None,
+    trace_allocations: bool = False,
 ):
     """
     Benchmark function to test the dynamic selection of audio files
+
+    Item i is written to mixed_audio_<i>.wav and generated with the seed derived from
+    the master seed and i, so the output does not depend on the number of workers.
+    With a single worker the items are streamed: loading is prefetched by background
+    threads and the files are written by a background writer.
+    With workers > 1 the items are generated in a process pool, dispatched in chunks of
+    chunksize items.
+
+    With cache_bytes > 0 fully decoded (non-WAV) sources are kept in a DecodedAudioCache
+    of that size per process, shared between processes through cache_dir if it is given.
+    The cache counters are logged at the end.
+
+    With shard_items > 0 the mixtures are packed into shards of that many items in the
+    destination directory (see shards.ShardWriter) instead of written as WAV files,
+    with the item index and seed as metadata.
+
+    The provenance of every item (seed, source files, excerpt start frames, gains) is
+    appended to manifest.jsonl in the destination directory as it is generated, and
+    stored as the shard metadata when packing. See replay_benchmark.
+
+    With profile, every pipeline stage is timed (see profiling) and the report is
+    logged at the end. It is also written to profile_export if given, in the
+    Prometheus text format if its suffix is .prom and as JSON otherwise.
+    trace_allocations also measures the allocation peak of every stage with tracemalloc
+    (see profiling.Profiler), which slows the run down. It implies profile.
+
+    pipeline describes the steps as in a spec file (see spec.DEFAULT_PIPELINE, which is
+    used by default). An entry of source_directories can be a SourceGroup, of which
+    every mixture takes one weighted directory.
     """
     # source_files = generate_source_audio(source_directories=source_directories)
 
@@ -146,15 +212,260 @@ def produce_benchmark(
     #     mixed_segment.export(dest_file, format="wav")
     #     logger.info(f"Generated mixed file No.{i+1} saved to: {dest_file}")
 
-    segment_puller = PullAudioSegments()
-    random_segmenter = RandomSegment(len_s=10)
-    normalizer = NormalizeSegments(target_dBFS=-14)
-    mixer = MixSegments()
-
-    for _ in range(audio_file_count):
-        audio_segments = segment_puller(source_directories)
-        audio_segments = random_segmenter(audio_segments)
-        audio_segments = normalizer(audio_segments)
-        mixed_segment = mixer(audio_segments)
-        dest_file = destination_directory / "mixed_audio.wav"
-        mixed_segment[0].export(dest_file, format="wav")
+    profile = profile or trace_allocations
+    profiler = enable_profiling(trace_allocations) if profile else None
+    if seed is None:
+        seed = random.randrange(2**32)
+    logger.info(f"Producing {audio_file_count} mixtures with master seed {seed}")
+
+    width = len(str(max(audio_file_count - 1, 0)))
+    cache_stats: dict[int, CacheStats] = {}
+    if workers <= 1:
+        cache = _build_cache(cache_bytes, cache_dir)
+        file_step, segment_steps = _build_steps(cache, pipeline)
+        file_step.prepare(list(source_directories))
+        stream = StreamingPipeline(file_step, segment_steps)
+        seeds = (item_seed(seed, item) for item in range(audio_file_count))
+        steps = [file_step, *segment_steps]
+        with _open_writer(
+            destination_directory, shard_items, True
+        ) as writer, ManifestWriter(
+            destination_directory / MANIFEST_FILENAME
+        ) as manifest:
+            for item, audio_segments in enumerate(stream(source_directories, seeds)):
+                row = _item_row(
+                    seed, item, width, shard_items, collect_provenance(steps)
+                )
+                manifest.write(row)
+                if isinstance(writer, ShardWriter):
+                    writer.write(audio_segments[0], row)
+                else:
+                    writer.write(audio_segments[0], destination_directory / row["file"])
+                if profiler is not None:
+                    profiler.count_item(audio_segments[0])
+        if cache is not None:
+            cache_stats[os.getpid()] = cache.stats
+    else:
+        # refresh the indexes and stores once here, the workers then only read them
+        file_step, _ = _build_steps(pipeline=pipeline)
+        file_step.prepare(list(source_directories))
+        initargs = (
+            list(source_directories),
+            Path(destination_directory),
+            seed,
+            cache_bytes,
+            cache_dir,
+            shard_items > 0,
+            profile,
+            pipeline,
+            trace_allocations,
+        )
+        items = [(item, width) for item in range(audio_file_count)]
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=initargs
+        ) as executor, _open_writer(
+            destination_directory, shard_items, False
+        ) as writer, ManifestWriter(
+            destination_directory / MANIFEST_FILENAME
+        ) as manifest:
+            for item, (result, pid, stats, provenance, samples) in enumerate(
+                executor.map(_generate_item, items, chunksize=chunksize)
+            ):
+                if profiler is not None and samples is not None:
+                    profiler.merge(samples)
+                row = _item_row(seed, item, width, shard_items, provenance)
+                manifest.write(row)
+                if isinstance(writer, ShardWriter):
+                    writer.write(result, row)
+                else:
+                    logger.debug(f"Generated mixed file: {result}")
+                if stats is not None:
+                    cache_stats[pid] = stats
+
+    if cache_stats:
+        stats = sum(cache_stats.values(), CacheStats())
+        logger.info(
+            f"Decoded audio cache: {stats.hits} hits, {stats.misses} misses "
+            f"({stats.spill_hits} from disk), {stats.evictions} evictions, "
+            f"hit rate {stats.hit_rate:.1%}"
+        )
+
+    if profiler is not None:
+        disable_profiling()
+        logger.info(f"Pipeline profile:\n{profiler.report()}")
+        if profile_export is not None:
+            if Path(profile_export).suffix == ".prom":
+                profiler.export_prometheus(profile_export)
+            else:
+                profiler.export_json(profile_export)
+
+
+def item_seed(master_seed: int, item: int) -> int:
+    """
+    Derives the seed of one benchmark item from the master seed and the item index
+    """
+    return int(np.random.SeedSequence([master_seed, item]).generate_state(1)[0])
+
+
+def _item_name(item: int, width: int) -> str:
+    return f"mixed_audio_{item:0{width}d}.wav"
+
+
+def _item_row(
+    master_seed: int, item: int, width: int, shard_items: int, provenance: dict
+) -> dict:
+    """
+    Manifest row of an item, file is only set for WAV output
+    """
+    row: dict = {"item": item, "seed": item_seed(master_seed, item)}
+    if shard_items <= 0:
+        row["file"] = _item_name(item, width)
+    row.update(provenance)
+    return row
+
+
+def replay_benchmark(
+    manifest_path: Path,
+    source_directories: list[Union[Path, SourceGroup]],
+    destination_directory: Path,
+    items: Optional[Iterable[int]] = None,
+    check: bool = True,
+    pipeline: Optional[dict] = None,
+) -> list[Path]:
+    """
+    Regenerates the given items (all by default) of a benchmark from its manifest and
+    writes them as WAV files to destination_directory, under their original names.
+
+    The items are bit-exact copies of the original ones as long as the source files
+    are unchanged. With check, an item whose sources, offsets or gains differ from
+    the manifest raises a ValueError instead of being written.
+    The sources and the pipeline must be the ones the benchmark was produced with.
+    The decoded-audio cache is not needed, segments decode to the same samples and
+    provenance with or without it.
+    """
+    rows = read_manifest(manifest_path, items)
+    steps = _build_steps(pipeline=pipeline)
+    steps[0].prepare(list(source_directories))
+    width = len(str(max((row["item"] for row in rows), default=0)))
+
+    dest_files = []
+    for row in rows:
+        mixed_segment, provenance = _run_item(steps, source_directories, row["seed"])
+        if check and any(row.get(key) != value for key, value in provenance.items()):
+            raise ValueError(
+                f"Item {row['item']} does not match {manifest_path}, "
+                "the source files have changed"
+            )
+        dest_file = Path(destination_directory) / row.get(
+            "file", _item_name(row["item"], width)
+        )
+        mixed_segment.export(dest_file, format="wav")
+        logger.info(f"Replayed item {row['item']} to: {dest_file}")
+        dest_files.append(dest_file)
+    return dest_files
+
+
+def _open_writer(destination_directory: Path, shard_items: int, background: bool):
+    """
+    Opens a ShardWriter if shard_items > 0, otherwise a BackgroundWriter for WAV files
+    if background is set, or nothing if the WAV files are written by the workers
+    """
+    if shard_items > 0:
+        return ShardWriter(destination_directory, items_per_shard=shard_items)
+    return BackgroundWriter() if background else nullcontext()
+
+
+def _build_cache(
+    cache_bytes: int, cache_dir: Optional[Path]
+) -> Optional[DecodedAudioCache]:
+    if cache_bytes <= 0:
+        return None
+    return DecodedAudioCache(max_bytes=cache_bytes, spill_dir=cache_dir)
+
+
+def _build_steps(
+    cache: Optional[DecodedAudioCache] = None, pipeline: Optional[dict] = None
+) -> tuple[Any, list]:
+    """
+    Builds the benchmark pipeline, the source indexes are expected to be fresh.
+    RecordSources is inserted before the mixing step if the pipeline has none,
+    so the manifest always lists the sources.
+    """
+    file_step, segment_steps = build_steps(
+        pipeline or DEFAULT_PIPELINE, {"refresh_index": False, "cache": cache}
+    )
+    if not any(isinstance(step, RecordSources) for step in segment_steps):
+        segment_steps.insert(len(segment_steps) - 1, RecordSources())
+    return file_step, segment_steps
+
+
+def _run_item(steps: tuple, source_directories: list, seed: int):
+    """
+    Generates one mixture with the given seed, returns it with its provenance
+    """
+    random.seed(seed)
+    file_step, segment_steps = steps
+    audio_segments = file_step(source_directories)
+    for step in segment_steps:
+        audio_segments = step(audio_segments)
+    return audio_segments[0], collect_provenance([file_step, *segment_steps])
+
+
+_worker_state: dict = {}
+
+
+def _init_worker(
+    source_directories: list,
+    destination_directory: Path,
+    master_seed: int,
+    cache_bytes: int,
+    cache_dir: Optional[Path],
+    pack: bool = False,
+    profile: bool = False,
+    pipeline: Optional[dict] = None,
+    trace_allocations: bool = False,
+):
+    """
+    Builds the pipeline once per worker process
+    """
+    if profile:
+        enable_profiling(trace_allocations)
+    cache = _build_cache(cache_bytes, cache_dir)
+    _worker_state.update(
+        source_directories=source_directories,
+        destination_directory=destination_directory,
+        master_seed=master_seed,
+        cache=cache,
+        steps=_build_steps(cache, pipeline),
+        pack=pack,
+    )
+
+
+def _generate_item(args: tuple[int, int]) -> tuple:
+    """
+    Generates and exports one mixture with its own seed. When packing, the mixture is
+    returned to be written to the shards by the main process.
+    Returns the file or mixture, the pid, the cache counters, the provenance and the
+    profiling samples of the item.
+    """
+    item, width = args
+    mixed_segment, provenance = _run_item(
+        _worker_state["steps"],
+        _worker_state["source_directories"],
+        item_seed(_worker_state["master_seed"], item),
+    )
+
+    cache = _worker_state["cache"]
+    stats = copy(cache.stats) if cache else None
+    if _worker_state["pack"]:
+        result: Any = mixed_segment
+    else:
+        result = _worker_state["destination_directory"] / _item_name(item, width)
+        with stage("export", audio_bytes(mixed_segment)):
+            mixed_segment.export(result, format="wav")
+
+    profiler = get_profiler()
+    if profiler is not None:
+        profiler.count_item(mixed_segment)
+    samples = profiler.drain() if profiler is not None else None
+    return result, os.getpid(), stats, provenance, samples
@@ -0,0 +1,157 @@
+"""
+This module contains an LRU cache of decoded audio shared by the benchmark items
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Callable, Hashable, Optional
+
+import numpy as np
+from loguru import logger
+
+from sound_merge.reader import SourceRef
+from sound_merge.segment import ArraySegment
+
+
+@dataclass
+class CacheStats:
+    """
+    Counters of a DecodedAudioCache. spill_hits are misses in memory served from disk.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    spill_hits: int = 0
+
+    def __add__(self, other: "CacheStats") -> "CacheStats":
+        return CacheStats(
+            *(getattr(self, f.name) + getattr(other, f.name) for f in fields(self))
+        )
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class DecodedAudioCache:
+    """
+    Cache of decoded audio keyed by (path, mtime, target format), bounded by max_bytes
+    of samples in memory with least-recently-used eviction.
+
+    With spill_dir every decoded file is also written there as .npz, so other processes
+    using the same spill_dir (e.g. pool workers) load it instead of decoding it again.
+    The spill directory is not bounded. Segments loaded from it keep the source position
+    they were decoded with, in the file they are requested for. The cache is thread-safe.
+    """
+
+    def __init__(self, max_bytes: int, spill_dir: Optional[Path] = None):
+        self.max_bytes = max_bytes
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        if self.spill_dir:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self.stats = CacheStats()
+        self._entries: OrderedDict[str, ArraySegment] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def _key(self, audio_file: Path, target: Hashable) -> str:
+        stat = os.stat(audio_file)
+        key = repr((str(Path(audio_file).resolve()), stat.st_mtime_ns, target))
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _load_spilled(self, key: str, audio_file: Path) -> Optional[ArraySegment]:
+        """
+        Loads a spilled segment, with its source position in audio_file if it had one
+        """
+        if self.spill_dir is None:
+            return None
+        try:
+            with np.load(self.spill_dir / f"{key}.npz") as data:
+                start_frame = int(data["start_frame"])
+                return ArraySegment(
+                    data["samples"],
+                    int(data["frame_rate"]),
+                    source=(
+                        SourceRef(Path(audio_file), start_frame)
+                        if start_frame >= 0
+                        else None
+                    ),
+                )
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _put(self, key: str, segment: ArraySegment, spill: bool):
+        if spill and self.spill_dir is not None:
+            tmp_path = (
+                self.spill_dir / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+            )
+            try:
+                with open(tmp_path, "wb") as file:
+                    np.savez(
+                        file,
+                        samples=segment.samples,
+                        frame_rate=segment.frame_rate,
+                        # the path is not stored, the key already identifies the file
+                        start_frame=(
+                            segment.source.start_frame if segment.source else -1
+                        ),
+                    )
+                os.replace(tmp_path, self.spill_dir / f"{key}.npz")
+            except OSError as e:
+                logger.warning(
+                    f"Could not spill decoded audio to {self.spill_dir}: {e}"
+                )
+
+        nbytes = segment.samples.nbytes
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = segment
+            self._size += nbytes
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.samples.nbytes
+                self.stats.evictions += 1
+
+    def get_or_load(
+        self,
+        audio_file: Path,
+        loader: Callable[[], ArraySegment],
+        target: Hashable = None,
+    ) -> ArraySegment:
+        """
+        Returns the cached decoded audio of the file, calls loader on a miss.
+        target identifies the decoded format, e.g. a (frame_rate, channels) tuple.
+        The returned samples are shared and must not be modified in place.
+        """
+        key = self._key(audio_file, target)
+        with self._lock:
+            segment = self._entries.get(key)
+            if segment is not None:
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return segment
+            self.stats.misses += 1
+
+        segment = self._load_spilled(key, audio_file)
+        if segment is not None:
+            with self._lock:
+                self.stats.spill_hits += 1
+            self._put(key, segment, spill=False)
+            return segment
+
+        segment = loader()
+        self._put(key, segment, spill=True)
+        return segment
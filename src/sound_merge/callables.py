@@ -5,10 +5,62 @@ This module contains callable classes that are used to generate audio segments
 from abc import ABC, abstractmethod
 from pathlib import Path
 import random
+from typing import NamedTuple, Optional, Sequence, Union
 
+from loguru import logger
 import numpy as np
 from pydub import AudioSegment  # type: ignore
 
+from sound_merge.augm import (
+    active_start_points,
+    apply_silence_mask,
+    random_silence_intervals,
+)
+from sound_merge.batch import source_power
+from sound_merge.cache import DecodedAudioCache
+from sound_merge.index import SourceIndex
+from sound_merge.loudness import LoudnessStore, find_store
+from sound_merge.probe import WAVE_FORMAT_PCM, AudioInfo, check_format, probe
+from sound_merge.profiling import audio_bytes, profile_method, stage
+from sound_merge.reader import (
+    MappedAudio,
+    SourceRef,
+    as_float32,
+    can_memmap,
+    read_segment,
+)
+from sound_merge.sampling import SourceSampler, Strata, Weight
+from sound_merge.segment import (
+    ArraySegment,
+    db_to_gain,
+    stack_segments,
+    sync_formats,
+    weighted_sum,
+)
+
+
+def _as_array_segments(audio_segments: list) -> list:
+    """
+    Converts the segments to ArraySegment, unless all of them are pydub AudioSegments
+    """
+    if all(isinstance(segment, AudioSegment) for segment in audio_segments):
+        return audio_segments
+    return [ArraySegment.from_audio(segment) for segment in audio_segments]
+
+
+def _from_source(
+    audio_segment: AudioSegment, audio_file: Path, start_frame: int = 0
+) -> ArraySegment:
+    """
+    Converts a segment read from audio_file at start_frame to an ArraySegment that
+    keeps its source position, so its provenance and gain are tracked
+    """
+    return ArraySegment(
+        as_float32(audio_segment),
+        audio_segment.frame_rate,
+        source=SourceRef(Path(audio_file), start_frame),
+    )
+
 
 # class GenAudioFile:
 #     """
@@ -56,27 +108,112 @@ from pydub import AudioSegment  # type: ignore
 #         return True
 
 
+class SourceGroup(NamedTuple):
+    """
+    Source directories that share one source slot of a mixture: every mixture takes
+    its file for the slot from one of them, chosen with probability proportional
+    to its weight
+    """
+
+    directories: tuple[Path, ...]
+    weights: tuple[float, ...]
+
+    def choose(self) -> Path:
+        return random.choices(self.directories, weights=self.weights)[0]
+
+
+def resolve_source(source: Union[Path, SourceGroup]) -> Path:
+    """
+    Returns the directory of a source slot, chooses one if it is a SourceGroup
+    """
+    return source.choose() if isinstance(source, SourceGroup) else source
+
+
+def flatten_sources(sources: Sequence[Union[Path, SourceGroup]]) -> list[Path]:
+    """
+    Lists all the directories of the source slots
+    """
+    directories: list[Path] = []
+    for source in sources:
+        if isinstance(source, SourceGroup):
+            directories.extend(source.directories)
+        else:
+            directories.append(source)
+    return directories
+
+
 class PipelineStep(ABC):
     """
     Base abstract class for a pipeline step.
+
+    __call__, plan and load of every subclass are wrapped by profiling.profile_method,
+    so their calls are timed as stages while profiling is enabled.
     """
 
+    _PROFILED_METHODS = {"__call__": "", "plan": ".plan", "load": ".load"}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name, suffix in cls._PROFILED_METHODS.items():
+            method = cls.__dict__.get(name)
+            if method is None or getattr(method, "__isabstractmethod__", False):
+                continue
+            setattr(cls, name, profile_method(method, suffix))
+
+    def provenance(self) -> dict:
+        """
+        Describes what the last call did, for the provenance manifest.
+        Steps whose choices are not visible on their output override it.
+        """
+        return {}
+
 
 class FileBasedPipelineStep(PipelineStep):
     """
     Abstract class for pipeline steps that operate on file paths.
+
+    A call can be split into plan, which makes all random choices, and load, which does
+    the I/O. Steps that implement the split can be prefetched from other threads while
+    staying deterministic, see pipeline.StreamingPipeline.
     """
 
     @abstractmethod
     def __call__(self, source_dirs: list[Path]) -> list[AudioSegment]:
         pass
 
+    def plan(self, source_dirs: list[Path]) -> list:
+        return source_dirs
+
+    def load(self, plan: list) -> list[AudioSegment]:
+        return self(plan)
+
+    def prepare(self, source_dirs: list) -> None:
+        """
+        Builds or refreshes what the step reads about the sources, once before the
+        items are generated (e.g. in the main process before the pool workers start),
+        so the workers only read it. Does nothing by default.
+        """
+
+    @classmethod
+    def splits_load(cls) -> bool:
+        """
+        True if the step overrides load, so load makes no random choices. The default
+        load runs the whole step and must stay in the thread that seeded it.
+        """
+        return cls.load is not FileBasedPipelineStep.load
+
 
 class SegmentBasedPipelineStep(PipelineStep):
     """
     Abstract class for pipeline steps that operate on AudioSegment objects.
+
+    The steps also accept MappedAudio and ArraySegment, which they process with NumPy.
+    Steps that mix the segments into the single output segment set mixes, a pipeline
+    must end with one of them.
     """
 
+    mixes = False
+
     @abstractmethod
     def __call__(self, audio_segments: list[AudioSegment]) -> list[AudioSegment]:
         pass
@@ -86,26 +223,353 @@ class PullAudioSegments(FileBasedPipelineStep):
     """
     A pipeline step that pulls an audio file from each directory.
 
-    Takes a list of directories and returns a list of audiosegments.
+    Takes a list of directories and returns a list of audiosegments. A SourceGroup
+    in the list is resolved to one of its directories first.
+
+    Files are chosen from a persistent SourceIndex of each directory, which is opened
+    once per directory and kept for subsequent calls. With use_index=False the directory
+    is walked on every call instead.
+
+    Files shorter than min_duration_s or not matching frame_rate/channels (if given) are
+    rejected from their header alone, before any audio data is read.
+
+    With memmap=True uncompressed WAV files are returned as zero-copy MappedAudio views.
+    Other files are decoded completely and returned as ArraySegments that keep their
+    source position, through the cache if one is given, so the provenance of a
+    segment does not depend on how it was read.
+
+    set_shard(i, n) restricts the choice to the i-th of n disjoint shards of the files
+    of every directory, e.g. one per data loader worker.
+
+    Files are chosen uniformly by default. weight, strata, quotas and replacement
+    choose them with a SourceSampler per directory instead, e.g. weight="duration"
+    to draw seconds of audio rather than files. Sampling requires the index.
     """
 
+    def __init__(
+        self,
+        use_index: bool = True,
+        refresh_index: bool = True,
+        min_duration_s: float = 0.0,
+        frame_rate: Optional[int] = None,
+        channels: Optional[int] = None,
+        memmap: bool = False,
+        cache: Optional[DecodedAudioCache] = None,
+        weight: Weight = "uniform",
+        strata: Optional[Strata] = None,
+        quotas: Optional[dict[str, float]] = None,
+        replacement: bool = True,
+    ):
+        self._sampling: Optional[dict] = None
+        if (weight, strata, quotas, replacement) != ("uniform", None, None, True):
+            if not use_index:
+                raise ValueError("Weighted or stratified sampling requires the index")
+            self._sampling = {
+                "weight": weight,
+                "strata": strata,
+                "quotas": quotas,
+                "replacement": replacement,
+            }
+        self._samplers: dict[Path, SourceSampler] = {}
+        self._memmap = memmap
+        self._cache = cache
+        self._use_index = use_index
+        self._refresh_index = refresh_index
+        self._min_duration_s = min_duration_s
+        self._frame_rate = frame_rate
+        self._channels = channels
+        self._indexes: dict[Path, SourceIndex] = {}
+        self._shard = (0, 1)
+
+    def set_shard(self, shard_index: int, num_shards: int):
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(f"Shard {shard_index} is out of range for {num_shards}")
+        self._shard = (shard_index, num_shards)
+        self._samplers = {}
+
     def __call__(self, source_dirs: list[Path]) -> list[AudioSegment]:
-        chosen_files = []
-        for directory in source_dirs:
-            paths = [
-                path
-                for path in directory.rglob("*")
-                if path.is_file()
-                and not path.name.startswith(".")
-                and self._check_file(path)
-            ]
-            if len(paths) == 0:
+        return self.load(self.plan(source_dirs))
+
+    def prepare(self, source_dirs: list) -> None:
+        """
+        Refreshes the indexes of all the directories of the sources
+        """
+        if self._use_index:
+            for directory in flatten_sources(source_dirs):
+                self._indexes[directory] = SourceIndex.open(directory)
+
+    def plan(self, source_dirs: list[Path]) -> list:
+        return self._choose_files(source_dirs)
+
+    def load(self, plan: list) -> list[AudioSegment]:
+        return [self._load(path, info) for path, info in plan]
+
+    def _load(self, audio_file: Path, info: Optional[AudioInfo] = None):
+        if self._memmap:
+            info = info or probe(audio_file)
+            if info is not None and can_memmap(info):
+                return MappedAudio.from_file(audio_file, info)
+        return self._decode(audio_file, info)
+
+    def _decode(
+        self, audio_file: Path, info: Optional[AudioInfo] = None
+    ) -> ArraySegment:
+        """
+        Decodes the whole file, through the cache if there is one. WAV files that can
+        be mapped are converted from the mapping in one pass instead of through pydub.
+        """
+
+        def decode() -> ArraySegment:
+            with stage("decode") as sample:
+                if info is not None and can_memmap(info):
+                    segment = ArraySegment.from_audio(
+                        MappedAudio.from_file(audio_file, info)
+                    )
+                else:
+                    segment = _from_source(
+                        AudioSegment.from_file(audio_file), audio_file
+                    )
+                sample.bytes_out = audio_bytes(segment)
+            return segment
+
+        if self._cache is None:
+            return decode()
+        return self._cache.get_or_load(audio_file, decode)
+
+    def _get_index(self, directory: Path) -> SourceIndex:
+        index = self._indexes.get(directory)
+        if index is None:
+            index = SourceIndex.open(directory, refresh=self._refresh_index)
+            self._indexes[directory] = index
+        return index
+
+    def _choose_files(
+        self, source_dirs: list[Path]
+    ) -> list[tuple[Path, Optional[AudioInfo]]]:
+        """
+        Chooses a file from each directory, returns the paths with the indexed
+        AudioInfo, or None if the directory was walked without the index
+        """
+        return [self._choose_file(resolve_source(source)) for source in source_dirs]
+
+    def _get_sampler(self, directory: Path) -> SourceSampler:
+        sampler = self._samplers.get(directory)
+        if sampler is None:
+            index = self._get_index(directory)
+            entries = index.filter(check_file=self._check_file)
+            if len(entries) == 0:
                 raise FileNotFoundError(f"No audio files found in: {directory}")
-            chosen_files.append(AudioSegment.from_file(random.choice(paths)))
-        return chosen_files
+            shard_index, num_shards = self._shard
+            entries = entries[shard_index::num_shards] or entries
+            sampler = SourceSampler(entries, **self._sampling)  # type: ignore
+            self._samplers[directory] = sampler
+        return sampler
+
+    def _choose_file(self, directory: Path) -> tuple[Path, Optional[AudioInfo]]:
+        if self._use_index:
+            index = self._get_index(directory)
+            if self._sampling is None:
+                entry = index.choice(shard=self._shard, check_file=self._check_file)
+            else:
+                entry = self._get_sampler(directory).draw()
+            return index.absolute(entry), entry.info
+        paths = [
+            path
+            for path in directory.rglob("*")
+            if path.is_file()
+            and not path.name.startswith(".")
+            and self._check_file(path)
+        ]
+        if len(paths) == 0:
+            raise FileNotFoundError(f"No audio files found in: {directory}")
+        shard_index, num_shards = self._shard
+        return random.choice(paths[shard_index::num_shards] or paths), None
 
-    def _check_file(self, audio_file: Path) -> bool:
-        return True
+    def _check_file(self, audio_file: Path, info: Optional[AudioInfo] = None) -> bool:
+        """
+        Checks the file format, info is read from the header if it is not known yet
+        """
+        if info is None:
+            info = probe(audio_file)
+        return info is not None and check_format(
+            info,
+            min_duration_s=self._min_duration_s,
+            frame_rate=self._frame_rate,
+            channels=self._channels,
+        )
+
+
+class PullRandomExcerpts(PullAudioSegments):
+    """
+    A pipeline step that pulls a random excerpt of len_s seconds from each directory.
+
+    Fuses PullAudioSegments and RandomSegment: the offset is chosen from the header
+    metadata and only that frame range is read from PCM WAV files, so memory and latency
+    do not depend on the length of the source file. Other containers are decoded
+    completely and then cut. Files shorter than len_s are returned whole.
+    With memmap=True the excerpts are views into the memory-mapped files.
+
+    With min_dBFS, excerpts quieter than it according to the LoudnessStore of the
+    directory are drawn again, up to max_tries times, without reading any audio.
+
+    With min_activity, the excerpt is drawn only among the ones of which at least that
+    fraction of the loudness_hop_s windows reach activity_dBFS, according to the
+    activity map of the file in the LoudnessStore. Files without such an excerpt are
+    drawn again, up to max_tries times.
+    When no draw meets them the last one is used, with a warning once per directory.
+    """
+
+    def __init__(
+        self,
+        len_s: float,
+        min_dBFS: Optional[float] = None,
+        loudness_hop_s: float = 1.0,
+        max_tries: int = 10,
+        min_activity: Optional[float] = None,
+        activity_dBFS: float = -50.0,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self._len_s = len_s
+        self._min_dBFS = min_dBFS
+        self._loudness_hop_s = loudness_hop_s
+        self._max_tries = max_tries
+        self._min_activity = min_activity
+        self._activity_dBFS = activity_dBFS
+        self._loudness: dict[Path, LoudnessStore] = {}
+        self._unmet: set[Path] = set()
+
+    def prepare(self, source_dirs: list) -> None:
+        """
+        Refreshes the indexes and, if excerpts are filtered by them, the loudness
+        stores of all the directories of the sources
+        """
+        super().prepare(source_dirs)
+        if self._min_dBFS is not None or self._min_activity is not None:
+            for directory in flatten_sources(source_dirs):
+                self._get_loudness(directory)
+
+    def _get_loudness(self, directory: Path) -> LoudnessStore:
+        store = self._loudness.get(directory)
+        if store is None:
+            store = LoudnessStore.open(
+                directory,
+                hop_s=self._loudness_hop_s,
+                index=self._get_index(directory) if self._use_index else None,
+            )
+            self._loudness[directory] = store
+        return store
+
+    def _start_frame(self, info: AudioInfo, position: float) -> int:
+        length_frames = int(self._len_s * info.frame_rate)
+        return int(position * (max(info.n_frames - length_frames, 0) + 1))
+
+    def _active_position(
+        self, directory: Path, audio_file: Path, info: Optional[AudioInfo]
+    ) -> Optional[float]:
+        """
+        Draws the position of an active excerpt, None if the file has none.
+        Without min_activity or an activity map any position is allowed.
+        """
+        if self._min_activity is None or info is None:
+            return random.random()
+        store = self._get_loudness(directory)
+        if audio_file not in store:
+            return random.random()
+        length_frames = int(self._len_s * info.frame_rate)
+        max_start = max(info.n_frames - length_frames, 0)
+        starts, hop_frames = store.active_starts(
+            audio_file,
+            length_frames,
+            max_start,
+            self._activity_dBFS,
+            self._min_activity,
+        )
+        if len(starts) == 0:
+            return None
+        start = min(
+            int(random.choice(starts)) + random.randrange(hop_frames), max_start
+        )
+        # the middle of the range of positions that _start_frame maps to start
+        return (start + 0.5) / (max_start + 1)
+
+    def _is_loud_enough(
+        self,
+        directory: Path,
+        audio_file: Path,
+        info: Optional[AudioInfo],
+        position: float,
+    ) -> bool:
+        if self._min_dBFS is None or info is None:
+            return True
+        store = self._get_loudness(directory)
+        if audio_file not in store:
+            return True
+        dBFS = store.window_dBFS(
+            audio_file,
+            self._start_frame(info, position),
+            int(self._len_s * info.frame_rate),
+        )
+        return dBFS >= self._min_dBFS
+
+    def plan(self, source_dirs: list[Path]) -> list:
+        """
+        Chooses the files and the relative position of each excerpt in [0, 1)
+        """
+        plan = []
+        for source in source_dirs:
+            directory = resolve_source(source)
+            for _ in range(self._max_tries):
+                path, info = self._choose_file(directory)
+                info = info or probe(path)
+                position = self._active_position(directory, path, info)
+                if position is None:
+                    position = random.random()
+                    continue
+                if self._is_loud_enough(directory, path, info, position):
+                    break
+            else:
+                self._warn_unmet(directory)
+            plan.append((path, info, position))
+        return plan
+
+    def _warn_unmet(self, directory: Path) -> None:
+        if directory in self._unmet:
+            return
+        self._unmet.add(directory)
+        logger.warning(
+            f"No excerpt of {directory} met min_dBFS/min_activity in "
+            f"{self._max_tries} tries, using the last one drawn"
+        )
+
+    def load(self, plan: list) -> list[AudioSegment]:
+        return [
+            self._pull_excerpt(path, info, position) for path, info, position in plan
+        ]
+
+    def _pull_excerpt(
+        self, audio_file: Path, info: Optional[AudioInfo], position: float
+    ) -> AudioSegment:
+        use_memmap = self._memmap and info is not None and can_memmap(info)
+        if info is None or not (use_memmap or info.format_tag == WAVE_FORMAT_PCM):
+            audio_segment = self._decode(audio_file, info)
+            length_ms = int(1000 * self._len_s)
+            if len(audio_segment) <= length_ms:
+                return audio_segment
+            start = int(position * (len(audio_segment) - length_ms + 1))
+            return audio_segment[start : start + length_ms]
+
+        length_frames = int(self._len_s * info.frame_rate)
+        start_frame = self._start_frame(info, position)
+        if use_memmap:
+            return MappedAudio.from_file(audio_file, info).get_frame_slice(
+                start_frame, start_frame + length_frames
+            )
+        return _from_source(
+            read_segment(audio_file, info, start_frame, length_frames),
+            audio_file,
+            start_frame,
+        )
 
 
 class RandomSegment(SegmentBasedPipelineStep):
@@ -127,18 +591,168 @@ class RandomSegment(SegmentBasedPipelineStep):
         return [self.random_segment(audio_segment) for audio_segment in audio_segments]
 
 
+class ToArraySegments(SegmentBasedPipelineStep):
+    """
+    A pipeline step that converts segments to float32 ArraySegments.
+
+    Place it after the pull step so the following steps work on NumPy arrays
+    instead of re-encoding pydub byte strings at every step.
+    """
+
+    def __call__(self, audio_segments: list[AudioSegment]) -> list[AudioSegment]:
+        return [ArraySegment.from_audio(segment) for segment in audio_segments]
+
+
+class RandomSilenceMask(SegmentBasedPipelineStep):
+    """
+    A pipeline step that masks every segment with random silence intervals,
+    see augm.random_silence_mask. All durations are in ms.
+
+    With activity_dBFS the intervals are placed over the active regions of every
+    segment, windows of activity_hop_ms that reach activity_dBFS.
+    """
+
+    def __init__(
+        self,
+        total_silence_ms: int,
+        silence_interval_ms: int,
+        fade_ms: int = 0,
+        activity_dBFS: Optional[float] = None,
+        activity_hop_ms: int = 50,
+    ):
+        self._total_silence_ms = total_silence_ms
+        self._silence_interval_ms = silence_interval_ms
+        self._fade_ms = fade_ms
+        self._activity_dBFS = activity_dBFS
+        self._activity_hop_ms = activity_hop_ms
+        self._start_points: list[list[int]] = []
+
+    def _candidates(self, audio_segment) -> Optional[np.ndarray]:
+        if self._activity_dBFS is None:
+            return None
+        return active_start_points(
+            audio_segment,
+            self._silence_interval_ms,
+            self._activity_dBFS,
+            self._activity_hop_ms,
+        )
+
+    def __call__(self, audio_segments: list[AudioSegment]) -> list[AudioSegment]:
+        self._start_points = [
+            random_silence_intervals(
+                len(audio_segment),
+                self._total_silence_ms,
+                self._silence_interval_ms,
+                candidates=self._candidates(audio_segment),
+            )
+            for audio_segment in audio_segments
+        ]
+        return [
+            apply_silence_mask(
+                audio_segment, start_points, self._silence_interval_ms, self._fade_ms
+            )
+            for audio_segment, start_points in zip(audio_segments, self._start_points)
+        ]
+
+    def provenance(self) -> dict:
+        return {
+            "silence_ms": [
+                [[start, start + self._silence_interval_ms] for start in start_points]
+                for start_points in self._start_points
+            ]
+        }
+
+
+class RecordSources(SegmentBasedPipelineStep):
+    """
+    A pipeline step that passes the segments through and records the source file,
+    start frame, frame count and accumulated gain of each of them for the provenance
+    manifest. Place it right before the mixing step. The start frame is in the frames
+    of the source file, also for segments that were resampled since.
+    """
+
+    def __init__(self):
+        self._sources: list[dict] = []
+
+    def __call__(self, audio_segments: list[AudioSegment]) -> list[AudioSegment]:
+        self._sources = [self._describe(segment) for segment in audio_segments]
+        return audio_segments
+
+    def _describe(self, audio_segment) -> dict:
+        source = getattr(audio_segment, "origin", None) or getattr(
+            audio_segment, "source", None
+        )
+        return {
+            "path": str(source.path) if source else None,
+            "start_frame": source.start_frame if source else None,
+            "n_frames": int(audio_segment.frame_count()),
+            "gain_db": float(getattr(audio_segment, "gain_db", 0.0)),
+        }
+
+    def provenance(self) -> dict:
+        return {"sources": self._sources}
+
+
+class HarmonizeSegments(SegmentBasedPipelineStep):
+    """
+    A pipeline step that converts every segment once to a common format.
+
+    Segments are resampled to frame_rate with a polyphase filter whose design is cached
+    per rate pair, and converted to the given channel count. They are returned as
+    float32 ArraySegments, or as AudioSegments with sample_width bytes per sample if
+    it is given. The following steps then mix without any per-overlay conversion.
+    """
+
+    def __init__(
+        self, frame_rate: int, channels: int = 1, sample_width: Optional[int] = None
+    ):
+        self._frame_rate = frame_rate
+        self._channels = channels
+        self._sample_width = sample_width
+
+    def __call__(self, audio_segments: list[AudioSegment]) -> list[AudioSegment]:
+        segments = [
+            ArraySegment.from_audio(segment)
+            .set_channels(self._channels)
+            .set_frame_rate(self._frame_rate)
+            for segment in audio_segments
+        ]
+        if self._sample_width is None:
+            return segments
+        return [
+            segment.to_audio_segment(sample_width=self._sample_width)
+            for segment in segments
+        ]
+
+
 class NormalizeSegments(SegmentBasedPipelineStep):
     """
     A pipeline step that normalizes an audio segment.
+
+    The level of segments that come from a file in one of the loudness stores is
+    looked up from its precomputed window levels instead of measured from the samples.
     """
 
-    def __init__(self, target_dBFS: float):
+    def __init__(self, target_dBFS: float, loudness: Sequence[LoudnessStore] = ()):
         self._target_dBFS = target_dBFS
+        self._loudness = loudness
+
+    def _dBFS(self, audio_segment) -> float:
+        source = getattr(audio_segment, "source", None)
+        store = find_store(self._loudness, source.path) if source else None
+        if store is None:
+            return audio_segment.dBFS
+        return (
+            store.window_dBFS(
+                source.path, source.start_frame, audio_segment.frame_count()
+            )
+            + audio_segment.gain_db
+        )
 
     def __call__(self, audio_segments: list[AudioSegment]) -> list[AudioSegment]:
         return [
-            audio_segment.apply_gain(self._target_dBFS - audio_segment.dBFS)
-            for audio_segment in audio_segments
+            audio_segment.apply_gain(self._target_dBFS - self._dBFS(audio_segment))
+            for audio_segment in _as_array_segments(audio_segments)
         ]
 
 
@@ -147,9 +761,12 @@ class MixSegments(SegmentBasedPipelineStep):
     A pipeline step that mixes audio segments.
     """
 
+    mixes = True
+
     def _calculate_db_loss(self, percent: float) -> float:
         """
-        Calculates the dB loss from the given percentage.
+        Calculates the dB loss of scaling the power to the given fraction, as the gain
+        in dB to apply, like benchmark.calculate_db_loss.
         """
         if not 0 <= percent <= 1:
             raise ValueError("Percent must be between 0 and 1.")
@@ -159,7 +776,7 @@ class MixSegments(SegmentBasedPipelineStep):
             )
         if percent == 1:
             return 0
-        return -10 * np.log10(percent)
+        return 10 * np.log10(percent)
 
     def _mix_w_coef(
         self,
@@ -171,16 +788,177 @@ class MixSegments(SegmentBasedPipelineStep):
         """
         Mixes two audio segments with given coefficients
         """
-        enh1 = audio_segment1 - self._calculate_db_loss(sc1)
-        enh2 = audio_segment2 - self._calculate_db_loss(sc2)
+        enh1 = audio_segment1 + self._calculate_db_loss(sc1)
+        enh2 = audio_segment2 + self._calculate_db_loss(sc2)
         mixed_segment = enh1.overlay(enh2)
 
         return mixed_segment
 
     def __call__(self, audio_segments: list[AudioSegment]) -> list[AudioSegment]:
+        audio_segments = _as_array_segments(audio_segments)
         mixed_segment = audio_segments[0]
         for segment in audio_segments[1:]:
             mixed_segment = self._mix_w_coef(
                 sc1=1, sc2=0.5, audio_segment1=mixed_segment, audio_segment2=segment
             )
-        return mixed_segment
+        return [mixed_segment]
+
+
+class WeightedMixSegments(SegmentBasedPipelineStep):
+    """
+    A pipeline step that mixes N audio segments in a single vectorized pass.
+
+    Every source gets its own gain from gains_db (0 dB for all if not given), unlike
+    MixSegments, which attenuates the accumulated mix again for every added source.
+    The sum goes through one peak limiter: if its peak exceeds peak_dBFS, the whole mix
+    is scaled down to it. The result has the length of the first segment.
+    Like AudioSegment.overlay, sources are converted to the highest frame rate and
+    channel count among them, put HarmonizeSegments before it to choose the format.
+    """
+
+    mixes = True
+
+    def __init__(
+        self, gains_db: Optional[Sequence[float]] = None, peak_dBFS: float = -1.0
+    ):
+        self._gains_db = gains_db
+        self._peak_dBFS = peak_dBFS
+        self._limiter_db = 0.0
+
+    def _gains(self, n_sources: int) -> np.ndarray:
+        if self._gains_db is None:
+            return np.ones(n_sources, dtype=np.float32)
+        if len(self._gains_db) != n_sources:
+            raise ValueError(
+                f"Expected {len(self._gains_db)} segments to mix, got {n_sources}"
+            )
+        return db_to_gain(np.asarray(self._gains_db, dtype=np.float32))
+
+    def __call__(self, audio_segments: list[AudioSegment]) -> list[AudioSegment]:
+        segments = sync_formats(
+            [ArraySegment.from_audio(segment) for segment in audio_segments]
+        )
+        return [self._limit(weighted_sum(segments, self._gains(len(segments))))]
+
+    def _limit(self, mixed: ArraySegment) -> ArraySegment:
+        """
+        Scales the mix down to peak_dBFS if its peak is above it
+        """
+        ceiling = db_to_gain(self._peak_dBFS)
+        peak = float(np.abs(mixed.samples).max()) if mixed.samples.size else 0.0
+        self._limiter_db = 0.0
+        if peak > ceiling:
+            mixed.samples *= np.float32(ceiling / peak)
+            self._limiter_db = float(20 * np.log10(ceiling / peak))
+        return mixed
+
+    def provenance(self) -> dict:
+        return {"limiter_db": self._limiter_db}
+
+
+class SNRMixSegments(WeightedMixSegments):
+    """
+    A pipeline step that mixes segments at a random signal-to-noise ratio.
+
+    The segment at position target (e.g. speech) is the signal and all the others
+    (e.g. music) the noise: for every mixture an SNR in dB is drawn, from a uniform
+    distribution between the two values of snr_db or a normal one with their mean and
+    standard deviation, or fixed if snr_db is a number. The noise sources get one common
+    gain that brings the power of the signal over their summed power to that SNR.
+    The powers of all sources are measured in one vectorized pass over the stacked
+    samples, which are then mixed directly. With active_only, only frames of frame_ms
+    within active_range_db of the loudest frame of each source are measured, so pauses
+    in speech do not count as quiet signal.
+
+    The SNR of the mix follows from the measured powers and gains and is recorded
+    without measuring the mix again. It is None if the signal or the noise is silent,
+    which is mixed without gains. The peak limiter of WeightedMixSegments scales the
+    whole mix and does not change the SNR.
+    """
+
+    def __init__(
+        self,
+        snr_db: Union[float, Sequence[float]] = (0.0, 20.0),
+        distribution: str = "uniform",
+        target: int = 0,
+        active_only: bool = False,
+        frame_ms: float = 20.0,
+        active_range_db: float = 40.0,
+        peak_dBFS: float = -1.0,
+    ):
+        super().__init__(peak_dBFS=peak_dBFS)
+        if distribution not in ("uniform", "normal"):
+            raise ValueError("Distribution type must be 'uniform' or 'normal'")
+        self._snr_db = snr_db
+        self._distribution = distribution
+        self._target = target
+        self._active_only = active_only
+        self._frame_ms = frame_ms
+        self._active_range_db = active_range_db
+        self._drawn_snr_db = 0.0
+        self._realized_snr_db: Optional[float] = None
+        self._snr_gains_db: list[float] = []
+
+    def draw_snr(self) -> float:
+        if isinstance(self._snr_db, (int, float)):
+            return float(self._snr_db)
+        first, second = self._snr_db
+        if self._distribution == "uniform":
+            return random.uniform(first, second)
+        return random.gauss(first, second)
+
+    def snr_gains_db(
+        self, powers: np.ndarray, snr_db: float
+    ) -> tuple[np.ndarray, Optional[float]]:
+        """
+        Gains in dB of every source for the SNR and the resulting SNR, from the powers
+        """
+        noise = np.arange(len(powers)) != self._target
+        signal_power, noise_power = powers[self._target], powers[noise].sum()
+        gains_db = np.zeros(len(powers))
+        if signal_power <= 0 or noise_power <= 0:
+            return gains_db, None
+        gains_db[noise] = 10 * np.log10(signal_power / noise_power) - snr_db
+        gains = np.square(db_to_gain(gains_db))
+        realized = (
+            signal_power * gains[self._target] / np.sum(powers[noise] * gains[noise])
+        )
+        return gains_db, float(10 * np.log10(realized))
+
+    def __call__(self, audio_segments: list[AudioSegment]) -> list[AudioSegment]:
+        if not 0 <= self._target < len(audio_segments):
+            raise ValueError(
+                f"Target {self._target} is out of range for "
+                f"{len(audio_segments)} segments"
+            )
+        segments = sync_formats(
+            [ArraySegment.from_audio(segment) for segment in audio_segments]
+        )
+        stacked = stack_segments(segments)
+        lengths = np.array(
+            [min(stacked.shape[1], segment.frame_count()) for segment in segments]
+        )
+        frame_length = int(self._frame_ms * segments[0].frame_rate / 1000)
+        powers = source_power(
+            stacked,
+            lengths,
+            frame_length=frame_length if self._active_only else 0,
+            active_range_db=self._active_range_db if self._active_only else None,
+        )
+        self._drawn_snr_db = self.draw_snr()
+        gains_db, self._realized_snr_db = self.snr_gains_db(powers, self._drawn_snr_db)
+        self._snr_gains_db = gains_db.tolist()
+
+        gains = db_to_gain(gains_db).astype(np.float32)
+        mixed = ArraySegment(
+            np.tensordot(gains, stacked, axes=1), segments[0].frame_rate
+        )
+        return [self._limit(mixed)]
+
+    def provenance(self) -> dict:
+        return {
+            **super().provenance(),
+            "snr_db": self._drawn_snr_db,
+            "realized_snr_db": self._realized_snr_db,
+            "snr_gains_db": self._snr_gains_db,
+        }
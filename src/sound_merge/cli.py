@@ -0,0 +1,92 @@
+"""
+Command line interface of soundmerge, benchmarks are described by a spec file
+(see benchmark.example.toml):
+
+    sound-merge validate benchmark.toml
+    sound-merge run benchmark.toml
+    sound-merge replay benchmark.toml --items 3 17
+
+The pipeline modules are only imported once the spec is valid.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Optional, Sequence
+
+from sound_merge.spec import SpecError, load_spec
+
+
+def _run(spec, args: argparse.Namespace):
+    from sound_merge.benchmark import produce_benchmark
+
+    spec.destination.mkdir(parents=True, exist_ok=True)
+    produce_benchmark(**spec.benchmark_kwargs())
+
+
+def _replay(spec, args: argparse.Namespace):
+    from sound_merge.benchmark import replay_benchmark
+    from sound_merge.manifest import MANIFEST_FILENAME
+
+    destination = args.destination or spec.destination / "replay"
+    destination.mkdir(parents=True, exist_ok=True)
+    replay_benchmark(
+        manifest_path=spec.destination / MANIFEST_FILENAME,
+        source_directories=spec.sources,
+        destination_directory=destination,
+        items=args.items,
+        check=not args.no_check,
+        pipeline=spec.pipeline,
+    )
+
+
+def _validate(spec, args: argparse.Namespace):
+    print(f"{args.spec}: OK, {spec.count} mixtures to {spec.destination}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="sound-merge", description="Generate audio mixture benchmarks"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="produce the benchmark of a spec")
+    run.set_defaults(handler=_run)
+
+    validate = commands.add_parser("validate", help="check a spec without running it")
+    validate.set_defaults(handler=_validate)
+
+    replay = commands.add_parser(
+        "replay", help="regenerate items of a benchmark from its manifest"
+    )
+    replay.add_argument("--items", type=int, nargs="+", help="all items by default")
+    replay.add_argument(
+        "--destination",
+        type=Path,
+        help="directory of the regenerated files, <output>/replay by default",
+    )
+    replay.add_argument(
+        "--no-check",
+        action="store_true",
+        help="write items even if their sources differ from the manifest",
+    )
+    replay.set_defaults(handler=_replay)
+
+    for command in (run, validate, replay):
+        command.add_argument("spec", type=Path, help="TOML or YAML spec file")
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        spec = load_spec(args.spec)
+    except SpecError as e:
+        print(e, file=sys.stderr)
+        return 2
+    args.handler(spec, args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+This module wraps the pipeline steps as a PyTorch IterableDataset, so training can
+consume fresh mixtures without writing them to disk
+"""
+
+import itertools
+import random
+from pathlib import Path
+from typing import Iterator, Optional, Sequence
+
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+
+from sound_merge.batch import stack_sources
+from sound_merge.benchmark import item_seed
+from sound_merge.callables import (
+    FileBasedPipelineStep,
+    SegmentBasedPipelineStep,
+    WeightedMixSegments,
+)
+from sound_merge.segment import ArraySegment
+
+
+class MixtureDataset(IterableDataset):
+    """
+    Yields (mixture, stems) float32 tensors of shape [channels, frames] and
+    [sources, channels, frames], generated on the fly.
+
+    Every item pulls the sources with file_step, runs segment_steps on them (they must
+    leave the sources in one format, e.g. end with HarmonizeSegments) and mixes them with
+    mix_step. The stems are the sources as they enter mix_step, cut or padded to the
+    length of the mixture.
+
+    Data loader workers and distributed ranks (rank, world_size) take every n-th item,
+    and file steps that support set_shard only pull files from their own shard of the
+    sources. Item i is generated with the random module seeded from (seed, i), like the
+    items of produce_benchmark, so the stream is reproducible for a given seed and
+    number of workers. With n_items=None the stream is infinite.
+    """
+
+    def __init__(
+        self,
+        source_dirs: Sequence[Path],
+        file_step: FileBasedPipelineStep,
+        segment_steps: Sequence[SegmentBasedPipelineStep] = (),
+        mix_step: Optional[SegmentBasedPipelineStep] = None,
+        seed: int = 0,
+        n_items: Optional[int] = None,
+        shard_sources: bool = True,
+        rank: int = 0,
+        world_size: int = 1,
+    ):
+        super().__init__()
+        self._source_dirs = list(source_dirs)
+        self._file_step = file_step
+        self._segment_steps = segment_steps
+        self._mix_step = mix_step or WeightedMixSegments()
+        self._seed = seed
+        self._n_items = n_items
+        self._shard_sources = shard_sources
+        self._rank = rank
+        self._world_size = world_size
+
+    def _worker(self) -> tuple[int, int]:
+        """
+        Index and count of the readers of this dataset over all ranks and workers
+        """
+        worker_info = get_worker_info()
+        worker_id, num_workers = (
+            (worker_info.id, worker_info.num_workers) if worker_info else (0, 1)
+        )
+        return self._rank * num_workers + worker_id, self._world_size * num_workers
+
+    def make_item(self, item: int) -> tuple[torch.Tensor, torch.Tensor]:
+        random.seed(item_seed(self._seed, item))
+        stems = self._file_step(self._source_dirs)
+        for step in self._segment_steps:
+            stems = step(stems)
+        [mixture] = self._mix_step(stems)
+        mixture = ArraySegment.from_audio(mixture)
+        sources, _, _ = stack_sources([stems], n_frames=mixture.frame_count())
+        return (
+            torch.from_numpy(np.ascontiguousarray(mixture.samples.T)),
+            torch.from_numpy(np.ascontiguousarray(sources[0].transpose(0, 2, 1))),
+        )
+
+    def __iter__(self) -> Iterator[tuple[torch.Tensor, torch.Tensor]]:
+        worker, num_workers = self._worker()
+        if self._shard_sources and hasattr(self._file_step, "set_shard"):
+            self._file_step.set_shard(worker, num_workers)
+        items = (
+            itertools.count(worker, num_workers)
+            if self._n_items is None
+            else range(worker, self._n_items, num_workers)
+        )
+        for item in items:
+            yield self.make_item(item)
@@ -0,0 +1,280 @@
+"""
+This module contains a persistent on-disk index of the audio files in a source directory
+"""
+
+import json
+import os
+import random
+from dataclasses import astuple, dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from loguru import logger
+
+from sound_merge.probe import AudioInfo, check_format, probe
+
+INDEX_FILENAME = ".sound_merge_index.json"
+INDEX_VERSION = 2
+
+
+@dataclass(frozen=True)
+class IndexEntry:
+    """
+    Metadata of one audio file in the index. The path is relative to the indexed directory.
+    """
+
+    path: str
+    size: int
+    mtime_ns: int
+    frame_rate: int
+    channels: int
+    sample_width: int
+    n_frames: int
+    format_tag: int
+    data_offset: Optional[int]
+
+    @property
+    def duration_s(self) -> float:
+        return self.info.duration_s
+
+    @property
+    def info(self) -> AudioInfo:
+        return AudioInfo(
+            frame_rate=self.frame_rate,
+            channels=self.channels,
+            sample_width=self.sample_width,
+            n_frames=self.n_frames,
+            format_tag=self.format_tag,
+            data_offset=self.data_offset,
+        )
+
+
+def probe_entry(
+    audio_file: Path, relative_path: str, stat: os.stat_result
+) -> Optional[IndexEntry]:
+    """
+    Reads the header of the audio file, returns None if it is not an audio file
+    """
+    info = probe(audio_file)
+    if info is None:
+        return None
+    return IndexEntry(
+        path=relative_path,
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        frame_rate=info.frame_rate,
+        channels=info.channels,
+        sample_width=info.sample_width,
+        n_frames=info.n_frames,
+        format_tag=info.format_tag,
+        data_offset=info.data_offset,
+    )
+
+
+def _walk_files(directory: Path):
+    """
+    Yields (relative path, absolute path, stat) of the visible files below the directory.
+    Like Path.rglob, symlinked directories are not followed, so links cannot form cycles.
+    Subdirectories that cannot be read are skipped with a warning.
+    """
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = list(it)
+        except OSError as e:
+            if current == directory:
+                raise
+            logger.warning(f"Skipping unreadable directory {current}: {e}")
+            continue
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(Path(entry.path))
+            elif entry.is_file(follow_symlinks=True):
+                path = Path(entry.path)
+                yield path.relative_to(directory).as_posix(), path, entry.stat()
+
+
+class SourceIndex:
+    """
+    Persistent index of the audio files in a source directory.
+
+    The index is stored as JSON next to the audio files (or at index_path) and is refreshed
+    incrementally: only files whose size or mtime changed since the last refresh are probed.
+    """
+
+    def __init__(self, directory: Path, index_path: Optional[Path] = None):
+        self.directory = Path(directory)
+        self.index_path = (
+            Path(index_path) if index_path else self.directory / INDEX_FILENAME
+        )
+        self._entries: dict[str, IndexEntry] = {}
+        # files that are not audio, kept with (size, mtime_ns) so they are not probed again
+        self._skipped: dict[str, tuple[int, int]] = {}
+        self._sorted: Optional[list[IndexEntry]] = None
+        self._filtered: dict[tuple, list[IndexEntry]] = {}
+
+    @classmethod
+    def open(
+        cls,
+        directory: Path,
+        index_path: Optional[Path] = None,
+        refresh: bool = True,
+    ) -> "SourceIndex":
+        """
+        Loads the index of the directory, refreshes it and saves it if anything changed
+        """
+        index = cls(directory, index_path=index_path)
+        loaded = index.load()
+        changed = index.refresh() if refresh or not loaded else False
+        if changed or not loaded:
+            index.save()
+        return index
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def entries(self) -> list[IndexEntry]:
+        """
+        All indexed entries sorted by path
+        """
+        if self._sorted is None:
+            self._sorted = sorted(self._entries.values(), key=lambda entry: entry.path)
+        return self._sorted
+
+    def absolute(self, entry: IndexEntry) -> Path:
+        """
+        Returns the absolute path of the entry
+        """
+        return self.directory / entry.path
+
+    def load(self) -> bool:
+        """
+        Loads the index from disk, returns False if there is no valid index file
+        """
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return False
+        if data.get("version") != INDEX_VERSION:
+            return False
+        self._set_entries(
+            {row[0]: IndexEntry(*row) for row in data["entries"]},
+            {path: tuple(value) for path, value in data["skipped"].items()},
+        )
+        return True
+
+    def save(self):
+        """
+        Atomically writes the index to disk
+        """
+        data = {
+            "version": INDEX_VERSION,
+            "entries": [astuple(entry) for entry in self.entries],
+            "skipped": self._skipped,
+        }
+        tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(data, file, separators=(",", ":"))
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.warning(f"Could not save index to {self.index_path}: {e}")
+
+    def refresh(self) -> bool:
+        """
+        Walks the directory and probes new or modified files, returns True if the index changed
+        """
+        entries: dict[str, IndexEntry] = {}
+        skipped: dict[str, tuple[int, int]] = {}
+        probed = 0
+        for relative_path, path, stat in _walk_files(self.directory):
+            signature = (stat.st_size, stat.st_mtime_ns)
+            known = self._entries.get(relative_path)
+            if known is not None and (known.size, known.mtime_ns) == signature:
+                entries[relative_path] = known
+                continue
+            if self._skipped.get(relative_path) == signature:
+                skipped[relative_path] = signature
+                continue
+            probed += 1
+            entry = probe_entry(path, relative_path, stat)
+            if entry is None:
+                skipped[relative_path] = signature
+            else:
+                entries[relative_path] = entry
+
+        changed = (
+            probed > 0
+            or entries.keys() != self._entries.keys()
+            or skipped.keys() != self._skipped.keys()
+        )
+        if changed:
+            logger.info(
+                f"Refreshed index of {self.directory}: {len(entries)} files, {probed} probed"
+            )
+            self._set_entries(entries, skipped)
+        return changed
+
+    def update(self, entries: list[IndexEntry]):
+        """
+        Adds or replaces entries whose metadata is already known, e.g. of files that were
+        just written, so the next refresh does not probe them
+        """
+        updated = dict(self._entries)
+        skipped = dict(self._skipped)
+        for entry in entries:
+            updated[entry.path] = entry
+            skipped.pop(entry.path, None)
+        self._set_entries(updated, skipped)
+
+    def filter(
+        self,
+        min_duration_s: float = 0.0,
+        frame_rate: Optional[int] = None,
+        channels: Optional[int] = None,
+        check_file: Optional[Callable[[Path, AudioInfo], bool]] = None,
+    ) -> list[IndexEntry]:
+        """
+        Returns the entries that pass check_format and check_file, which is called with the
+        absolute path and the indexed AudioInfo, so no file has to be opened.
+        The result is cached, so repeated calls with the same arguments are O(1).
+        """
+        key = (min_duration_s, frame_rate, channels, check_file)
+        filtered = self._filtered.get(key)
+        if filtered is None:
+            filtered = [
+                entry
+                for entry in self.entries
+                if check_format(entry.info, min_duration_s, frame_rate, channels)
+                and (check_file is None or check_file(self.absolute(entry), entry.info))
+            ]
+            self._filtered[key] = filtered
+        return filtered
+
+    def choice(self, shard: tuple[int, int] = (0, 1), **filter_kwargs) -> IndexEntry:
+        """
+        Chooses a random entry among the ones that pass the filter.
+        shard=(i, n) restricts the choice to every n-th of them starting at the i-th,
+        so n workers draw from disjoint files. Empty shards use all the entries.
+        """
+        entries = self.filter(**filter_kwargs)
+        if len(entries) == 0:
+            raise FileNotFoundError(f"No audio files found in: {self.directory}")
+        positions = range(shard[0], len(entries), shard[1])
+        if len(positions) == 0:
+            positions = range(len(entries))
+        return entries[random.choice(positions)]
+
+    def _set_entries(
+        self, entries: dict[str, IndexEntry], skipped: dict[str, tuple[int, int]]
+    ):
+        self._entries = entries
+        self._skipped = skipped
+        self._sorted = None
+        self._filtered = {}
@@ -0,0 +1,284 @@
+"""
+This module copies audio datasets into source directories. Files are copied by a thread
+pool, optionally converted to a target WAV format, journaled so an interrupted
+ingestion resumes where it stopped, and indexed as they are written.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import astuple, dataclass, fields
+from pathlib import Path
+from typing import Iterable, Optional
+
+from loguru import logger
+from pydub import AudioSegment  # type: ignore
+
+from sound_merge.index import IndexEntry, SourceIndex, _walk_files, probe_entry
+from sound_merge.probe import WAVE_FORMAT_PCM, AudioInfo, probe
+from sound_merge.reader import read_segment
+from sound_merge.segment import ArraySegment
+
+JOURNAL_FILENAME = ".sound_merge_ingest.jsonl"
+
+
+@dataclass(frozen=True)
+class TargetFormat:
+    """
+    WAV format of the ingested files, None keeps the format of the source
+    """
+
+    frame_rate: Optional[int] = None
+    channels: Optional[int] = None
+    sample_width: Optional[int] = None
+
+    def matches(self, info: AudioInfo) -> bool:
+        return (
+            info.format_tag == WAVE_FORMAT_PCM
+            and self.frame_rate in (None, info.frame_rate)
+            and self.channels in (None, info.channels)
+            and self.sample_width in (None, info.sample_width)
+        )
+
+
+@dataclass
+class IngestStats:
+    """
+    Counters of an ingestion. skipped are files that were already in place.
+    """
+
+    copied: int = 0
+    converted: int = 0
+    skipped: int = 0
+    failed: int = 0
+
+    def __add__(self, other: "IngestStats") -> "IngestStats":
+        return IngestStats(
+            *(getattr(self, f.name) + getattr(other, f.name) for f in fields(self))
+        )
+
+
+class IngestJournal:
+    """
+    Append-only record of the ingested files of a destination directory. Every line
+    holds the source path, its size and mtime and the index entry of the written file,
+    and is flushed at once, so it survives an interruption. Thread-safe.
+    """
+
+    def __init__(self, journal_path: Path):
+        self.journal_path = Path(journal_path)
+        self._done: dict[str, dict] = {}
+        try:
+            with open(self.journal_path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        # the last line of an interrupted run can be cut off
+                        continue
+                    self._done[row["src"]] = row
+        except OSError:
+            pass
+        self._file = open(self.journal_path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def get(self, src_path: Path) -> Optional[dict]:
+        return self._done.get(str(src_path))
+
+    def record(self, src_path: Path, src_stat: os.stat_result, entry: IndexEntry):
+        row = {
+            "src": str(src_path),
+            "size": src_stat.st_size,
+            "mtime_ns": src_stat.st_mtime_ns,
+            "entry": astuple(entry),
+        }
+        with self._lock:
+            self._done[row["src"]] = row
+            self._file.write(json.dumps(row, separators=(",", ":")) + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> "IngestJournal":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def file_digest(path: Path) -> str:
+    with open(path, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def same_file(src_path: Path, dest_path: Path, check_hash: bool = False) -> bool:
+    """
+    Checks if dest_path is a copy of src_path: same size and mtime (copies keep the
+    mtime), or same size and content with check_hash
+    """
+    try:
+        src_stat, dest_stat = os.stat(src_path), os.stat(dest_path)
+    except OSError:
+        return False
+    if src_stat.st_size != dest_stat.st_size:
+        return False
+    if check_hash:
+        return file_digest(src_path) == file_digest(dest_path)
+    return src_stat.st_mtime_ns == dest_stat.st_mtime_ns
+
+
+def convert_file(
+    src_path: Path, dest_path: Path, target: TargetFormat, info: Optional[AudioInfo]
+):
+    """
+    Decodes src_path and writes it to dest_path as a PCM WAV file in the target format
+    """
+    if info is not None and info.format_tag == WAVE_FORMAT_PCM and info.is_seekable:
+        audio_segment = read_segment(src_path, info)
+    else:
+        audio_segment = AudioSegment.from_file(src_path)
+    segment = ArraySegment.from_audio(audio_segment)
+    if target.frame_rate is not None:
+        segment = segment.set_frame_rate(target.frame_rate)
+    if target.channels is not None:
+        segment = segment.set_channels(target.channels)
+    sample_width = target.sample_width or (info.sample_width if info else 0) or 2
+    segment.to_audio_segment(sample_width).export(dest_path, format="wav")
+
+
+def _journaled(
+    row: Optional[dict], src_stat: os.stat_result, dest_path: Path
+) -> Optional[IndexEntry]:
+    """
+    Returns the entry of a journaled file if neither the source nor the copy changed
+    """
+    if row is None or (row["size"], row["mtime_ns"]) != (
+        src_stat.st_size,
+        src_stat.st_mtime_ns,
+    ):
+        return None
+    entry = IndexEntry(*row["entry"])
+    try:
+        dest_stat = os.stat(dest_path)
+    except OSError:
+        return None
+    if (dest_stat.st_size, dest_stat.st_mtime_ns) != (entry.size, entry.mtime_ns):
+        return None
+    return entry
+
+
+class Ingestor:
+    """
+    Copies the audio files below source directories into dest_dir, all into dest_dir
+    itself like the original dataset scripts, so file names must be unique.
+
+    Files already in place are skipped: files in the journal whose source and copy
+    did not change, and copies with the size and mtime (or content with check_hash)
+    of their source. With a target format, files in another format are converted
+    to it instead of copied, e.g. to bring a dataset to a common frame rate.
+    The index of dest_dir is updated with the written files, so it needs no probing.
+    """
+
+    def __init__(
+        self,
+        dest_dir: Path,
+        suffixes: Iterable[str] = (".wav",),
+        target: Optional[TargetFormat] = None,
+        workers: int = 8,
+        check_hash: bool = False,
+    ):
+        self.dest_dir = Path(dest_dir)
+        self.suffixes = {suffix.lower() for suffix in suffixes}
+        self.target = target
+        self.workers = workers
+        self.check_hash = check_hash
+
+    def _dest_name(self, src_path: Path) -> str:
+        return src_path.with_suffix(".wav").name if self.target else src_path.name
+
+    def _ingest_file(
+        self, journal: IngestJournal, src_path: Path, src_stat: os.stat_result
+    ) -> tuple[str, Optional[IndexEntry]]:
+        dest_path = self.dest_dir / self._dest_name(src_path)
+        entry = _journaled(journal.get(src_path), src_stat, dest_path)
+        if entry is not None:
+            return "skipped", entry
+
+        info = probe(src_path)
+        convert = self.target is not None and (
+            info is None or not self.target.matches(info)
+        )
+        if not convert and same_file(src_path, dest_path, self.check_hash):
+            outcome = "skipped"
+        else:
+            # written next to the copy under a hidden name, so an interrupted copy is
+            # neither indexed nor mistaken for a finished one
+            tmp_path = dest_path.with_name(f".{dest_path.name}.tmp")
+            if convert:
+                convert_file(src_path, tmp_path, self.target, info)  # type: ignore
+                outcome = "converted"
+            else:
+                shutil.copy2(src_path, tmp_path)
+                outcome = "copied"
+            os.replace(tmp_path, dest_path)
+
+        entry = probe_entry(dest_path, dest_path.name, os.stat(dest_path))
+        if entry is None:
+            raise ValueError(f"{dest_path} is not an audio file")
+        journal.record(src_path, src_stat, entry)
+        return outcome, entry
+
+    def _source_files(self, src_dirs: Iterable[Path]):
+        """
+        Yields (path, stat) of the files to ingest, the first of each destination name
+        """
+        names: dict[str, Path] = {}
+        for src_dir in src_dirs:
+            files = sorted(_walk_files(Path(src_dir)), key=lambda file: file[0])
+            for _, path, stat in files:
+                if path.suffix.lower() not in self.suffixes:
+                    continue
+                name = self._dest_name(path)
+                if name in names:
+                    logger.warning(f"Skipping {path}: {names[name]} has the same name")
+                    continue
+                names[name] = path
+                yield path, stat
+
+    def __call__(self, src_dirs: Iterable[Path]) -> IngestStats:
+        """
+        Ingests the files of src_dirs, returns the counters of the run
+        """
+        self.dest_dir.mkdir(parents=True, exist_ok=True)
+        stats = IngestStats()
+        entries = []
+        with IngestJournal(self.dest_dir / JOURNAL_FILENAME) as journal:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {
+                    executor.submit(self._ingest_file, journal, path, stat): path
+                    for path, stat in self._source_files(src_dirs)
+                }
+                for future, path in futures.items():
+                    try:
+                        outcome, entry = future.result()
+                    except Exception as e:
+                        logger.warning(f"Could not ingest {path}: {e}")
+                        stats.failed += 1
+                        continue
+                    setattr(stats, outcome, getattr(stats, outcome) + 1)
+                    entries.append(entry)
+
+        index = SourceIndex(self.dest_dir)
+        index.load()
+        index.update(entries)
+        index.save()
+        logger.info(
+            f"Ingested into {self.dest_dir}: {stats.copied} copied, "
+            f"{stats.converted} converted, {stats.skipped} skipped, "
+            f"{stats.failed} failed"
+        )
+        return stats
@@ -0,0 +1,322 @@
+"""
+This module contains a precomputed store of loudness statistics of the source files, so
+percentiles, normalization gains and silence checks are lookups instead of full decodes
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+from loguru import logger
+from pydub import AudioSegment  # type: ignore
+
+from sound_merge.index import IndexEntry, SourceIndex
+from sound_merge.reader import MappedAudio, as_float32, can_memmap
+
+LOUDNESS_FILENAME = ".sound_merge_loudness.npz"
+
+# frames read at once when measuring a memory-mapped file
+_BLOCK_FRAMES = 1 << 20
+
+
+def power_to_dBFS(power: float) -> float:
+    """
+    Converts a mean square sample value into dBFS
+    """
+    if power <= 0:
+        return -float("inf")
+    return 10 * float(np.log10(power))
+
+
+def window_powers(samples: np.ndarray, hop_frames: int) -> np.ndarray:
+    """
+    Mean square of every hop_frames window of a float [frames, channels] array,
+    the last window may be shorter
+    """
+    n_frames = samples.shape[0]
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    squares = np.square(samples, dtype=np.float64).mean(axis=1)
+    sums = np.add.reduceat(squares, np.arange(0, n_frames, hop_frames))
+    counts = np.minimum(hop_frames, n_frames - np.arange(0, n_frames, hop_frames))
+    return (sums / counts).astype(np.float32)
+
+
+def activity_map(powers: np.ndarray, threshold_dBFS: float) -> np.ndarray:
+    """
+    Marks the windows whose level reaches threshold_dBFS as active
+    """
+    return powers >= 10 ** (threshold_dBFS / 10)
+
+
+def active_windows(active: np.ndarray, n_windows: int, min_activity: float):
+    """
+    Indexes of the first windows of the runs of n_windows windows of which at least
+    min_activity are active, from one cumulative sum
+    """
+    n_windows = min(max(n_windows, 1), len(active))
+    if n_windows == 0:
+        return np.zeros(0, dtype=np.int64)
+    counts = np.concatenate([[0], np.cumsum(active, dtype=np.int64)])
+    fractions = (counts[n_windows:] - counts[:-n_windows]) / n_windows
+    return np.flatnonzero(fractions >= min_activity)
+
+
+def measure_file(
+    audio_file: Path, entry: IndexEntry, hop_s: float
+) -> tuple[np.ndarray, int, int]:
+    """
+    Measures the window powers of a file, memory-mapped files are read block by block.
+    Returns the powers, the window length and the number of frames.
+    """
+    hop_frames = max(int(hop_s * entry.frame_rate), 1)
+    info = entry.info
+    if can_memmap(info):
+        mapped = MappedAudio.from_file(audio_file, info)
+        block = max(_BLOCK_FRAMES // hop_frames, 1) * hop_frames
+        powers = [
+            window_powers(
+                mapped.get_frame_slice(start, start + block).to_float32(), hop_frames
+            )
+            for start in range(0, mapped.frame_count(), block)
+        ]
+        n_frames = mapped.frame_count()
+    else:
+        audio_segment = AudioSegment.from_file(audio_file)
+        hop_frames = max(int(hop_s * audio_segment.frame_rate), 1)
+        powers = [window_powers(as_float32(audio_segment), hop_frames)]
+        n_frames = int(audio_segment.frame_count())
+    return (
+        np.concatenate(powers) if powers else np.zeros(0, np.float32),
+        hop_frames,
+        n_frames,
+    )
+
+
+class LoudnessStore:
+    """
+    Per-file and per-window (hop_s) mean square levels of the files of a SourceIndex,
+    stored as a compact .npz sidecar next to the index.
+
+    The store is refreshed incrementally: only files whose size or mtime changed in the
+    index are measured again.
+    """
+
+    def __init__(
+        self,
+        index: SourceIndex,
+        hop_s: float = 1.0,
+        store_path: Optional[Path] = None,
+    ):
+        self.index = index
+        self.hop_s = hop_s
+        self.store_path = (
+            Path(store_path) if store_path else index.directory / LOUDNESS_FILENAME
+        )
+        # relative path -> (size, mtime_ns, file power, hop frames, window powers)
+        self._rows: dict[str, tuple[int, int, float, int, np.ndarray]] = {}
+
+    @classmethod
+    def open(
+        cls,
+        directory: Path,
+        hop_s: float = 1.0,
+        index: Optional[SourceIndex] = None,
+    ) -> "LoudnessStore":
+        """
+        Loads the store of the directory and measures new or modified files
+        """
+        store = cls(index or SourceIndex.open(directory), hop_s=hop_s)
+        store.load()
+        if store.refresh():
+            store.save()
+        return store
+
+    def __contains__(self, audio_file: Path) -> bool:
+        return self._relative(audio_file) in self._rows
+
+    def _relative(self, audio_file: Path) -> str:
+        try:
+            return Path(audio_file).relative_to(self.index.directory).as_posix()
+        except ValueError:
+            return ""
+
+    def load(self) -> bool:
+        """
+        Loads the store from disk, returns False if there is no valid store file
+        """
+        try:
+            with np.load(self.store_path) as data:
+                if float(data["hop_s"]) != self.hop_s:
+                    return False
+                offsets = data["offsets"]
+                windows = data["window_power"]
+                self._rows = {
+                    str(path): (
+                        int(size),
+                        int(mtime_ns),
+                        float(power),
+                        int(hop_frames),
+                        windows[offsets[i] : offsets[i + 1]],
+                    )
+                    for i, (path, size, mtime_ns, power, hop_frames) in enumerate(
+                        zip(
+                            data["paths"],
+                            data["sizes"],
+                            data["mtimes_ns"],
+                            data["file_power"],
+                            data["hop_frames"],
+                        )
+                    )
+                }
+        except (OSError, KeyError, ValueError):
+            return False
+        return True
+
+    def save(self):
+        """
+        Writes the store as arrays, the window powers of all files are concatenated
+        """
+        rows = sorted(self._rows.items())
+        lengths = [len(row[4]) for _, row in rows]
+        # unique per process and thread, so concurrent saves do not write one file
+        tmp_path = self.store_path.with_name(
+            f"{self.store_path.name}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        )
+        try:
+            np.savez(
+                tmp_path,
+                hop_s=self.hop_s,
+                paths=np.array([path for path, _ in rows], dtype=str),
+                sizes=np.array([row[0] for _, row in rows], dtype=np.int64),
+                mtimes_ns=np.array([row[1] for _, row in rows], dtype=np.int64),
+                file_power=np.array([row[2] for _, row in rows], dtype=np.float64),
+                hop_frames=np.array([row[3] for _, row in rows], dtype=np.int64),
+                offsets=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+                window_power=(
+                    np.concatenate([row[4] for _, row in rows])
+                    if rows
+                    else np.zeros(0, np.float32)
+                ),
+            )
+            os.replace(tmp_path, self.store_path)
+        except OSError as e:
+            logger.warning(f"Could not save loudness store to {self.store_path}: {e}")
+
+    def refresh(self) -> bool:
+        """
+        Measures the indexed files that are new or modified, returns True if anything changed
+        """
+        rows = {}
+        measured = 0
+        for entry in self.index.entries:
+            row = self._rows.get(entry.path)
+            if row is not None and row[:2] == (entry.size, entry.mtime_ns):
+                rows[entry.path] = row
+                continue
+            powers, hop_frames, n_frames = measure_file(
+                self.index.absolute(entry), entry, self.hop_s
+            )
+            weights = np.minimum(
+                hop_frames, n_frames - hop_frames * np.arange(len(powers))
+            )
+            file_power = (
+                float(np.average(powers, weights=weights)) if len(powers) else 0.0
+            )
+            rows[entry.path] = (
+                entry.size,
+                entry.mtime_ns,
+                file_power,
+                hop_frames,
+                powers,
+            )
+            measured += 1
+
+        changed = measured > 0 or rows.keys() != self._rows.keys()
+        if changed:
+            logger.info(
+                f"Refreshed loudness of {self.index.directory}: {measured} files measured"
+            )
+        self._rows = rows
+        return changed
+
+    def file_dBFS(self, audio_file: Path) -> float:
+        """
+        dBFS of the whole file
+        """
+        return power_to_dBFS(self._rows[self._relative(audio_file)][2])
+
+    def window_dBFS(self, audio_file: Path, start_frame: int, n_frames: int) -> float:
+        """
+        Estimated dBFS of a frame range, from the windows it overlaps weighted by overlap
+        """
+        _, _, _, hop_frames, powers = self._rows[self._relative(audio_file)]
+        end_frame = start_frame + max(n_frames, 1)
+        first = start_frame // hop_frames
+        last = min(-(-end_frame // hop_frames), len(powers))
+        if first >= last:
+            return -float("inf")
+        starts = np.arange(first, last) * hop_frames
+        overlap = np.minimum(starts + hop_frames, end_frame) - np.maximum(
+            starts, start_frame
+        )
+        return power_to_dBFS(float(np.average(powers[first:last], weights=overlap)))
+
+    def activity(self, audio_file: Path, threshold_dBFS: float) -> np.ndarray:
+        """
+        Activity map of a file: whether each window of hop_s reaches threshold_dBFS
+        """
+        return activity_map(self._rows[self._relative(audio_file)][4], threshold_dBFS)
+
+    def active_starts(
+        self,
+        audio_file: Path,
+        n_frames: int,
+        max_start_frame: int,
+        threshold_dBFS: float,
+        min_activity: float = 1.0,
+    ) -> tuple[np.ndarray, int]:
+        """
+        Start frames, at window boundaries up to max_start_frame, of the excerpts of
+        n_frames of which at least min_activity of the windows are active.
+        Returns them with the window length in frames.
+        """
+        _, _, _, hop_frames, powers = self._rows[self._relative(audio_file)]
+        active = activity_map(powers, threshold_dBFS)
+        starts = active_windows(active, -(-n_frames // hop_frames), min_activity)
+        starts = starts * hop_frames
+        return starts[starts <= max_start_frame], hop_frames
+
+    def files_dBFS(self, audio_files: Optional[Iterable[Path]] = None) -> np.ndarray:
+        """
+        dBFS of the given files, or of all files in the store
+        """
+        if audio_files is None:
+            powers = [row[2] for row in self._rows.values()]
+        else:
+            powers = [self._rows[self._relative(path)][2] for path in audio_files]
+        return np.array([power_to_dBFS(power) for power in powers])
+
+    def percentile_dBFS(
+        self, percentile: float, audio_files: Optional[Iterable[Path]] = None
+    ) -> float:
+        """
+        Value at the given quantile of the sorted file dBFS values
+        """
+        values = np.sort(self.files_dBFS(audio_files))
+        if len(values) == 0:
+            raise ValueError("No files to compute the percentile of")
+        index = max(min(int(len(values) * percentile), len(values) - 1), 0)
+        return float(values[index])
+
+
+def find_store(stores: Iterable[LoudnessStore], audio_file: Path):
+    """
+    Returns the store that contains the file, None if there is none
+    """
+    for store in stores:
+        if audio_file in store:
+            return store
+    return None
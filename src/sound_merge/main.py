@@ -1,5 +1,6 @@
 import config
-from benchmark import produce_benchmark
+from benchmark import produce_benchmark, replay_benchmark
+from manifest import MANIFEST_FILENAME
 
 
 def run():
@@ -12,5 +13,18 @@ def run():
     )
 
 
+def replay(items=None):
+    src = config.music_detection
+    dirs = [src / "test" / "music1", src / "test" / "speech1", src / "test" / "music2"]
+    destination = src / "b1"
+
+    replay_benchmark(
+        manifest_path=destination / MANIFEST_FILENAME,
+        source_directories=dirs,
+        destination_directory=destination,
+        items=items,
+    )
+
+
 if __name__ == "__main__":
     run()
@@ -0,0 +1,62 @@
+"""
+This module records the provenance of every generated mixture in a JSONL manifest,
+one line per item, so single items can be checked and regenerated later
+"""
+
+import json
+from pathlib import Path
+from typing import Iterable, Optional, Sequence
+
+from sound_merge.callables import PipelineStep
+
+MANIFEST_FILENAME = "manifest.jsonl"
+
+
+def collect_provenance(steps: Sequence[PipelineStep]) -> dict:
+    """
+    Merges the provenance of the last call of every step, as plain JSON types
+    """
+    provenance: dict = {}
+    for step in steps:
+        provenance.update(step.provenance())
+    return json.loads(json.dumps(provenance))
+
+
+class ManifestWriter:
+    """
+    Appends one JSON object per item to the manifest and flushes it, so the manifest
+    of an interrupted run covers every item written so far
+    """
+
+    def __init__(self, manifest_path: Path):
+        self.manifest_path = Path(manifest_path)
+        self._file = open(self.manifest_path, "w")
+
+    def write(self, row: dict):
+        self._file.write(json.dumps(row, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> "ManifestWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_manifest(
+    manifest_path: Path, items: Optional[Iterable[int]] = None
+) -> list[dict]:
+    """
+    Reads the rows of the given items (all by default) in item order
+    """
+    wanted = None if items is None else set(items)
+    with open(manifest_path) as file:
+        rows = [json.loads(line) for line in file if line.strip()]
+    rows = [row for row in rows if wanted is None or row["item"] in wanted]
+    if wanted is not None and len(rows) != len(wanted):
+        missing = wanted - {row["item"] for row in rows}
+        raise KeyError(f"Items not in {manifest_path}: {sorted(missing)}")
+    return sorted(rows, key=lambda row: row["item"])
@@ -0,0 +1,142 @@
+"""
+This module runs pipeline steps as a stream of generators, overlapping disk reads,
+mixing and disk writes
+"""
+
+import queue
+import random
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Sequence
+
+from pydub import AudioSegment  # type: ignore
+
+from sound_merge.callables import FileBasedPipelineStep, SegmentBasedPipelineStep
+from sound_merge.profiling import audio_bytes, stage
+
+
+class StreamingPipeline:
+    """
+    Chains a file-based step and segment-based steps as generators.
+
+    For every seed the random choices of the file step (plan) are made in the calling
+    thread, then the I/O (load) runs in a pool of loader threads, at most prefetch items
+    ahead of the consumer. The RNG state after planning is restored before the segment
+    steps run, so every item is identical to a sequential run with the same seed.
+    File steps without the plan/load split (see FileBasedPipelineStep.splits_load)
+    are run entirely in the calling thread instead, without prefetching.
+    """
+
+    def __init__(
+        self,
+        file_step: FileBasedPipelineStep,
+        segment_steps: Sequence[SegmentBasedPipelineStep],
+        prefetch: int = 8,
+        loaders: int = 2,
+    ):
+        if prefetch < 1 or loaders < 1:
+            raise ValueError("prefetch and loaders must be at least 1")
+        self._file_step = file_step
+        self._segment_steps = segment_steps
+        self._prefetch = prefetch
+        self._loaders = loaders
+
+    def _start(
+        self, source_dirs: list[Path], seed: int, executor: ThreadPoolExecutor
+    ) -> tuple[object, Future]:
+        """
+        Plans an item and starts loading it, returns the RNG state after the random
+        choices of the file step with the future of the loaded segments
+        """
+        random.seed(seed)
+        plan = self._file_step.plan(source_dirs)
+        if self._file_step.splits_load():
+            future = executor.submit(self._file_step.load, plan)
+        else:
+            future = Future()
+            future.set_result(self._file_step.load(plan))
+        return random.getstate(), future
+
+    def _load(self, source_dirs: list[Path], seeds: Iterable[int]) -> Iterator:
+        """
+        Yields (rng state, loaded segments) in order, loading up to prefetch items ahead
+        """
+        pending: deque[tuple[object, Future]] = deque()
+        with ThreadPoolExecutor(
+            max_workers=self._loaders, thread_name_prefix="sound-merge-loader"
+        ) as executor:
+            for seed in seeds:
+                pending.append(self._start(source_dirs, seed, executor))
+                if len(pending) >= self._prefetch:
+                    state, future = pending.popleft()
+                    yield state, future.result()
+            while pending:
+                state, future = pending.popleft()
+                yield state, future.result()
+
+    def __call__(
+        self, source_dirs: list[Path], seeds: Iterable[int]
+    ) -> Iterator[list[AudioSegment]]:
+        for state, audio_segments in self._load(source_dirs, seeds):
+            random.setstate(state)
+            for step in self._segment_steps:
+                audio_segments = step(audio_segments)
+            yield audio_segments
+
+
+class BackgroundWriter:
+    """
+    Exports segments from a background thread.
+
+    At most max_pending segments wait in the queue, so memory stays bounded when the disk
+    is slower than the mixing. An export error is raised by the next write or by close.
+    """
+
+    _STOP = None
+
+    def __init__(self, max_pending: int = 8, format: str = "wav"):
+        self._format = format
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(
+            target=self._run, name="sound-merge-writer", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is self._STOP:
+                return
+            audio_segment, dest_file = task
+            if self._error is not None:
+                continue
+            try:
+                with stage("export", audio_bytes(audio_segment)):
+                    audio_segment.export(dest_file, format=self._format)
+            except Exception as e:
+                self._error = e
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def write(self, audio_segment: AudioSegment, dest_file: Path):
+        self._raise_error()
+        self._queue.put((audio_segment, dest_file))
+
+    def close(self):
+        """
+        Waits for the pending exports to finish
+        """
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._raise_error()
+
+    def __enter__(self) -> "BackgroundWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,47 @@
+"""
+This module plots audio segments for inspection. It imports matplotlib and scipy, so
+the generation modules do not import it.
+"""
+
+import matplotlib.pyplot as plt
+import numpy as np
+from pydub import AudioSegment  # type: ignore
+from scipy.signal import spectrogram  # type: ignore
+
+
+def display_spectrogram(audio_segment: AudioSegment):
+    """
+    Displays the spectrogram of the audio segment
+    """
+    samples = np.array(audio_segment.get_array_of_samples())
+
+    num_channels = audio_segment.channels
+    if num_channels == 2:
+        samples = samples.reshape(-1, 2).mean(axis=1)
+
+    f, t, Sxx = spectrogram(samples, audio_segment.frame_rate)
+    plt.figure(figsize=(10, 4))
+    plt.pcolormesh(t, f, 10 * np.log10(Sxx), shading="gouraud")
+    plt.ylabel("Frequency [Hz]")
+    plt.xlabel("Time [sec]")
+    plt.title("Spectrogram")
+    plt.colorbar(label="Intensity [dB]")
+    plt.show()
+
+
+def display_waveform(audio_segment: AudioSegment):
+    """
+    Displays the waveform of the audio segment
+    """
+    samples = np.array(audio_segment.get_array_of_samples())
+
+    num_channels = audio_segment.channels
+    if num_channels == 2:
+        samples = samples.reshape(-1, 2).mean(axis=1)
+
+    plt.figure(figsize=(10, 4))
+    plt.plot(samples)
+    plt.title("Wave File Plot")
+    plt.xlabel("Frame")
+    plt.ylabel("Amplitude")
+    plt.show()
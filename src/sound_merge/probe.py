@@ -0,0 +1,154 @@
+"""
+This module reads audio metadata from file headers without decoding any audio data.
+
+WAV files are parsed directly from their RIFF chunks; other containers fall back to mutagen.
+"""
+
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+@dataclass(frozen=True)
+class AudioInfo:
+    """
+    Format of an audio file as read from its header.
+
+    data_offset is the byte offset of the first frame in a WAV file,
+    None for containers that have to be decoded.
+    """
+
+    frame_rate: int
+    channels: int
+    sample_width: int
+    n_frames: int
+    format_tag: int = 0
+    data_offset: Optional[int] = None
+
+    @property
+    def duration_s(self) -> float:
+        if self.frame_rate == 0:
+            return 0.0
+        return self.n_frames / self.frame_rate
+
+    @property
+    def frame_width(self) -> int:
+        return self.sample_width * self.channels
+
+    @property
+    def is_seekable(self) -> bool:
+        """
+        True if frames can be read directly at data_offset (uncompressed WAV)
+        """
+        return self.data_offset is not None and self.format_tag in (
+            WAVE_FORMAT_PCM,
+            WAVE_FORMAT_IEEE_FLOAT,
+        )
+
+
+def _read_riff_info(file: BinaryIO, file_size: int) -> Optional[AudioInfo]:
+    """
+    Walks the RIFF chunks until the data chunk, returns None if it is not a WAV file
+    """
+    header = file.read(12)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        return None
+
+    fmt = None
+    while True:
+        chunk_header = file.read(8)
+        if len(chunk_header) < 8:
+            return None
+        chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+        if chunk_id == b"fmt ":
+            fmt = file.read(chunk_size)
+            if len(fmt) < 16:
+                return None
+            if chunk_size % 2:
+                file.seek(1, 1)
+        elif chunk_id == b"data":
+            if fmt is None:
+                return None
+            data_offset = file.tell()
+            # streamed files may leave the size unset, the data then runs to the end
+            data_size = min(chunk_size, file_size - data_offset)
+            break
+        else:
+            file.seek(chunk_size + chunk_size % 2, 1)
+
+    format_tag, channels, frame_rate, _, block_align, bits_per_sample = struct.unpack(
+        "<HHIIHH", fmt[:16]
+    )
+    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        # the first two bytes of the subformat GUID hold the actual format tag
+        (format_tag,) = struct.unpack("<H", fmt[24:26])
+    if channels == 0 or block_align == 0:
+        return None
+    return AudioInfo(
+        frame_rate=frame_rate,
+        channels=channels,
+        sample_width=bits_per_sample // 8 or block_align // channels,
+        n_frames=data_size // block_align,
+        format_tag=format_tag,
+        data_offset=data_offset,
+    )
+
+
+def _read_mutagen_info(audio_file: Path) -> Optional[AudioInfo]:
+    """
+    Reads the stream info of a non-WAV container with mutagen, imported only then
+    """
+    from mutagen import File as MutagenFile, MutagenError  # type: ignore
+
+    try:
+        audio = MutagenFile(audio_file)
+    except MutagenError:
+        return None
+    if audio is None or audio.info is None:
+        return None
+    info = audio.info
+    frame_rate = int(getattr(info, "sample_rate", 0) or 0)
+    return AudioInfo(
+        frame_rate=frame_rate,
+        channels=int(getattr(info, "channels", 0) or 0),
+        sample_width=int(getattr(info, "bits_per_sample", 0) or 0) // 8,
+        n_frames=round(float(info.length) * frame_rate),
+    )
+
+
+def probe(audio_file: Path) -> Optional[AudioInfo]:
+    """
+    Reads the format of the audio file from its header, returns None if it is not audio
+    """
+    try:
+        with open(audio_file, "rb") as file:
+            file.seek(0, 2)
+            file_size = file.tell()
+            file.seek(0)
+            info = _read_riff_info(file, file_size)
+    except (OSError, struct.error):
+        return None
+    if info is not None:
+        return info
+    return _read_mutagen_info(audio_file)
+
+
+def check_format(
+    info: AudioInfo,
+    min_duration_s: float = 0.0,
+    frame_rate: Optional[int] = None,
+    channels: Optional[int] = None,
+) -> bool:
+    """
+    Checks if the audio is long enough and, if given, has the required rate and channels
+    """
+    return (
+        info.duration_s >= min_duration_s
+        and (frame_rate is None or info.frame_rate == frame_rate)
+        and (channels is None or info.channels == channels)
+    )
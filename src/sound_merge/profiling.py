@@ -0,0 +1,326 @@
+"""
+This module times the pipeline stages: every PipelineStep call, and code blocks such as
+decoding and exporting, record wall and CPU time, bytes in and out and optionally the
+allocation peak, and are summarized in an end-of-run report
+"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+
+
+@dataclass
+class StageSample:
+    """
+    Measurements of one call of a stage
+    """
+
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    alloc_peak: int = 0
+
+
+@dataclass
+class StageStats:
+    """
+    Summary of all the calls of a stage
+    """
+
+    stage: str
+    calls: int
+    total_s: float
+    p50_s: float
+    p95_s: float
+    cpu_s: float
+    bytes_in: int
+    bytes_out: int
+    alloc_peak: int
+
+
+def audio_bytes(audio_segments) -> int:
+    """
+    Sample bytes of a segment or list of segments, 0 for anything else
+    """
+    if isinstance(audio_segments, (list, tuple)):
+        return sum(audio_bytes(segment) for segment in audio_segments)
+    for attribute in ("samples", "frames"):
+        array = getattr(audio_segments, attribute, None)
+        if isinstance(array, np.ndarray):
+            return array.nbytes
+    return len(getattr(audio_segments, "raw_data", b""))
+
+
+def audio_seconds(audio_segments) -> float:
+    if isinstance(audio_segments, (list, tuple)):
+        return sum(audio_seconds(segment) for segment in audio_segments)
+    return float(getattr(audio_segments, "duration_seconds", 0.0))
+
+
+class Profiler:
+    """
+    Collects the samples of every stage, thread-safe.
+
+    With trace_allocations the allocation peak of every call is measured with
+    tracemalloc, which slows Python allocations down and, as tracemalloc is global,
+    attributes the allocations of concurrent threads to every stage running then.
+    """
+
+    def __init__(self, trace_allocations: bool = False):
+        self.trace_allocations = trace_allocations
+        self._samples: dict[str, list[StageSample]] = {}
+        self._items = 0
+        self._audio_s = 0.0
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, sample: StageSample):
+        with self._lock:
+            self._samples.setdefault(stage, []).append(sample)
+
+    def count_item(self, audio_segment=None):
+        """
+        Counts one finished item and its duration for the throughput figures
+        """
+        with self._lock:
+            self._items += 1
+            self._audio_s += audio_seconds(audio_segment)
+
+    def drain(self) -> tuple[dict[str, list[StageSample]], int, float]:
+        """
+        Returns and clears the samples and counters, e.g. to send them to another process
+        """
+        with self._lock:
+            drained = (self._samples, self._items, self._audio_s)
+            self._samples, self._items, self._audio_s = {}, 0, 0.0
+        return drained
+
+    def merge(self, drained: tuple[dict[str, list[StageSample]], int, float]):
+        samples, items, audio_s = drained
+        with self._lock:
+            for stage, stage_samples in samples.items():
+                self._samples.setdefault(stage, []).extend(stage_samples)
+            self._items += items
+            self._audio_s += audio_s
+
+    def stats(self) -> list[StageStats]:
+        with self._lock:
+            samples = {stage: list(values) for stage, values in self._samples.items()}
+        stats = []
+        for stage, stage_samples in sorted(samples.items()):
+            wall = np.array([sample.wall_s for sample in stage_samples])
+            stats.append(
+                StageStats(
+                    stage=stage,
+                    calls=len(stage_samples),
+                    total_s=float(wall.sum()),
+                    p50_s=float(np.percentile(wall, 50)),
+                    p95_s=float(np.percentile(wall, 95)),
+                    cpu_s=sum(sample.cpu_s for sample in stage_samples),
+                    bytes_in=sum(sample.bytes_in for sample in stage_samples),
+                    bytes_out=sum(sample.bytes_out for sample in stage_samples),
+                    alloc_peak=max(sample.alloc_peak for sample in stage_samples),
+                )
+            )
+        return stats
+
+    def summary(self) -> dict:
+        elapsed = time.perf_counter() - self._start
+        return {
+            "elapsed_s": elapsed,
+            "items": self._items,
+            "audio_s": self._audio_s,
+            "items_per_s": self._items / elapsed if elapsed > 0 else 0.0,
+            "audio_s_per_s": self._audio_s / elapsed if elapsed > 0 else 0.0,
+            "stages": [asdict(stats) for stats in self.stats()],
+        }
+
+    def report(self) -> str:
+        """
+        Formats the per-stage times and the run throughput as a table
+        """
+        summary = self.summary()
+        lines = [
+            f"{'stage':<32}{'calls':>8}{'total s':>10}{'p50 ms':>10}{'p95 ms':>10}"
+            f"{'cpu s':>10}{'MB in':>10}{'MB out':>10}"
+        ]
+        for stats in summary["stages"]:
+            lines.append(
+                f"{stats['stage']:<32}{stats['calls']:>8}{stats['total_s']:>10.3f}"
+                f"{1000 * stats['p50_s']:>10.2f}{1000 * stats['p95_s']:>10.2f}"
+                f"{stats['cpu_s']:>10.3f}{stats['bytes_in'] / 1e6:>10.1f}"
+                f"{stats['bytes_out'] / 1e6:>10.1f}"
+            )
+        lines.append(
+            f"{summary['items']} items in {summary['elapsed_s']:.2f} s: "
+            f"{summary['items_per_s']:.2f} items/s, "
+            f"{summary['audio_s_per_s']:.1f} audio s/s"
+        )
+        return "\n".join(lines)
+
+    def export_json(self, path: Path):
+        _write_atomic(Path(path), json.dumps(self.summary(), indent=1))
+
+    def export_prometheus(self, path: Path):
+        """
+        Writes the metrics in the Prometheus text format, for the textfile collector
+        """
+        summary = self.summary()
+        lines = []
+        for name, kind, help_text, value in [
+            ("sound_merge_items_total", "counter", "Generated items", "items"),
+            (
+                "sound_merge_audio_seconds_total",
+                "counter",
+                "Generated audio",
+                "audio_s",
+            ),
+            ("sound_merge_items_per_second", "gauge", "Item throughput", "items_per_s"),
+        ]:
+            lines += [
+                f"# HELP {name} {help_text}",
+                f"# TYPE {name} {kind}",
+                f"{name} {summary[value]}",
+            ]
+        for name, kind, help_text, value in [
+            ("sound_merge_stage_calls_total", "counter", "Stage calls", "calls"),
+            (
+                "sound_merge_stage_seconds_total",
+                "counter",
+                "Stage wall time",
+                "total_s",
+            ),
+            ("sound_merge_stage_cpu_seconds_total", "counter", "Stage CPU", "cpu_s"),
+            ("sound_merge_stage_bytes_in_total", "counter", "Stage input", "bytes_in"),
+            (
+                "sound_merge_stage_bytes_out_total",
+                "counter",
+                "Stage output",
+                "bytes_out",
+            ),
+        ]:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [
+                f'{name}{{stage="{stats["stage"]}"}} {stats[value]}'
+                for stats in summary["stages"]
+            ]
+        name = "sound_merge_stage_seconds"
+        lines += [f"# HELP {name} Stage wall time quantiles", f"# TYPE {name} gauge"]
+        for stats in summary["stages"]:
+            lines += [
+                f'{name}{{stage="{stats["stage"]}",quantile="0.5"}} {stats["p50_s"]}',
+                f'{name}{{stage="{stats["stage"]}",quantile="0.95"}} {stats["p95_s"]}',
+            ]
+        _write_atomic(Path(path), "\n".join(lines) + "\n")
+
+
+def _write_atomic(path: Path, text: str):
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(text)
+    os.replace(tmp_path, path)
+
+
+_profiler: Optional[Profiler] = None
+_active = threading.local()
+
+
+def get_profiler() -> Optional[Profiler]:
+    return _profiler
+
+
+def enable_profiling(trace_allocations: bool = False) -> Profiler:
+    """
+    Starts collecting samples in this process, returns the new profiler
+    """
+    global _profiler
+    if trace_allocations and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _profiler = Profiler(trace_allocations=trace_allocations)
+    return _profiler
+
+
+def disable_profiling() -> Optional[Profiler]:
+    """
+    Stops collecting samples, returns the profiler with the samples collected so far
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None and profiler.trace_allocations:
+        tracemalloc.stop()
+    return profiler
+
+
+@contextmanager
+def stage(name: str, bytes_in: int = 0) -> Iterator[StageSample]:
+    """
+    Times the enclosed block as a call of the stage name. The block can set bytes_out
+    on the yielded sample. Does nothing but yield when profiling is disabled.
+    A nested stage resets the allocation peak, the peak it ends with is passed on to
+    the enclosing stages of the thread.
+    """
+    sample = StageSample(bytes_in=bytes_in)
+    profiler = _profiler
+    if profiler is None:
+        yield sample
+        return
+    if profiler.trace_allocations:
+        # peaks reached by the enclosing stages before they were reset
+        peaks = _active.__dict__.setdefault("peaks", [])
+        alloc_start, peak = tracemalloc.get_traced_memory()
+        if peaks:
+            peaks[-1] = max(peaks[-1], peak)
+        peaks.append(0)
+        tracemalloc.reset_peak()
+    cpu_start = time.thread_time()
+    wall_start = time.perf_counter()
+    try:
+        yield sample
+    finally:
+        sample.wall_s = time.perf_counter() - wall_start
+        sample.cpu_s = time.thread_time() - cpu_start
+        if profiler.trace_allocations:
+            peak = max(peaks.pop(), tracemalloc.get_traced_memory()[1])
+            if peaks:
+                peaks[-1] = max(peaks[-1], peak)
+            sample.alloc_peak = max(peak - alloc_start, 0)
+        profiler.add(name, sample)
+
+
+def profile_method(method: Callable, suffix: str = "") -> Callable:
+    """
+    Wraps a step method so every call is a stage named after the class of the step.
+    A method that ends up calling itself through super() is only timed once.
+    """
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if _profiler is None:
+            return method(self, *args, **kwargs)
+        active = _active.__dict__.setdefault("calls", set())
+        key = (id(self), suffix)
+        if key in active:
+            return method(self, *args, **kwargs)
+        active.add(key)
+        audio_in = args[0] if args else next(iter(kwargs.values()), None)
+        try:
+            with stage(
+                f"{type(self).__name__}{suffix}", audio_bytes(audio_in)
+            ) as sample:
+                result = method(self, *args, **kwargs)
+                sample.bytes_out = audio_bytes(result)
+            return result
+        finally:
+            active.discard(key)
+
+    wrapper.__profiled__ = True  # type: ignore
+    return wrapper
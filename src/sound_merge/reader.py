@@ -0,0 +1,249 @@
+"""
+This module reads frame ranges of uncompressed WAV files without decoding the whole file,
+either by seeking into the data chunk or by memory-mapping it as a NumPy array
+"""
+
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import numpy as np
+from pydub import AudioSegment  # type: ignore
+
+from sound_merge.probe import WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM, AudioInfo
+
+
+def read_frames(
+    audio_file: Path,
+    info: AudioInfo,
+    start_frame: int = 0,
+    n_frames: Optional[int] = None,
+) -> bytes:
+    """
+    Reads n_frames raw frames starting at start_frame by seeking into the data chunk
+    """
+    if not info.is_seekable:
+        raise ValueError(f"Cannot seek in {audio_file}: not an uncompressed WAV file")
+    if not 0 <= start_frame <= info.n_frames:
+        raise ValueError(f"Start frame {start_frame} is out of range for {audio_file}")
+    if n_frames is None:
+        n_frames = info.n_frames - start_frame
+    n_frames = min(n_frames, info.n_frames - start_frame)
+
+    with open(audio_file, "rb") as file:
+        file.seek(info.data_offset + start_frame * info.frame_width)  # type: ignore
+        return file.read(n_frames * info.frame_width)
+
+
+def read_segment(
+    audio_file: Path,
+    info: AudioInfo,
+    start_frame: int = 0,
+    n_frames: Optional[int] = None,
+) -> AudioSegment:
+    """
+    Reads a frame range of a PCM WAV file into an AudioSegment
+    """
+    if info.format_tag != WAVE_FORMAT_PCM:
+        raise ValueError(f"Cannot read {audio_file} into an AudioSegment: not PCM")
+    data = read_frames(audio_file, info, start_frame=start_frame, n_frames=n_frames)
+    if info.sample_width == 1:
+        # 8-bit WAV samples are unsigned, AudioSegment expects signed ones
+        data = (np.frombuffer(data, dtype=np.uint8) ^ 0x80).tobytes()
+    return AudioSegment(
+        data=data,
+        sample_width=info.sample_width,
+        frame_rate=info.frame_rate,
+        channels=info.channels,
+    )
+
+
+_MEMMAP_DTYPES = {
+    (WAVE_FORMAT_PCM, 1): np.dtype(np.uint8),
+    (WAVE_FORMAT_PCM, 2): np.dtype("<i2"),
+    (WAVE_FORMAT_PCM, 4): np.dtype("<i4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 4): np.dtype("<f4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 8): np.dtype("<f8"),
+}
+
+
+def can_memmap(info: AudioInfo) -> bool:
+    """
+    True if the samples of the file can be mapped as a NumPy array (not 24-bit)
+    """
+    return info.is_seekable and (info.format_tag, info.sample_width) in _MEMMAP_DTYPES
+
+
+def memmap_frames(audio_file: Path, info: AudioInfo) -> np.ndarray:
+    """
+    Maps the data chunk of a WAV file as a read-only [frames, channels] array
+    """
+    if not can_memmap(info):
+        raise ValueError(f"Cannot memory-map {audio_file}: unsupported sample format")
+    if info.n_frames == 0:
+        return np.empty(
+            (0, info.channels), dtype=_MEMMAP_DTYPES[info.format_tag, info.sample_width]
+        )
+    return np.memmap(
+        audio_file,
+        dtype=_MEMMAP_DTYPES[info.format_tag, info.sample_width],
+        mode="r",
+        offset=info.data_offset,  # type: ignore
+        shape=(info.n_frames, info.channels),
+    )
+
+
+class SourceRef(NamedTuple):
+    """
+    Position of the first frame of a segment in its source file
+    """
+
+    path: Path
+    start_frame: int
+
+    def shift(self, n_frames: int) -> "SourceRef":
+        return SourceRef(self.path, self.start_frame + n_frames)
+
+
+class MappedAudio:
+    """
+    Zero-copy view of the frames of a WAV file.
+
+    Supports the parts of the AudioSegment interface used by the pipeline steps (length and
+    slicing in milliseconds, frame_count, dBFS), slicing returns views into the same mapping.
+    Samples are converted to float only once, by to_float32.
+    source records which file and frame the view starts at.
+    """
+
+    __slots__ = ("frames", "frame_rate", "format_tag", "sample_width", "source")
+
+    def __init__(
+        self,
+        frames: np.ndarray,
+        frame_rate: int,
+        format_tag: int,
+        sample_width: int,
+        source: Optional[SourceRef] = None,
+    ):
+        self.frames = frames
+        self.frame_rate = frame_rate
+        self.format_tag = format_tag
+        self.sample_width = sample_width
+        self.source = source
+
+    @classmethod
+    def from_file(cls, audio_file: Path, info: AudioInfo) -> "MappedAudio":
+        return cls(
+            frames=memmap_frames(audio_file, info),
+            frame_rate=info.frame_rate,
+            format_tag=info.format_tag,
+            sample_width=info.sample_width,
+            source=SourceRef(Path(audio_file), 0),
+        )
+
+    @property
+    def channels(self) -> int:
+        return self.frames.shape[1]
+
+    @property
+    def max_possible_amplitude(self) -> float:
+        if self.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+            return 1.0
+        return float(2 ** (8 * self.sample_width - 1))
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.frame_count() / self.frame_rate
+
+    def frame_count(self) -> int:
+        return self.frames.shape[0]
+
+    def __len__(self) -> int:
+        return round(1000 * self.frame_count() / self.frame_rate)
+
+    def __getitem__(self, millisecond: slice) -> "MappedAudio":
+        if not isinstance(millisecond, slice) or millisecond.step is not None:
+            raise TypeError("MappedAudio only supports [start:end] slices in ms")
+        start, end, _ = millisecond.indices(len(self))
+        start_frame = int(start * self.frame_rate / 1000)
+        end_frame = int(end * self.frame_rate / 1000)
+        return self.get_frame_slice(start_frame, end_frame)
+
+    def get_frame_slice(self, start_frame: int, end_frame: int) -> "MappedAudio":
+        return MappedAudio(
+            self.frames[start_frame:end_frame],
+            self.frame_rate,
+            self.format_tag,
+            self.sample_width,
+            self.source.shift(start_frame) if self.source else None,
+        )
+
+    def to_float32(self) -> np.ndarray:
+        """
+        Reads the frames into a new float32 [frames, channels] array scaled to [-1, 1]
+        """
+        samples = self.frames.astype(np.float32)
+        if self.frames.dtype == np.uint8:
+            samples -= 128
+        if self.format_tag != WAVE_FORMAT_IEEE_FLOAT:
+            samples /= self.max_possible_amplitude
+        return samples
+
+    @property
+    def rms(self) -> float:
+        samples = self.to_float32()
+        return float(np.sqrt(np.mean(np.square(samples, dtype=np.float64))))
+
+    @property
+    def dBFS(self) -> float:
+        rms = self.rms
+        if rms == 0:
+            return -float("inf")
+        return 20 * float(np.log10(rms))
+
+    def to_audio_segment(self, sample_width: int = 2) -> AudioSegment:
+        """
+        Converts the frames into an AudioSegment with the given sample width
+        """
+        return float32_to_segment(
+            self.to_float32(), self.frame_rate, sample_width=sample_width
+        )
+
+
+_INT_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+
+def as_float32(audio_segment) -> np.ndarray:
+    """
+    Converts an AudioSegment or MappedAudio into a float32 [frames, channels] array in
+    [-1, 1] with a single copy
+    """
+    if isinstance(audio_segment, MappedAudio):
+        return audio_segment.to_float32()
+    samples = np.frombuffer(
+        audio_segment.raw_data, dtype=_INT_DTYPES[audio_segment.sample_width]
+    ).astype(np.float32)
+    samples /= audio_segment.max_possible_amplitude
+    return samples.reshape(-1, audio_segment.channels)
+
+
+def float32_to_pcm(samples: np.ndarray, sample_width: int = 2) -> np.ndarray:
+    """
+    Converts a float array in [-1, 1] into signed integers of sample_width bytes
+    """
+    max_amplitude = 2 ** (8 * sample_width - 1)
+    data = np.clip(samples * max_amplitude, -max_amplitude, max_amplitude - 1)
+    return data.astype(_INT_DTYPES[sample_width])
+
+
+def float32_to_segment(
+    samples: np.ndarray, frame_rate: int, sample_width: int = 2
+) -> AudioSegment:
+    """
+    Converts a float [frames, channels] array in [-1, 1] into an AudioSegment
+    """
+    return AudioSegment(
+        data=float32_to_pcm(samples, sample_width).tobytes(),
+        sample_width=sample_width,
+        frame_rate=frame_rate,
+        channels=samples.shape[1],
+    )
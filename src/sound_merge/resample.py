@@ -0,0 +1,60 @@
+"""
+This module converts float samples between frame rates and channel counts, so sources
+can be brought to a common format once instead of inside every overlay.
+scipy is imported on the first resampling, as most pipelines never resample.
+"""
+
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+
+# half length of the anti-aliasing filter in periods of the higher of up/down,
+# the same design as the default of scipy.signal.resample_poly
+_HALF_LEN = 10
+_KAISER_BETA = 5.0
+
+
+@lru_cache(maxsize=64)
+def resample_filter(src_rate: int, dst_rate: int) -> tuple[int, int, np.ndarray]:
+    """
+    Designs the polyphase low-pass filter for a rate pair, cached per pair.
+    Returns the up and down factors and the read-only filter taps.
+    """
+    from scipy.signal import firwin  # type: ignore
+
+    divisor = gcd(src_rate, dst_rate)
+    up, down = dst_rate // divisor, src_rate // divisor
+    max_rate = max(up, down)
+    taps = firwin(
+        2 * _HALF_LEN * max_rate + 1, 1.0 / max_rate, window=("kaiser", _KAISER_BETA)
+    ).astype(np.float32)
+    taps.setflags(write=False)
+    return up, down, taps
+
+
+def resample(samples: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """
+    Resamples a float [frames, channels] array with a polyphase filter
+    """
+    if src_rate == dst_rate:
+        return samples
+    from scipy.signal import resample_poly  # type: ignore
+
+    up, down, taps = resample_filter(src_rate, dst_rate)
+    return resample_poly(samples, up, down, axis=0, window=taps).astype(np.float32)
+
+
+def convert_channels(samples: np.ndarray, channels: int) -> np.ndarray:
+    """
+    Converts a [frames, channels] array to the given channel count.
+    Mono is repeated to every channel and every layout can be averaged to mono,
+    like AudioSegment.set_channels.
+    """
+    if samples.shape[1] == channels:
+        return samples
+    if samples.shape[1] == 1:
+        return np.repeat(samples, channels, axis=1)
+    if channels == 1:
+        return samples.mean(axis=1, keepdims=True, dtype=np.float32)
+    raise ValueError(f"Cannot convert {samples.shape[1]} channels to {channels}")
@@ -0,0 +1,152 @@
+"""
+This module draws source files from a SourceIndex with weights, strata and quotas.
+Draws take O(1) with alias tables, so their cost does not grow with the library.
+"""
+
+import random
+from typing import Callable, Optional, Sequence, Union
+
+import numpy as np
+
+from sound_merge.index import IndexEntry
+
+Weight = Union[str, Callable[[IndexEntry], float]]
+Strata = Union[str, Callable[[IndexEntry], str]]
+
+WEIGHTS = ("uniform", "duration")
+STRATA = ("directory",)
+
+
+class AliasTable:
+    """
+    Walker's alias table of a discrete distribution: draw returns i with probability
+    weights[i] / sum(weights) in O(1), using one number of the global random generator,
+    so draws follow random.seed like the rest of the pipeline.
+    """
+
+    def __init__(self, weights: Sequence[float]):
+        weights = np.asarray(weights, dtype=np.float64)
+        if len(weights) == 0 or np.any(weights < 0) or not weights.sum() > 0:
+            raise ValueError("Weights must be non-negative with a positive sum")
+        n = len(weights)
+        scaled = weights * (n / weights.sum())
+        prob = np.ones(n)
+        alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # lists index faster than arrays for single draws
+        self._prob = prob.tolist()
+        self._alias = alias.tolist()
+
+    def __len__(self) -> int:
+        return len(self._prob)
+
+    def draw(self) -> int:
+        u = random.random() * len(self._prob)
+        i = int(u)
+        return i if u - i < self._prob[i] else self._alias[i]
+
+
+def entry_weight(weight: Weight) -> Callable[[IndexEntry], float]:
+    """
+    Weight function of "uniform", "duration" (in seconds) or a callable
+    """
+    if callable(weight):
+        return weight
+    if weight == "uniform":
+        return lambda entry: 1.0
+    if weight == "duration":
+        return lambda entry: entry.duration_s
+    raise ValueError(f"Unknown weight {weight!r}, expected one of {', '.join(WEIGHTS)}")
+
+
+def entry_stratum(strata: Strata) -> Callable[[IndexEntry], str]:
+    """
+    Stratum function of "directory" (the first directory of the path in the index,
+    e.g. the subset or speaker) or a callable
+    """
+    if callable(strata):
+        return strata
+    if strata == "directory":
+        return lambda entry: entry.path.split("/")[0] if "/" in entry.path else ""
+    raise ValueError(f"Unknown strata {strata!r}, expected one of {', '.join(STRATA)}")
+
+
+class SourceSampler:
+    """
+    Draws entries of a source index.
+
+    Every entry is drawn with probability proportional to its weight: "uniform" draws
+    files, "duration" draws seconds of audio, so long files are not under-represented.
+    With strata, entries are grouped (e.g. by subset or speaker directory) and a stratum
+    is drawn first, with probability proportional to its quota, or to its total weight
+    if quotas are not given; strata without a quota are never drawn.
+
+    With replacement=False the entries of a stratum are drawn in epochs: all of them
+    once, in a random order biased by the weights, before any is drawn again.
+    The order is drawn at the start of every epoch, in O(n log n) for n entries.
+    """
+
+    def __init__(
+        self,
+        entries: Sequence[IndexEntry],
+        weight: Weight = "uniform",
+        strata: Optional[Strata] = None,
+        quotas: Optional[dict[str, float]] = None,
+        replacement: bool = True,
+    ):
+        if len(entries) == 0:
+            raise ValueError("Cannot sample from no entries")
+        weight_of = entry_weight(weight)
+        stratum_of = entry_stratum(strata) if strata is not None else lambda _: ""
+        groups: dict[str, list[IndexEntry]] = {}
+        for entry in entries:
+            groups.setdefault(stratum_of(entry), []).append(entry)
+
+        self.strata = sorted(groups)
+        self._entries = [groups[stratum] for stratum in self.strata]
+        self._weights = [
+            np.array([weight_of(entry) for entry in group], dtype=np.float64)
+            for group in self._entries
+        ]
+        if quotas is None:
+            stratum_weights = [weights.sum() for weights in self._weights]
+        else:
+            stratum_weights = [quotas.get(stratum, 0.0) for stratum in self.strata]
+        self._stratum_table = AliasTable(stratum_weights)
+        self._tables = [
+            AliasTable(weights) if weights.sum() > 0 else None
+            for weights in self._weights
+        ]
+        self._replacement = replacement
+        self._epochs: list[list[int]] = [[] for _ in self.strata]
+
+    def draw(self) -> IndexEntry:
+        stratum = self._stratum_table.draw() if len(self.strata) > 1 else 0
+        table = self._tables[stratum]
+        if table is None:
+            raise ValueError(
+                f"All the weights of stratum {self.strata[stratum]!r} are 0"
+            )
+        if self._replacement:
+            return self._entries[stratum][table.draw()]
+        epoch = self._epochs[stratum]
+        if not epoch:
+            epoch.extend(self._epoch_order(self._weights[stratum]))
+        return self._entries[stratum][epoch.pop()]
+
+    def _epoch_order(self, weights: np.ndarray) -> list[int]:
+        """
+        Weighted random order of the entries with a positive weight, drawn with the
+        keys u ** (1 / w) of Efraimidis and Spirakis, reversed so pop takes the first
+        """
+        keys = [
+            (random.random() ** (1.0 / w), i) for i, w in enumerate(weights) if w > 0
+        ]
+        return [i for _, i in sorted(keys)]
@@ -0,0 +1,248 @@
+"""
+This module contains a NumPy-native audio segment used by the vectorized pipeline steps
+"""
+
+from typing import Optional, Sequence, Union
+
+import numpy as np
+from pydub import AudioSegment  # type: ignore
+
+from sound_merge.reader import MappedAudio, SourceRef, as_float32, float32_to_segment
+from sound_merge.resample import convert_channels, resample
+
+
+class ArraySegment:
+    """
+    Audio segment backed by a float32 [frames, channels] array with samples in [-1, 1].
+
+    Mirrors the parts of the AudioSegment interface used by the pipeline steps, but gain,
+    RMS and slicing are single NumPy operations instead of audioop byte-string round trips.
+    Slicing returns views, gain returns a new segment.
+
+    Segments read from a file keep their source position and the total gain applied since,
+    so precomputed statistics of the source can be used instead of the samples. The
+    source is dropped once the samples are changed otherwise, but the origin, the
+    position in the file at origin_rate, is kept for the provenance of the segment.
+    """
+
+    __slots__ = ("samples", "frame_rate", "source", "gain_db", "origin", "origin_rate")
+
+    def __init__(
+        self,
+        samples: np.ndarray,
+        frame_rate: int,
+        source: Optional[SourceRef] = None,
+        gain_db: float = 0.0,
+        origin: Optional[SourceRef] = None,
+        origin_rate: Optional[int] = None,
+    ):
+        if samples.ndim != 2:
+            raise ValueError("Samples must be a [frames, channels] array")
+        self.samples = samples
+        self.frame_rate = frame_rate
+        self.source = source
+        self.gain_db = gain_db
+        self.origin = origin or source
+        self.origin_rate = origin_rate or frame_rate
+
+    @classmethod
+    def from_audio(
+        cls, audio_segment: Union[AudioSegment, MappedAudio, "ArraySegment"]
+    ) -> "ArraySegment":
+        """
+        Converts an AudioSegment or MappedAudio, the samples are copied once
+        """
+        if isinstance(audio_segment, ArraySegment):
+            return audio_segment
+        return cls(
+            as_float32(audio_segment),
+            audio_segment.frame_rate,
+            source=getattr(audio_segment, "source", None),
+        )
+
+    @classmethod
+    def silent(cls, duration_ms: int, frame_rate: int, channels: int = 1):
+        n_frames = int(duration_ms * frame_rate / 1000)
+        return cls(np.zeros((n_frames, channels), dtype=np.float32), frame_rate)
+
+    @property
+    def channels(self) -> int:
+        return self.samples.shape[1]
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.frame_count() / self.frame_rate
+
+    def frame_count(self) -> int:
+        return self.samples.shape[0]
+
+    def __len__(self) -> int:
+        return round(1000 * self.frame_count() / self.frame_rate)
+
+    def __getitem__(self, millisecond: slice) -> "ArraySegment":
+        if not isinstance(millisecond, slice) or millisecond.step is not None:
+            raise TypeError("ArraySegment only supports [start:end] slices in ms")
+        start, end, _ = millisecond.indices(len(self))
+        return self.get_frame_slice(
+            int(start * self.frame_rate / 1000), int(end * self.frame_rate / 1000)
+        )
+
+    def get_frame_slice(self, start_frame: int, end_frame: int) -> "ArraySegment":
+        origin_shift = round(start_frame * self.origin_rate / self.frame_rate)
+        return ArraySegment(
+            self.samples[start_frame:end_frame],
+            self.frame_rate,
+            self.source.shift(start_frame) if self.source else None,
+            self.gain_db,
+            self.origin.shift(origin_shift) if self.origin else None,
+            self.origin_rate,
+        )
+
+    def with_samples(
+        self, samples: np.ndarray, frame_rate: Optional[int] = None
+    ) -> "ArraySegment":
+        """
+        Returns a segment with samples derived from these, with the same gain and origin
+        but without the source position
+        """
+        return ArraySegment(
+            samples,
+            frame_rate or self.frame_rate,
+            gain_db=self.gain_db,
+            origin=self.origin,
+            origin_rate=self.origin_rate,
+        )
+
+    @property
+    def rms(self) -> float:
+        if self.samples.size == 0:
+            return 0.0
+        return float(np.sqrt(np.mean(np.square(self.samples), dtype=np.float64)))
+
+    @property
+    def dBFS(self) -> float:
+        rms = self.rms
+        if rms == 0:
+            return -float("inf")
+        return 20 * float(np.log10(rms))
+
+    @property
+    def max_dBFS(self) -> float:
+        peak = float(np.abs(self.samples).max()) if self.samples.size else 0.0
+        if peak == 0:
+            return -float("inf")
+        return 20 * float(np.log10(peak))
+
+    def apply_gain(self, volume_change: float) -> "ArraySegment":
+        """
+        Returns a copy with the gain in dB applied
+        """
+        return ArraySegment(
+            self.samples * np.float32(db_to_gain(volume_change)),
+            self.frame_rate,
+            self.source,
+            self.gain_db + volume_change,
+            self.origin,
+            self.origin_rate,
+        )
+
+    def set_frame_rate(self, frame_rate: int) -> "ArraySegment":
+        """
+        Returns the segment resampled to frame_rate, the source position is dropped
+        """
+        if frame_rate == self.frame_rate:
+            return self
+        return self.with_samples(
+            resample(self.samples, self.frame_rate, frame_rate), frame_rate
+        )
+
+    def set_channels(self, channels: int) -> "ArraySegment":
+        """
+        Returns the segment with the given channel count, the source position is dropped
+        """
+        if channels == self.channels:
+            return self
+        return self.with_samples(convert_channels(self.samples, channels))
+
+    def __sub__(self, volume_change: float) -> "ArraySegment":
+        return self.apply_gain(-volume_change)
+
+    def __add__(self, volume_change: float) -> "ArraySegment":
+        return self.apply_gain(volume_change)
+
+    def overlay(self, seg: "ArraySegment") -> "ArraySegment":
+        """
+        Sums seg onto this segment, keeping the length of this segment. Like
+        AudioSegment.overlay, both are first converted to the higher frame rate and
+        channel count of the two.
+        """
+        return weighted_sum(sync_formats([self, seg]), [1.0, 1.0])
+
+    def to_audio_segment(self, sample_width: int = 2) -> AudioSegment:
+        return float32_to_segment(self.samples, self.frame_rate, sample_width)
+
+    def export(self, out_f, format: str = "wav", **kwargs):
+        """
+        Exports through pydub, the samples are converted to integers only here
+        """
+        return self.to_audio_segment().export(out_f, format=format, **kwargs)
+
+
+def db_to_gain(db: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+    """
+    Converts a gain in dB into a linear amplitude factor
+    """
+    return np.power(10.0, np.asarray(db) / 20.0)
+
+
+def sync_formats(segments: Sequence[ArraySegment]) -> list[ArraySegment]:
+    """
+    Converts segments to the highest frame rate and channel count among them
+    """
+    frame_rate = max(segment.frame_rate for segment in segments)
+    channels = max(segment.channels for segment in segments)
+    return [
+        segment.set_channels(channels).set_frame_rate(frame_rate)
+        for segment in segments
+    ]
+
+
+def weighted_sum(
+    segments: Sequence[ArraySegment], weights: Union[Sequence[float], np.ndarray]
+) -> ArraySegment:
+    """
+    Sums N segments with linear weights in one vectorized pass.
+    Like AudioSegment.overlay, the result has the length of the first segment:
+    longer segments are cut and shorter ones are padded with silence.
+    """
+    if len(segments) == 0:
+        raise ValueError("At least one segment is required")
+    if len(weights) != len(segments):
+        raise ValueError("There must be one weight per segment")
+    first = segments[0]
+    for segment in segments[1:]:
+        if (segment.frame_rate, segment.channels) != (first.frame_rate, first.channels):
+            raise ValueError(
+                "Segments must have the same frame rate and channels, "
+                f"got {segment.frame_rate} Hz/{segment.channels} ch and "
+                f"{first.frame_rate} Hz/{first.channels} ch"
+            )
+
+    mixed = np.tensordot(
+        np.asarray(weights, dtype=np.float32), stack_segments(segments), axes=1
+    )
+    return ArraySegment(mixed, first.frame_rate)
+
+
+def stack_segments(segments: Sequence[ArraySegment]) -> np.ndarray:
+    """
+    Stacks segments of the same format into a [sources, frames, channels] array with
+    the length of the first one, cutting longer and padding shorter segments
+    """
+    first = segments[0]
+    n_frames = first.frame_count()
+    stacked = np.zeros((len(segments), n_frames, first.channels), dtype=np.float32)
+    for i, segment in enumerate(segments):
+        length = min(n_frames, segment.frame_count())
+        stacked[i, :length] = segment.samples[:length]
+    return stacked
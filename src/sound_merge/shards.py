@@ -0,0 +1,204 @@
+"""
+This module packs mixtures into shards of raw PCM with an offset index and per-item
+metadata, instead of writing one WAV file per mixture
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+from pydub import AudioSegment  # type: ignore
+
+from sound_merge.probe import WAVE_FORMAT_PCM
+from sound_merge.profiling import audio_bytes, stage
+from sound_merge.reader import _INT_DTYPES, MappedAudio, float32_to_pcm
+from sound_merge.segment import ArraySegment
+
+SHARDS_FILENAME = "shards.json"
+SHARDS_VERSION = 1
+
+
+def _shard_name(shard: int) -> str:
+    return f"shard-{shard:05d}"
+
+
+class ShardWriter:
+    """
+    Appends mixtures to shards of items_per_shard items. Every shard is three files:
+    <name>.pcm with the interleaved samples of all its items as signed integers
+    of sample_width bytes, <name>.idx.npy with the start sample, frame count, frame rate
+    and channels of every item, and <name>.jsonl with one metadata object per item.
+    shards.json describes the whole set and is written by close.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        items_per_shard: int = 1024,
+        sample_width: int = 2,
+    ):
+        if items_per_shard < 1:
+            raise ValueError("items_per_shard must be at least 1")
+        if sample_width not in _INT_DTYPES:
+            raise ValueError(f"Unsupported sample width: {sample_width}")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._items_per_shard = items_per_shard
+        self._sample_width = sample_width
+        self._n_items = 0
+        self._shards: list[str] = []
+        self._pcm = None
+        self._metadata = None
+        self._rows: list[tuple[int, int, int, int]] = []
+        self._n_samples = 0
+
+    def _open_shard(self):
+        name = _shard_name(len(self._shards))
+        self._shards.append(name)
+        self._pcm = open(self.directory / f"{name}.pcm", "wb")
+        self._metadata = open(self.directory / f"{name}.jsonl", "w")
+        self._rows = []
+        self._n_samples = 0
+
+    def _close_shard(self):
+        if self._pcm is None:
+            return
+        self._pcm.close()
+        self._metadata.close()  # type: ignore
+        index_path = self.directory / f"{self._shards[-1]}.idx.npy"
+        np.save(index_path, np.array(self._rows, dtype=np.int64).reshape(-1, 4))
+        self._pcm = self._metadata = None
+
+    def _pcm_data(self, audio_segment) -> tuple[bytes, int, int, int]:
+        if (
+            isinstance(audio_segment, AudioSegment)
+            and audio_segment.sample_width == self._sample_width
+        ):
+            return (
+                audio_segment.raw_data,
+                int(audio_segment.frame_count()),
+                audio_segment.frame_rate,
+                audio_segment.channels,
+            )
+        segment = ArraySegment.from_audio(audio_segment)
+        return (
+            float32_to_pcm(segment.samples, self._sample_width).tobytes(),
+            segment.frame_count(),
+            segment.frame_rate,
+            segment.channels,
+        )
+
+    def write(self, audio_segment, metadata: Optional[dict] = None) -> int:
+        """
+        Appends one mixture with its metadata, returns its item index
+        """
+        if self._pcm is None:
+            self._open_shard()
+        with stage("export", audio_bytes(audio_segment)):
+            data, n_frames, frame_rate, channels = self._pcm_data(audio_segment)
+            self._pcm.write(data)  # type: ignore
+        self._metadata.write(json.dumps(metadata or {}) + "\n")  # type: ignore
+        self._rows.append((self._n_samples, n_frames, frame_rate, channels))
+        self._n_samples += n_frames * channels
+
+        item = self._n_items
+        self._n_items += 1
+        if len(self._rows) == self._items_per_shard:
+            self._close_shard()
+        return item
+
+    def close(self):
+        """
+        Finishes the last shard and writes shards.json
+        """
+        self._close_shard()
+        description = {
+            "version": SHARDS_VERSION,
+            "sample_width": self._sample_width,
+            "items_per_shard": self._items_per_shard,
+            "n_items": self._n_items,
+            "shards": self._shards,
+        }
+        tmp_path = self.directory / f"{SHARDS_FILENAME}.tmp"
+        tmp_path.write_text(json.dumps(description, indent=1))
+        os.replace(tmp_path, self.directory / SHARDS_FILENAME)
+
+    def __enter__(self) -> "ShardWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ShardReader:
+    """
+    Random access to the mixtures written by ShardWriter.
+
+    Shards are memory-mapped on first access, so an item is a zero-copy MappedAudio view
+    found in O(1) from its index. The reader can be pickled, e.g. into data loader
+    workers, which then map the shards again.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        description = json.loads((self.directory / SHARDS_FILENAME).read_text())
+        if description.get("version") != SHARDS_VERSION:
+            raise ValueError(f"Unsupported shard version in {self.directory}")
+        self._sample_width = description["sample_width"]
+        self._items_per_shard = description["items_per_shard"]
+        self._n_items = description["n_items"]
+        self._shards = description["shards"]
+        self._mapped: dict[int, tuple[np.ndarray, np.ndarray]] = {}
+        self._metadata: dict[int, list[dict]] = {}
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_mapped"] = {}
+        state["_metadata"] = {}
+        return state
+
+    def __len__(self) -> int:
+        return self._n_items
+
+    def _locate(self, item: int) -> tuple[int, int]:
+        if item < 0:
+            item += self._n_items
+        if not 0 <= item < self._n_items:
+            raise IndexError(f"Item {item} is out of range for {self._n_items} items")
+        return divmod(item, self._items_per_shard)
+
+    def _map(self, shard: int) -> tuple[np.ndarray, np.ndarray]:
+        mapped = self._mapped.get(shard)
+        if mapped is None:
+            name = self._shards[shard]
+            pcm_path = self.directory / f"{name}.pcm"
+            dtype = np.dtype(_INT_DTYPES[self._sample_width])
+            samples = (
+                np.memmap(pcm_path, dtype=dtype, mode="r")
+                if pcm_path.stat().st_size
+                else np.empty(0, dtype=dtype)
+            )
+            mapped = (samples, np.load(self.directory / f"{name}.idx.npy"))
+            self._mapped[shard] = mapped
+        return mapped
+
+    def __getitem__(self, item: int) -> MappedAudio:
+        shard, position = self._locate(item)
+        samples, index = self._map(shard)
+        start, n_frames, frame_rate, channels = index[position]
+        frames = samples[start : start + n_frames * channels].reshape(-1, channels)
+        return MappedAudio(frames, int(frame_rate), WAVE_FORMAT_PCM, self._sample_width)
+
+    def __iter__(self) -> Iterator[MappedAudio]:
+        return (self[item] for item in range(len(self)))
+
+    def metadata(self, item: int) -> dict:
+        shard, position = self._locate(item)
+        lines = self._metadata.get(shard)
+        if lines is None:
+            with open(self.directory / f"{self._shards[shard]}.jsonl") as file:
+                lines = [json.loads(line) for line in file]
+            self._metadata[shard] = lines
+        return lines[position]
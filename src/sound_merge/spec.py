@@ -0,0 +1,426 @@
+"""
+This module reads a benchmark spec from a TOML or YAML file, validates it and builds the
+pipeline steps it describes. Step classes are imported only when a pipeline is built
+or validated, so reading a spec stays cheap.
+"""
+
+import collections.abc
+import importlib
+import inspect
+import typing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional, Union
+
+SPEC_FORMATS = ("wav", "shards")
+
+# step name -> module of the step class, other steps can be given as "module:Class"
+STEP_MODULES = {
+    name: "sound_merge.callables"
+    for name in (
+        "PullAudioSegments",
+        "PullRandomExcerpts",
+        "RandomSegment",
+        "ToArraySegments",
+        "RandomSilenceMask",
+        "RecordSources",
+        "HarmonizeSegments",
+        "NormalizeSegments",
+        "MixSegments",
+        "WeightedMixSegments",
+        "SNRMixSegments",
+    )
+}
+
+DEFAULT_PIPELINE: dict = {
+    "pull": {"step": "PullRandomExcerpts", "len_s": 10, "memmap": True},
+    "steps": [
+        {"step": "NormalizeSegments", "target_dBFS": -14},
+        {"step": "WeightedMixSegments"},
+    ],
+}
+
+
+class SpecError(ValueError):
+    """
+    Raised with all the problems found in a spec
+    """
+
+
+@dataclass
+class BenchmarkSpec:
+    """
+    Everything produce_benchmark needs, see benchmark.example.toml for the file layout.
+    sources holds directories and SourceGroups, pipeline the plain pull and steps tables.
+    """
+
+    sources: list
+    destination: Path
+    count: int
+    seed: Optional[int] = None
+    workers: int = 1
+    chunksize: int = 16
+    cache_bytes: int = 0
+    cache_dir: Optional[Path] = None
+    format: str = "wav"
+    shard_items: int = 1024
+    profile: bool = False
+    profile_export: Optional[Path] = None
+    trace_allocations: bool = False
+    pipeline: dict = field(default_factory=lambda: DEFAULT_PIPELINE)
+
+    def benchmark_kwargs(self) -> dict:
+        """
+        Keyword arguments of produce_benchmark
+        """
+        return {
+            "source_directories": self.sources,
+            "destination_directory": self.destination,
+            "audio_file_count": self.count,
+            "workers": self.workers,
+            "seed": self.seed,
+            "chunksize": self.chunksize,
+            "cache_bytes": self.cache_bytes,
+            "cache_dir": self.cache_dir,
+            "shard_items": self.shard_items if self.format == "shards" else 0,
+            "profile": self.profile,
+            "profile_export": self.profile_export,
+            "trace_allocations": self.trace_allocations,
+            "pipeline": self.pipeline,
+        }
+
+
+def read_spec_file(path: Path) -> dict:
+    """
+    Parses a .toml, .yaml or .yml file into a dict
+    """
+    path = Path(path)
+    try:
+        if path.suffix == ".toml":
+            import tomllib
+
+            with open(path, "rb") as file:
+                return tomllib.load(file)
+        if path.suffix in (".yaml", ".yml"):
+            try:
+                import yaml  # type: ignore
+            except ImportError as e:
+                raise SpecError("Reading YAML specs requires PyYAML") from e
+            with open(path) as file:
+                data = yaml.safe_load(file)
+            if not isinstance(data, dict):
+                raise SpecError(f"{path}: the spec must be a mapping")
+            return data
+    except OSError as e:
+        raise SpecError(f"Cannot read spec {path}: {e}") from e
+    except ValueError as e:
+        if isinstance(e, SpecError):
+            raise
+        raise SpecError(f"Cannot parse spec {path}: {e}") from e
+    raise SpecError(f"{path}: unknown spec format, use .toml, .yaml or .yml")
+
+
+def step_class(name: str) -> type:
+    """
+    Imports the class of a step given by name or as "module:Class"
+    """
+    module_name, _, class_name = name.rpartition(":")
+    if not module_name:
+        if name not in STEP_MODULES:
+            raise SpecError(f"Unknown step: {name}")
+        module_name, class_name = STEP_MODULES[name], name
+    try:
+        return getattr(importlib.import_module(module_name), class_name)
+    except (ImportError, AttributeError) as e:
+        raise SpecError(f"Cannot import step {name}: {e}") from e
+
+
+def _init_parameters(cls: type) -> tuple[dict[str, Any], set[str]]:
+    """
+    Annotations of all the keyword parameters of the class (Any if not annotated) and
+    names of the required ones, following **kwargs into the base classes
+    """
+    names: dict[str, Any] = {}
+    required: set[str] = set()
+    for klass in cls.__mro__:
+        if "__init__" not in klass.__dict__:
+            continue
+        try:
+            hints = typing.get_type_hints(klass.__init__)
+        except Exception:
+            hints = {}
+        parameters = list(inspect.signature(klass.__init__).parameters.values())[1:]
+        for parameter in parameters:
+            if parameter.kind in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD):
+                continue
+            names.setdefault(parameter.name, hints.get(parameter.name, Any))
+            if parameter.default is parameter.empty:
+                required.add(parameter.name)
+        if all(parameter.kind != parameter.VAR_KEYWORD for parameter in parameters):
+            break
+    return names, required
+
+
+def _matches(annotation: Any, value: Any) -> bool:
+    """
+    Checks a spec value against a parameter annotation. Ints are accepted as floats
+    and strings as paths, annotations that a spec cannot express accept anything.
+    """
+    origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+    if annotation is Any:
+        return True
+    if origin is Union:
+        return any(_matches(arg, value) for arg in args)
+    if origin is typing.Literal:
+        return value in args
+    if annotation is type(None):
+        return value is None
+    if annotation in (int, float) and isinstance(value, bool):
+        return False
+    if annotation is float:
+        return isinstance(value, (int, float))
+    if annotation is Path:
+        return isinstance(value, (str, Path))
+    if origin in (list, tuple, collections.abc.Sequence):
+        if not isinstance(value, (list, tuple)):
+            return False
+        if origin is tuple and args and args[-1] is not Ellipsis:
+            return len(value) == len(args) and all(map(_matches, args, value))
+        return all(_matches(args[0] if args else Any, item) for item in value)
+    if origin in (dict, collections.abc.Mapping):
+        return isinstance(value, dict) and all(
+            _matches(args[1] if args else Any, item) for item in value.values()
+        )
+    if origin is collections.abc.Callable:
+        return callable(value)
+    if isinstance(annotation, type):
+        return isinstance(value, annotation)
+    return True
+
+
+def _check_step(
+    where: str, table: Any, base: type, errors: list[str]
+) -> Optional[type]:
+    """
+    Checks a step table, returns the step class if it could be imported
+    """
+    if not isinstance(table, dict) or "step" not in table:
+        errors.append(f"{where}: expected a table with a step name")
+        return None
+    try:
+        cls = step_class(table["step"])
+    except SpecError as e:
+        errors.append(f"{where}: {e}")
+        return None
+    if not issubclass(cls, base):
+        errors.append(f"{where}: {table['step']} is not a {base.__name__}")
+        return None
+    params = {key: value for key, value in table.items() if key != "step"}
+    names, required = _init_parameters(cls)
+    n_errors = len(errors)
+    for name in sorted(params.keys() - names.keys()):
+        errors.append(f"{where}: unknown parameter {name} of {table['step']}")
+    for name in sorted(required - params.keys()):
+        errors.append(f"{where}: missing parameter {name} of {table['step']}")
+    for name in sorted(params.keys() & names.keys()):
+        if not _matches(names[name], params[name]):
+            expected = inspect.formatannotation(names[name])
+            errors.append(
+                f"{where}: {name} of {table['step']} expected {expected}, "
+                f"got {params[name]!r}"
+            )
+    if len(errors) > n_errors:
+        return cls
+    # the constructors check the values that the annotations cannot express
+    try:
+        cls(**params)
+    except (TypeError, ValueError) as e:
+        errors.append(f"{where}: invalid {table['step']}: {e}")
+    return cls
+
+
+def validate_pipeline(pipeline: dict) -> list[str]:
+    """
+    Checks that every step exists, has the right kind and gets valid parameters: known
+    names, values of the annotated types, and values its constructor accepts, and that
+    the last step mixes the segments. Returns the problems found.
+    """
+    from sound_merge.callables import FileBasedPipelineStep, SegmentBasedPipelineStep
+
+    errors: list[str] = []
+    _check_step("pull", pipeline.get("pull"), FileBasedPipelineStep, errors)
+    steps = pipeline.get("steps", [])
+    if not isinstance(steps, list) or len(steps) == 0:
+        errors.append("steps: expected at least one step")
+        return errors
+    for i, table in enumerate(steps):
+        cls = _check_step(f"steps[{i}]", table, SegmentBasedPipelineStep, errors)
+    if cls is not None and not cls.mixes:
+        errors.append(
+            f"steps[{len(steps) - 1}]: the last step must mix the segments, "
+            f"{steps[-1]['step']} does not"
+        )
+    return errors
+
+
+def build_steps(
+    pipeline: dict, overrides: Optional[dict] = None
+) -> tuple[Any, list[Any]]:
+    """
+    Builds the file step and the segment steps of a pipeline. overrides are passed to
+    the file step if it accepts them.
+    """
+    pull = dict(pipeline["pull"])
+    pull_class = step_class(pull.pop("step"))
+    names, _ = _init_parameters(pull_class)
+    for name, value in (overrides or {}).items():
+        if name in names:
+            pull.setdefault(name, value)
+    segment_steps = []
+    for table in pipeline["steps"]:
+        params = dict(table)
+        segment_steps.append(step_class(params.pop("step"))(**params))
+    return pull_class(**pull), segment_steps
+
+
+def _resolve(base: Path, path: Union[str, Path]) -> Path:
+    path = Path(path).expanduser()
+    return path if path.is_absolute() else base / path
+
+
+def _parse_sources(base: Path, sources: Any, errors: list[str]) -> list:
+    from sound_merge.callables import SourceGroup
+
+    if not isinstance(sources, list) or len(sources) == 0:
+        errors.append("sources: expected at least one source")
+        return []
+    parsed: list = []
+    for i, source in enumerate(sources):
+        where = f"sources[{i}]"
+        if isinstance(source, str):
+            source = {"path": source}
+        if not isinstance(source, dict) or ("path" in source) == ("paths" in source):
+            errors.append(f"{where}: expected a path or a list of paths")
+            continue
+        paths = [source["path"]] if "path" in source else source["paths"]
+        if (
+            not isinstance(paths, list)
+            or len(paths) == 0
+            or not all(isinstance(path, str) for path in paths)
+        ):
+            errors.append(f"{where}: expected a path or a list of paths")
+            continue
+        directories = tuple(_resolve(base, path) for path in paths)
+        for directory in directories:
+            if not directory.is_dir():
+                errors.append(f"{where}: {directory} is not a directory")
+        if "path" in source:
+            parsed.append(directories[0])
+            continue
+        weights = source.get("weights", [1.0] * len(directories))
+        if not isinstance(weights, list):
+            errors.append(f"{where}: expected a list of weights")
+            continue
+        if len(weights) != len(directories) or any(
+            not isinstance(weight, (int, float)) or weight < 0 for weight in weights
+        ):
+            errors.append(f"{where}: expected one non-negative weight per path")
+        elif sum(weights) <= 0:
+            errors.append(f"{where}: the weights must not all be 0")
+        parsed.append(SourceGroup(directories, tuple(float(w) for w in weights)))
+    return parsed
+
+
+def _get(table: dict, key: str, kind: type, default: Any, errors: list[str], where):
+    value = table.get(key, default)
+    if value is not None and not (
+        isinstance(value, kind) and not (kind is int and isinstance(value, bool))
+    ):
+        errors.append(f"{where}{key}: expected {kind.__name__}, got {value!r}")
+        return default
+    return value
+
+
+def parse_spec(data: dict, base: Path = Path(".")) -> BenchmarkSpec:
+    """
+    Validates a spec dict, relative paths are resolved against base.
+    Raises a SpecError listing every problem.
+    """
+    errors: list[str] = []
+    tables = {}
+    for name in ("output", "cache", "profile"):
+        tables[name] = data.get(name, {})
+        if not isinstance(tables[name], dict):
+            errors.append(f"{name}: expected a table")
+            tables[name] = {}
+    output, cache, profile = tables["output"], tables["cache"], tables["profile"]
+    known = {"sources", "output", "cache", "profile", "pull", "steps"}
+    known |= {"count", "seed", "workers", "chunksize"}
+    for key in sorted(set(data) - known):
+        errors.append(f"{key}: unknown setting")
+
+    sources = _parse_sources(base, data.get("sources"), errors)
+    count = _get(data, "count", int, None, errors, "")
+    if count is None or count < 1:
+        errors.append("count: expected a positive number of mixtures")
+    workers = _get(data, "workers", int, 1, errors, "")
+    if workers < 1:
+        errors.append("workers: expected at least 1")
+    chunksize = _get(data, "chunksize", int, 16, errors, "")
+    if chunksize < 1:
+        errors.append("chunksize: expected at least 1")
+    seed = _get(data, "seed", int, None, errors, "")
+
+    destination = _get(output, "directory", str, None, errors, "output.")
+    if destination is None:
+        errors.append("output.directory: missing")
+    output_format = _get(output, "format", str, "wav", errors, "output.")
+    if output_format not in SPEC_FORMATS:
+        errors.append(f"output.format: expected one of {', '.join(SPEC_FORMATS)}")
+    shard_items = _get(output, "shard_items", int, 1024, errors, "output.")
+    if shard_items < 1:
+        errors.append("output.shard_items: expected at least 1")
+    cache_bytes = _get(cache, "bytes", int, 0, errors, "cache.")
+    if cache_bytes < 0:
+        errors.append("cache.bytes: expected a non-negative number of bytes")
+    cache_dir = _get(cache, "dir", str, None, errors, "cache.")
+    profile_enabled = _get(profile, "enabled", bool, False, errors, "profile.")
+    profile_export = _get(profile, "export", str, None, errors, "profile.")
+    trace_allocations = _get(
+        profile, "trace_allocations", bool, False, errors, "profile."
+    )
+
+    pipeline = DEFAULT_PIPELINE
+    if "pull" in data or "steps" in data:
+        pipeline = {
+            "pull": data.get("pull", DEFAULT_PIPELINE["pull"]),
+            "steps": data.get("steps", DEFAULT_PIPELINE["steps"]),
+        }
+    errors.extend(validate_pipeline(pipeline))
+
+    if errors:
+        raise SpecError("Invalid spec:\n" + "\n".join(f"  {e}" for e in errors))
+    return BenchmarkSpec(
+        sources=sources,
+        destination=_resolve(base, destination),
+        count=count,
+        seed=seed,
+        workers=workers,
+        chunksize=chunksize,
+        cache_bytes=cache_bytes,
+        cache_dir=_resolve(base, cache_dir) if cache_dir else None,
+        format=output_format,
+        shard_items=shard_items,
+        profile=profile_enabled,
+        profile_export=_resolve(base, profile_export) if profile_export else None,
+        trace_allocations=trace_allocations,
+        pipeline=pipeline,
+    )
+
+
+def load_spec(path: Path) -> BenchmarkSpec:
+    """
+    Reads and validates a spec file, relative paths are relative to the file
+    """
+    path = Path(path)
+    return parse_spec(read_spec_file(path), base=path.parent)
@@ -1,32 +1,56 @@
 """Intended to create a directory of sound files with uniform loudness."""
 
 from pathlib import Path
+from typing import Optional
 
 from loguru import logger
 from pydub import AudioSegment  # type: ignore
 
+from sound_merge.loudness import LoudnessStore, find_store
 
-def get_median_dBFS(path: Path) -> float:
-    """Calculates the median dBFS value of all .wav files in the given directory."""
-    dBFS_values = []
-    for filename in path.iterdir():
-        if filename.suffix != ".wav" or filename.name.startswith("._"):
-            continue
-        audio = AudioSegment.from_file(str(path / filename), format="wav")
-        dBFS_values.append(audio.dBFS)
+
+def get_median_dBFS(path: Path, store: Optional[LoudnessStore] = None) -> float:
+    """
+    Calculates the median dBFS value of all .wav files in the given directory.
+    The values are read from the loudness store of the directory.
+    """
+    if store is None:
+        store = LoudnessStore.open(path)
+    wav_files = [
+        filename
+        for filename in path.iterdir()
+        if filename.suffix == ".wav" and not filename.name.startswith("._")
+    ]
+    dBFS_values = store.files_dBFS(wav_files)
 
     median = sorted(dBFS_values)[len(dBFS_values) // 2]
 
     return median
 
 
-def get_percentile_dBFS(paths: list[Path], percentile: float) -> float:
-    """Calculates the specified quantile dBFS value of all .wav files in the given list."""
-    dBFS_values = [
-        AudioSegment.from_file(str(path), format="wav").dBFS
+def get_percentile_dBFS(
+    paths: list[Path],
+    percentile: float,
+    stores: Optional[list[LoudnessStore]] = None,
+) -> float:
+    """
+    Calculates the specified quantile dBFS value of all .wav files in the given list.
+    The values are read from the given loudness stores, or from the stores of the
+    directories of the files.
+    """
+    wav_files = [
+        path
         for path in paths
         if path.suffix == ".wav" and not path.name.startswith("._")
     ]
+    if stores is None:
+        stores = [LoudnessStore.open(path) for path in {p.parent for p in wav_files}]
+    dBFS_values = []
+    for path in wav_files:
+        store = find_store(stores, path)
+        if store is None:
+            raise KeyError(f"{path} is not in any loudness store")
+        dBFS_values.append(store.file_dBFS(path))
 
     index = int(len(dBFS_values) * percentile)
     index = max(min(index, len(dBFS_values) - 1), 0)
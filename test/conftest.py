@@ -0,0 +1,46 @@
+"""Shared fixtures for the tests."""
+
+import wave
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+
+def write_wav(
+    path: Path,
+    duration_s: float,
+    frame_rate: int = 16000,
+    channels: int = 1,
+    sample_width: int = 2,
+    amplitude: float = 0.5,
+    seed: int = 0,
+    leading_silence_s: float = 0.0,
+) -> Path:
+    """Writes a PCM WAV file filled with seeded noise, optionally after some silence."""
+    rng = np.random.default_rng(seed)
+    n_frames = int(duration_s * frame_rate)
+    samples = rng.uniform(-amplitude, amplitude, size=n_frames * channels)
+    samples[: int(leading_silence_s * frame_rate) * channels] = 0
+    max_amplitude = 2 ** (8 * sample_width - 1)
+    dtype = {1: np.uint8, 2: np.int16, 4: np.int32}[sample_width]
+    data = samples * (max_amplitude - 1)
+    if sample_width == 1:
+        data += max_amplitude
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(sample_width)
+        wav.setframerate(frame_rate)
+        wav.writeframes(data.astype(dtype).tobytes())
+    return path
+
+
+@pytest.fixture
+def make_wav(tmp_path):
+    """Fixture that writes WAV files relative to tmp_path."""
+
+    def _make_wav(name: str, duration_s: float, **kwargs) -> Path:
+        return write_wav(tmp_path / name, duration_s, **kwargs)
+
+    return _make_wav
@@ -0,0 +1,87 @@
+"""Tests for the augm module.."""
+
+import random
+
+import numpy as np
+from pydub import AudioSegment  # type: ignore
+
+from sound_merge.augm import (
+    active_start_points,
+    apply_silence_mask,
+    mix,
+    random_silence_mask,
+    random_silence_mask_batch,
+    silence_envelope,
+)
+from sound_merge.segment import ArraySegment
+
+
+def _tone(duration_s: float, frame_rate: int = 1000, channels: int = 1):
+    samples = np.full((int(duration_s * frame_rate), channels), 0.5, dtype=np.float32)
+    return ArraySegment(samples, frame_rate)
+
+
+def test_silence_envelope_intervals_and_ramps():
+    """Test if the envelope is zero in the intervals and ramps linearly around them."""
+    envelope = silence_envelope(100, [40], 10, 5)
+    assert np.all(envelope[40:50] == 0)
+    assert np.all(envelope[:35] == 1) and np.all(envelope[55:] == 1)
+    assert np.allclose(envelope[35:40], [1.0, 0.8, 0.6, 0.4, 0.2])
+    assert np.allclose(envelope[50:55], [0.0, 0.2, 0.4, 0.6, 0.8])
+
+
+def test_silence_envelope_overlapping_intervals():
+    """Test if overlapping intervals stay silent until the latest end."""
+    envelope = silence_envelope(100, [10, 12], 30, 0)
+    assert np.all(envelope[10:42] == 0)
+    assert np.all(envelope[42:] == 1)
+
+
+def test_random_silence_mask_types():
+    """Test if the mask keeps the segment type and silences the requested duration."""
+    segment = _tone(2.0)
+    masked = random_silence_mask(segment, 500, 100, 0, rng=np.random.default_rng(0))
+    assert isinstance(masked, ArraySegment)
+    assert 0 < np.count_nonzero(masked.samples == 0) <= 500
+
+    audio_segment = segment.to_audio_segment()
+    masked_audio = apply_silence_mask(audio_segment, [100], 100, 10)
+    assert isinstance(masked_audio, AudioSegment)
+    assert len(masked_audio) == len(audio_segment)
+
+
+def test_random_silence_mask_batch_reproducible():
+    """Test if a batch with a seeded generator matches masking one segment at a time."""
+    segments = [_tone(1.0), _tone(1.0, channels=2), _tone(0.5)]
+    batch = random_silence_mask_batch(segments, 300, 50, 10, np.random.default_rng(7))
+    rng = np.random.default_rng(7)
+    for segment, masked in zip(segments, batch):
+        single = random_silence_mask(segment, 300, 50, 10, rng=rng)
+        assert np.array_equal(single.samples, masked.samples)
+
+
+def test_mix_converts_second_segment(make_wav):
+    """Test if mix converts the second segment to the format of the first one."""
+    audio1 = AudioSegment.from_file(make_wav("a.wav", 1.0, frame_rate=16000))
+    audio2 = AudioSegment.from_file(
+        make_wav("b.wav", 0.5, frame_rate=44100, channels=2, sample_width=4)
+    )
+    audio1 = audio1.set_sample_width(1)
+    mixed = mix(audio1, audio2)
+    assert (mixed.frame_rate, mixed.channels, mixed.sample_width) == (16000, 1, 1)
+    assert len(mixed) == len(audio1)
+
+
+def test_silence_mask_is_placed_over_active_regions():
+    """Test if activity_dBFS places every silence interval over the active half."""
+    samples = np.zeros((16000, 1), dtype=np.float32)
+    samples[8000:] = 0.5
+    segment = ArraySegment(samples, 16000)
+
+    candidates = active_start_points(segment, 100, threshold_dBFS=-40)
+    assert candidates.min() == 450 and candidates.max() == 899
+    random.seed(0)
+    for _ in range(10):
+        masked = random_silence_mask(segment, 300, 100, 0, activity_dBFS=-40)
+        # every interval has at least its second half in the active half
+        assert np.count_nonzero(masked.samples[8000:] == 0) >= 800
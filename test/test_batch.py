@@ -0,0 +1,71 @@
+"""Tests for the batch module."""
+
+import numpy as np
+import pytest
+
+from sound_merge.batch import (
+    BatchMixer,
+    batch_dBFS,
+    mix_batch,
+    source_power,
+    stack_sources,
+)
+from sound_merge.callables import NormalizeSegments, WeightedMixSegments
+from sound_merge.segment import ArraySegment
+
+
+def _noise(seed: int, n_frames: int = 800, amplitude: float = 0.3) -> ArraySegment:
+    rng = np.random.default_rng(seed)
+    samples = rng.uniform(-amplitude, amplitude, (n_frames, 1)).astype(np.float32)
+    return ArraySegment(samples, 8000)
+
+
+def test_batch_matches_per_item_steps():
+    """Test if BatchMixer gives the same mixtures as the per-item steps."""
+    items = [
+        [_noise(3 * b), _noise(3 * b + 1, 600), _noise(3 * b + 2)] for b in range(4)
+    ]
+    batch = BatchMixer(target_dBFS=-14, gains_db=[0, -3, -6])(items)
+    assert batch.samples.shape == (4, 800, 1) and batch.samples.dtype == np.float32
+
+    normalize = NormalizeSegments(-14)
+    mixer = WeightedMixSegments(gains_db=[0, -3, -6])
+    for item, mixed in zip(items, batch):
+        [expected] = mixer(normalize(item))
+        assert np.allclose(mixed.samples, expected.samples, atol=1e-5)
+
+
+def test_mix_batch_limits_peaks_per_mixture():
+    """Test if only the mixtures above the ceiling are scaled down."""
+    sources = np.zeros((2, 2, 4, 1), dtype=np.float32)
+    sources[0, :, 0] = 0.8
+    sources[1, :, 0] = 0.1
+    mixed = mix_batch(sources, peak_dBFS=-6)
+    assert np.abs(mixed[0]).max() == pytest.approx(10 ** (-6 / 20), rel=1e-5)
+    assert mixed[1, 0, 0] == pytest.approx(0.2)
+
+
+def test_stack_sources_checks_layout():
+    """Test if silent sources have -inf dBFS and mismatched mixtures are rejected."""
+    sources, frame_rate, lengths = stack_sources(
+        [[_noise(0), ArraySegment.silent(100, 8000)]]
+    )
+    assert frame_rate == 8000 and lengths.tolist() == [[800, 800]]
+    assert batch_dBFS(sources)[0, 1] == -float("inf")
+
+    with pytest.raises(ValueError):
+        stack_sources([[_noise(0)], [_noise(1), _noise(2)]])
+    with pytest.raises(ValueError):
+        stack_sources([[_noise(0), ArraySegment(np.zeros((10, 2), np.float32), 8000)]])
+
+
+def test_source_power_measures_active_frames():
+    """Test if source_power skips pauses and padding when measuring active frames."""
+    sources = np.zeros((2, 1000, 1), dtype=np.float32)
+    sources[0, :300] = 0.5
+    sources[1, :500] = 0.1
+    lengths = np.array([1000, 500])
+
+    assert source_power(sources, lengths) == pytest.approx([0.075, 0.01])
+    active = source_power(sources, lengths, frame_length=100, active_range_db=40)
+    assert active == pytest.approx([0.25, 0.01])
@@ -1,8 +1,26 @@
 """Tests for the benchmark module."""
 
+import random
+
+import numpy as np
 import pytest
 
-from sound_merge.benchmark import random_coefficient, calculate_db_loss
+import sound_merge.loudness
+from sound_merge.benchmark import (
+    random_coefficient,
+    calculate_db_loss,
+    produce_benchmark,
+    replay_benchmark,
+)
+from sound_merge.callables import (
+    HarmonizeSegments,
+    MixSegments,
+    NormalizeSegments,
+    PullRandomExcerpts,
+    RecordSources,
+)
+from sound_merge.manifest import MANIFEST_FILENAME, read_manifest
+from sound_merge.shards import ShardReader
 
 
 def test_random_coefficient_range():
@@ -20,3 +38,177 @@ def test_calculate_db_loss_zero_percent():
 def test_calculate_db_loss_valid_percent():
     """Test if calculate_db_loss returns correct value for valid percent."""
     assert calculate_db_loss(0.5) == pytest.approx(-3.0103, 0.0001)
+    assert MixSegments()._calculate_db_loss(0.5) == calculate_db_loss(0.5)
+
+
+def test_produce_benchmark_is_independent_of_worker_count(tmp_path, make_wav):
+    """Test if the same master seed gives identical files with 1 and 2 workers."""
+    sources = []
+    for i, name in enumerate(["music", "speech"]):
+        for j in range(3):
+            make_wav(f"{name}/{j}.wav", 12.0 + j, seed=10 * i + j)
+        sources.append(tmp_path / name)
+
+    outputs = []
+    for workers in (1, 2):
+        destination = tmp_path / f"out{workers}"
+        destination.mkdir()
+        produce_benchmark(sources, destination, 4, workers=workers, seed=7, chunksize=1)
+        outputs.append({path.name: path.read_bytes() for path in destination.iterdir()})
+
+    assert sorted(outputs[0]) == [MANIFEST_FILENAME] + [
+        f"mixed_audio_{i}.wav" for i in range(4)
+    ]
+    assert outputs[0] == outputs[1]
+
+
+def test_produce_benchmark_packs_shards(tmp_path, make_wav):
+    """Test if packed output holds the same mixtures with 1 and 2 workers."""
+    sources = []
+    for name in ["music", "speech"]:
+        make_wav(f"{name}/0.wav", 11.0)
+        sources.append(tmp_path / name)
+
+    readers = []
+    for workers in (1, 2):
+        destination = tmp_path / f"out{workers}"
+        produce_benchmark(
+            sources, destination, 3, workers=workers, seed=1, shard_items=2
+        )
+        readers.append(ShardReader(destination))
+
+    assert len(readers[0]) == len(readers[1]) == 3
+    assert readers[0].metadata(2)["item"] == 2
+    for item in range(3):
+        assert np.array_equal(readers[0][item].frames, readers[1][item].frames)
+
+
+def test_loudness_is_measured_once_with_workers(tmp_path, make_wav, monkeypatch):
+    """Test if the parent measures every source once before the workers start."""
+    sources, paths = [], []
+    for name in ["music", "speech"]:
+        for j in range(2):
+            paths.append(str(make_wav(f"{name}/{j}.wav", 3.0, seed=j)))
+        sources.append(tmp_path / name)
+    log = tmp_path / "measured.txt"
+    measure_file = sound_merge.loudness.measure_file
+
+    def logged_measure_file(audio_file, *args):
+        with log.open("a") as f:
+            f.write(f"{audio_file}\n")
+        return measure_file(audio_file, *args)
+
+    monkeypatch.setattr(sound_merge.loudness, "measure_file", logged_measure_file)
+    pipeline = {
+        "pull": {"step": "PullRandomExcerpts", "len_s": 1, "min_dBFS": -60},
+        "steps": [{"step": "MixSegments"}],
+    }
+    destination = tmp_path / "out"
+    destination.mkdir()
+    produce_benchmark(
+        sources, destination, 4, workers=2, seed=2, chunksize=1, pipeline=pipeline
+    )
+
+    measured = log.read_text().splitlines()
+    assert sorted(measured) == paths
+    assert len(list(destination.glob("*.wav"))) == 4
+
+
+def test_replay_benchmark_is_bit_exact(tmp_path, make_wav):
+    """Test if replaying an item from the manifest reproduces the original file."""
+    sources = []
+    for i, name in enumerate(["music", "speech"]):
+        for j in range(3):
+            make_wav(f"{name}/{j}.wav", 12.0 + j, seed=10 * i + j)
+        sources.append(tmp_path / name)
+    destination = tmp_path / "out"
+    destination.mkdir()
+    produce_benchmark(sources, destination, 3, seed=5)
+
+    manifest_path = destination / MANIFEST_FILENAME
+    [row] = read_manifest(manifest_path, [1])
+    assert row["file"] == "mixed_audio_1.wav"
+    assert [source["path"] for source in row["sources"]][0].startswith(str(sources[0]))
+    assert all(source["start_frame"] >= 0 for source in row["sources"])
+
+    replayed = tmp_path / "replayed"
+    replayed.mkdir()
+    [dest_file] = replay_benchmark(manifest_path, sources, replayed, items=[1])
+    assert dest_file.read_bytes() == (destination / row["file"]).read_bytes()
+
+    make_wav(row["sources"][0]["path"], 12.5, seed=99)
+    with pytest.raises(ValueError):
+        replay_benchmark(manifest_path, sources, replayed, items=[1])
+
+
+def test_replay_of_a_cached_run_without_cache(tmp_path, make_wav):
+    """Test if a run with the decoded-audio cache replays without one."""
+    sources = []
+    for i, name in enumerate(["music", "speech"]):
+        for j in range(2):
+            make_wav(f"{name}/{j}.wav", 3.0 + j, seed=10 * i + j)
+        sources.append(tmp_path / name)
+    pipeline = {
+        "pull": {"step": "PullAudioSegments"},
+        "steps": [
+            {"step": "RandomSegment", "len_s": 1},
+            {"step": "NormalizeSegments", "target_dBFS": -30},
+            {"step": "WeightedMixSegments"},
+        ],
+    }
+    destination = tmp_path / "out"
+    destination.mkdir()
+    produce_benchmark(
+        sources, destination, 2, seed=3, cache_bytes=2**24, pipeline=pipeline
+    )
+
+    manifest_path = destination / MANIFEST_FILENAME
+    [row] = read_manifest(manifest_path, [1])
+    assert all(source["path"] for source in row["sources"])
+    replayed = tmp_path / "replayed"
+    replayed.mkdir()
+    [dest_file] = replay_benchmark(
+        manifest_path, sources, replayed, items=[1], pipeline=pipeline
+    )
+    assert dest_file.read_bytes() == (destination / row["file"]).read_bytes()
+
+
+def test_sources_are_recorded_without_memmap(tmp_path, make_wav):
+    """Test if excerpts read without memmap record their source and applied gain."""
+    path = make_wav("speech/0.wav", 3.0)
+    records = []
+    for memmap in (True, False):
+        random.seed(4)
+        segments = PullRandomExcerpts(len_s=1, memmap=memmap)([tmp_path / "speech"])
+        level = segments[0].dBFS
+        record = RecordSources()
+        record(NormalizeSegments(-30)(segments))
+        [source] = record.provenance()["sources"]
+        assert source["path"] == str(path) and source["start_frame"] >= 0
+        assert source["gain_db"] == pytest.approx(-30 - level, abs=1e-3)
+        records.append(source)
+    assert records[0]["start_frame"] == records[1]["start_frame"]
+
+
+def test_sources_are_recorded_after_harmonizing(tmp_path, make_wav):
+    """Test if resampled and remixed excerpts record their position in the file."""
+    paths = [
+        make_wav("music/0.wav", 3.0, frame_rate=44100, channels=2),
+        make_wav("speech/0.wav", 3.0, frame_rate=16000, seed=1),
+    ]
+    random.seed(2)
+    segments = PullRandomExcerpts(len_s=2, memmap=True)(
+        [tmp_path / "music", tmp_path / "speech"]
+    )
+    starts = [segment.source.start_frame for segment in segments]
+    harmonized = HarmonizeSegments(frame_rate=16000)(segments)
+    record = RecordSources()
+    record([segment[500:1500] for segment in harmonized])
+
+    sources = record.provenance()["sources"]
+    assert [source["path"] for source in sources] == [str(path) for path in paths]
+    assert [source["start_frame"] for source in sources] == [
+        starts[0] + 22050,
+        starts[1] + 8000,
+    ]
+    assert [source["n_frames"] for source in sources] == [16000, 16000]
@@ -0,0 +1,65 @@
+"""Tests for the cache module."""
+
+import numpy as np
+
+from sound_merge.cache import DecodedAudioCache
+from sound_merge.reader import SourceRef
+from sound_merge.segment import ArraySegment
+
+
+def _loader(n_frames: int):
+    return lambda: ArraySegment(np.zeros((n_frames, 1), dtype=np.float32), 1000)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    """Test if the cache counts hits and evicts the least recently used entry."""
+    paths = [tmp_path / f"{i}.wav" for i in range(3)]
+    for path in paths:
+        path.write_bytes(b"")
+    cache = DecodedAudioCache(max_bytes=2 * 400)
+
+    cache.get_or_load(paths[0], _loader(100))
+    cache.get_or_load(paths[1], _loader(100))
+    cache.get_or_load(paths[0], _loader(100))
+    cache.get_or_load(paths[2], _loader(100))
+
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.evictions) == (1, 3, 1)
+    assert cache.size_bytes == 800
+    cache.get_or_load(paths[0], _loader(100))
+    assert cache.stats.hits == 2
+
+
+def test_cache_shares_spilled_audio(tmp_path):
+    """Test if a second cache with the same spill_dir loads instead of decoding."""
+    path = tmp_path / "a.wav"
+    path.write_bytes(b"")
+    DecodedAudioCache(max_bytes=0, spill_dir=tmp_path / "spill").get_or_load(
+        path, _loader(10)
+    )
+
+    other = DecodedAudioCache(max_bytes=1000, spill_dir=tmp_path / "spill")
+
+    def fail():
+        raise AssertionError("decoded again")
+
+    segment = other.get_or_load(path, fail)
+    assert segment.frame_count() == 10
+    assert other.stats.spill_hits == 1
+
+
+def test_spilled_audio_keeps_its_source(tmp_path):
+    """Test if a spill hit returns the source position of the decoded segment."""
+    paths = [tmp_path / "a.wav", tmp_path / "b.wav"]
+    for path in paths:
+        path.write_bytes(b"")
+    samples = np.zeros((10, 1), dtype=np.float32)
+    cache = DecodedAudioCache(max_bytes=0, spill_dir=tmp_path / "spill")
+    cache.get_or_load(
+        paths[0], lambda: ArraySegment(samples, 1000, source=SourceRef(paths[0], 0))
+    )
+    cache.get_or_load(paths[1], _loader(10))
+
+    other = DecodedAudioCache(max_bytes=1000, spill_dir=tmp_path / "spill")
+    assert other.get_or_load(paths[0], _loader(10)).source == SourceRef(paths[0], 0)
+    assert other.get_or_load(paths[1], _loader(10)).source is None
+    assert other.stats.spill_hits == 2
@@ -0,0 +1,40 @@
+"""Tests for the dataset module."""
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from sound_merge.callables import HarmonizeSegments, PullRandomExcerpts  # noqa: E402
+from sound_merge.dataset import MixtureDataset  # noqa: E402
+
+
+def _dataset(tmp_path, make_wav, **kwargs) -> MixtureDataset:
+    sources = []
+    for i, name in enumerate(["music", "speech"]):
+        for j in range(4):
+            make_wav(f"{name}/{j}.wav", 2.0, frame_rate=8000 * (i + 1), seed=10 * i + j)
+        sources.append(tmp_path / name)
+    return MixtureDataset(
+        sources,
+        PullRandomExcerpts(len_s=1.0),
+        segment_steps=[HarmonizeSegments(frame_rate=8000)],
+        **kwargs,
+    )
+
+
+def test_dataset_yields_mixture_and_stems(tmp_path, make_wav):
+    """Test if the dataset yields reproducible mixture and stem tensors."""
+    dataset = _dataset(tmp_path, make_wav, seed=3, n_items=3)
+    items = list(dataset)
+    assert len(items) == 3
+    mixture, stems = items[0]
+    assert mixture.shape == (1, 8000) and stems.shape == (2, 1, 8000)
+    assert mixture.dtype == stems.dtype == torch.float32
+    assert all(torch.equal(a[0], b[0]) for a, b in zip(items, dataset))
+
+
+def test_dataset_workers_split_items(tmp_path, make_wav):
+    """Test if data loader workers produce every item exactly once."""
+    dataset = _dataset(tmp_path, make_wav, n_items=5)
+    loader = torch.utils.data.DataLoader(dataset, batch_size=None, num_workers=2)
+    assert len(list(loader)) == 5
@@ -0,0 +1,40 @@
+"""Tests for the import cost of the generation modules."""
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+# generous for slow machines, importing the modules took about 0.3 s here against
+# 1.7 s when they imported matplotlib and scipy
+IMPORT_BUDGET_S = 1.0
+HEAVY_MODULES = ["matplotlib", "scipy", "mutagen", "torch"]
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import sound_merge.benchmark, sound_merge.callables, sound_merge.cli
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def test_generation_modules_import_fast():
+    """Test if a worker imports the pipeline without plotting or analysis modules."""
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT], capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.splitlines()[-1])
+
+    loaded = [name for name in HEAVY_MODULES if name in result["modules"]]
+    assert loaded == []
+    assert result["elapsed"] < IMPORT_BUDGET_S
+
+
+def test_plotting_functions_are_still_reachable_from_augm():
+    """Test if the plotting functions moved out of augm can still be imported from it."""
+    pytest.importorskip("matplotlib")
+    from sound_merge import augm, plotting
+
+    assert augm.display_waveform is plotting.display_waveform
@@ -0,0 +1,79 @@
+"""Tests for the index module."""
+
+import os
+
+import pytest
+
+from sound_merge.index import INDEX_FILENAME, SourceIndex
+
+
+def test_index_build_and_filter(tmp_path, make_wav):
+    """Test if the index finds audio files in subdirectories and skips other files."""
+    make_wav("a.wav", 1.0)
+    make_wav("sub/b.wav", 3.0, frame_rate=8000, channels=2)
+    (tmp_path / "notes.txt").write_text("not audio")
+    (tmp_path / ".hidden.wav").write_bytes(b"")
+
+    index = SourceIndex.open(tmp_path)
+
+    assert [entry.path for entry in index.entries] == ["a.wav", "sub/b.wav"]
+    long_entry = index.entries[1]
+    assert (long_entry.frame_rate, long_entry.channels, long_entry.sample_width) == (
+        8000,
+        2,
+        2,
+    )
+    assert long_entry.duration_s == pytest.approx(3.0)
+    assert [entry.path for entry in index.filter(min_duration_s=2)] == ["sub/b.wav"]
+    assert (tmp_path / INDEX_FILENAME).exists()
+
+
+def test_index_refresh_is_incremental(tmp_path, make_wav):
+    """Test if refresh only reports changes when files are added, modified or removed."""
+    make_wav("a.wav", 1.0)
+    SourceIndex.open(tmp_path)
+
+    index = SourceIndex(tmp_path)
+    assert index.load()
+    assert not index.refresh()
+
+    path = make_wav("a.wav", 2.0)
+    os.utime(path, ns=(0, 1))
+    make_wav("c.wav", 1.0)
+    assert index.refresh()
+    assert [entry.duration_s for entry in index.entries] == pytest.approx([2.0, 1.0])
+
+    (tmp_path / "c.wav").unlink()
+    assert index.refresh()
+    assert len(index) == 1
+
+
+def test_index_choice_shards(tmp_path, make_wav):
+    """Test if shards choose from disjoint files and empty shards use all files."""
+    for i in range(4):
+        make_wav(f"{i}.wav", 1.0)
+    index = SourceIndex.open(tmp_path)
+
+    chosen = [{index.choice(shard=(i, 2)).path for _ in range(50)} for i in range(2)]
+    assert chosen == [{"0.wav", "2.wav"}, {"1.wav", "3.wav"}]
+    assert index.choice(shard=(5, 6)).path in {f"{i}.wav" for i in range(4)}
+
+
+def test_index_skips_symlinked_and_unreadable_directories(
+    tmp_path, make_wav, monkeypatch
+):
+    """Test if symlink cycles are not followed and unreadable directories skipped."""
+    make_wav("a.wav", 1.0)
+    make_wav("locked/b.wav", 1.0)
+    make_wav("sub/c.wav", 1.0)
+    (tmp_path / "sub" / "loop").symlink_to(tmp_path, target_is_directory=True)
+    scandir = os.scandir
+
+    def failing_scandir(path):
+        if os.path.basename(path) == "locked":
+            raise PermissionError(13, "Permission denied", path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", failing_scandir)
+    index = SourceIndex.open(tmp_path)
+    assert [entry.path for entry in index.entries] == ["a.wav", "sub/c.wav"]
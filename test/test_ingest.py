@@ -0,0 +1,66 @@
+"""Tests for the ingest module."""
+
+from sound_merge.index import SourceIndex
+from sound_merge.ingest import (
+    JOURNAL_FILENAME,
+    IngestJournal,
+    IngestStats,
+    Ingestor,
+    TargetFormat,
+)
+from sound_merge.probe import probe
+
+
+def test_ingest_copies_indexes_and_resumes(tmp_path, make_wav):
+    """Test if a second run skips every copied file and the index needs no probing."""
+    make_wav("libri/a/1.wav", 1.0)
+    make_wav("libri/b/2.wav", 2.0, seed=1)
+    make_wav("musan/3.wav", 1.5, seed=2)
+    (tmp_path / "musan" / "README.txt").write_text("not audio")
+    dest = tmp_path / "speech"
+
+    ingest = Ingestor(dest, workers=2)
+    assert ingest([tmp_path / "libri", tmp_path / "musan"]) == IngestStats(copied=3)
+    assert sorted(path.name for path in dest.glob("*.wav")) == [
+        "1.wav",
+        "2.wav",
+        "3.wav",
+    ]
+
+    index = SourceIndex(dest)
+    assert index.load()
+    assert not index.refresh()
+    assert [entry.path for entry in index.entries] == ["1.wav", "2.wav", "3.wav"]
+
+    assert ingest([tmp_path / "libri", tmp_path / "musan"]) == IngestStats(skipped=3)
+    make_wav("libri/b/2.wav", 2.5, seed=3)
+    assert ingest([tmp_path / "libri", tmp_path / "musan"]) == IngestStats(
+        copied=1, skipped=2
+    )
+    assert probe(dest / "2.wav").duration_s == 2.5
+
+
+def test_ingest_skips_existing_copies_without_journal(tmp_path, make_wav):
+    """Test if copies are recognized by their content without the journal."""
+    make_wav("src/1.wav", 1.0)
+    dest = tmp_path / "dest"
+    Ingestor(dest)([tmp_path / "src"])
+    (dest / JOURNAL_FILENAME).unlink()
+    (dest / "1.wav").touch()
+
+    stats = Ingestor(dest, check_hash=True)([tmp_path / "src"])
+    assert stats == IngestStats(skipped=1)
+    with IngestJournal(dest / JOURNAL_FILENAME) as journal:
+        assert journal.get(tmp_path / "src" / "1.wav")
+
+
+def test_ingest_converts_to_target_format(tmp_path, make_wav):
+    """Test if files in another format are converted and matching ones copied."""
+    make_wav("src/stereo.wav", 1.0, frame_rate=44100, channels=2)
+    make_wav("src/mono.wav", 1.0, frame_rate=16000)
+    dest = tmp_path / "dest"
+
+    stats = Ingestor(dest, target=TargetFormat(16000, 1))([tmp_path / "src"])
+    assert stats == IngestStats(copied=1, converted=1)
+    info = probe(dest / "stereo.wav")
+    assert (info.frame_rate, info.channels, info.n_frames) == (16000, 1, 16000)
@@ -0,0 +1,103 @@
+"""Tests for the loudness module."""
+
+import random
+
+from loguru import logger
+import pytest
+from pydub import AudioSegment  # type: ignore
+
+from sound_merge.callables import (
+    NormalizeSegments,
+    PullRandomExcerpts,
+    RandomSilenceMask,
+)
+from sound_merge.loudness import LoudnessStore
+from sound_merge.uniform import get_percentile_dBFS
+
+
+def test_store_matches_decoded_levels(tmp_path, make_wav):
+    """Test if file and window levels from the store match the decoded audio."""
+    path = make_wav("a.wav", 4.0, channels=2, leading_silence_s=2.0)
+    make_wav("b.wav", 1.0, amplitude=0.1)
+    audio = AudioSegment.from_file(path)
+
+    store = LoudnessStore.open(tmp_path, hop_s=0.5)
+
+    assert store.file_dBFS(path) == pytest.approx(audio.dBFS, abs=0.01)
+    assert store.window_dBFS(path, 0, 32000) == -float("inf")
+    assert store.window_dBFS(path, 40000, 16000) == pytest.approx(
+        audio[2500:3500].dBFS, abs=0.01
+    )
+    assert get_percentile_dBFS(
+        [path, tmp_path / "b.wav"], 0.0, stores=[store]
+    ) == pytest.approx(AudioSegment.from_file(tmp_path / "b.wav").dBFS, abs=0.01)
+
+    reopened = LoudnessStore(store.index, hop_s=0.5)
+    assert reopened.load() and not reopened.refresh()
+
+
+def test_steps_use_store_lookups(tmp_path, make_wav):
+    """Test if quiet excerpts are drawn again and gains come from the store."""
+    make_wav("a.wav", 10.0, leading_silence_s=9.0)
+    store = LoudnessStore.open(tmp_path, hop_s=0.5)
+
+    puller = PullRandomExcerpts(len_s=1, memmap=True, min_dBFS=-60, max_tries=1000)
+    excerpts = [puller([tmp_path])[0] for _ in range(20)]
+    assert all(excerpt.source.start_frame >= 8 * 16000 for excerpt in excerpts)
+
+    normalized = NormalizeSegments(target_dBFS=-20, loudness=[store])(excerpts)
+    assert [segment.dBFS for segment in normalized] == pytest.approx(
+        [-20] * 20, abs=0.5
+    )
+
+
+def test_excerpts_are_drawn_from_active_windows(tmp_path, make_wav):
+    """Test if min_activity only draws excerpts from the active part of a file."""
+    make_wav("a.wav", 20.0, leading_silence_s=12.0)
+    store = LoudnessStore.open(tmp_path, hop_s=0.5)
+    starts, hop_frames = store.active_starts(
+        tmp_path / "a.wav", 4 * 16000, 16 * 16000, threshold_dBFS=-50
+    )
+    assert hop_frames == 8000
+    assert list(starts) == list(range(12 * 16000, 16 * 16000 + 1, 8000))
+
+    puller = PullRandomExcerpts(
+        len_s=4, memmap=True, loudness_hop_s=0.5, min_activity=1.0
+    )
+    excerpts = [puller([tmp_path])[0] for _ in range(20)]
+    assert all(excerpt.source.start_frame >= 12 * 16000 for excerpt in excerpts)
+    assert all(excerpt.frame_count() == 4 * 16000 for excerpt in excerpts)
+
+
+def test_masked_excerpts_are_normalized_by_their_samples(tmp_path, make_wav):
+    """Test if excerpts masked with silence reach the target despite the store."""
+    make_wav("a.wav", 4.0)
+    store = LoudnessStore.open(tmp_path, hop_s=0.5)
+    random.seed(3)
+    excerpts = PullRandomExcerpts(len_s=2, memmap=True)([tmp_path, tmp_path])
+    masked = RandomSilenceMask(total_silence_ms=800, silence_interval_ms=400)(excerpts)
+
+    assert all(segment.source is None for segment in masked)
+    assert [segment.origin for segment in masked] == [
+        segment.source for segment in excerpts
+    ]
+    normalized = NormalizeSegments(target_dBFS=-20, loudness=[store])(masked)
+    assert [segment.dBFS for segment in normalized] == pytest.approx(
+        [-20, -20], abs=1e-3
+    )
+
+
+def test_unmet_thresholds_warn_once(tmp_path, make_wav):
+    """Test if excerpts that never reach min_dBFS are used with a single warning."""
+    make_wav("a.wav", 3.0, amplitude=0.001)
+    LoudnessStore.open(tmp_path, hop_s=0.5)
+    messages: list = []
+    handler = logger.add(messages.append, level="WARNING")
+    try:
+        puller = PullRandomExcerpts(len_s=1, memmap=True, min_dBFS=-20, max_tries=3)
+        excerpts = [puller([tmp_path])[0] for _ in range(3)]
+    finally:
+        logger.remove(handler)
+
+    assert all(len(excerpt) == 1000 for excerpt in excerpts)
+    assert len(messages) == 1 and "3 tries" in messages[0]
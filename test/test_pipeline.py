@@ -0,0 +1,48 @@
+"""Tests for the pipeline module."""
+
+import random
+import time
+
+import numpy as np
+
+from sound_merge.callables import FileBasedPipelineStep, PullRandomExcerpts
+from sound_merge.pipeline import StreamingPipeline
+from sound_merge.segment import ArraySegment
+
+
+class RandomLevels(FileBasedPipelineStep):
+    """File step without a plan/load split that draws while it loads."""
+
+    def __call__(self, source_dirs):
+        time.sleep(0.002)
+        return [
+            ArraySegment(np.full((10, 1), random.random(), np.float32), 1000)
+            for _ in source_dirs
+        ]
+
+
+def _sequential(file_step, source_dirs, seeds):
+    items = []
+    for seed in seeds:
+        random.seed(seed)
+        items.append(file_step(source_dirs))
+    return items
+
+
+def test_streaming_matches_sequential_runs(tmp_path, make_wav):
+    """Test if streamed items equal sequential ones, with and without a load split."""
+    make_wav("a/0.wav", 2.0)
+    make_wav("a/1.wav", 3.0, seed=1)
+    seeds = list(range(12))
+    assert not RandomLevels.splits_load() and PullRandomExcerpts.splits_load()
+
+    for file_step in (RandomLevels(), PullRandomExcerpts(len_s=0.5, memmap=True)):
+        stream = StreamingPipeline(file_step, [], prefetch=4, loaders=3)
+        streamed = list(stream([tmp_path / "a"], seeds))
+        expected = _sequential(file_step, [tmp_path / "a"], seeds)
+        for items, reference in zip(streamed, expected):
+            for segment, other in zip(items, reference):
+                assert np.array_equal(
+                    ArraySegment.from_audio(segment).samples,
+                    ArraySegment.from_audio(other).samples,
+                )
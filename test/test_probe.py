@@ -0,0 +1,33 @@
+"""Tests for the probe module."""
+
+import pytest
+
+from sound_merge.probe import WAVE_FORMAT_PCM, check_format, probe
+
+
+def test_probe_reads_wav_header(make_wav):
+    """Test if probe reads the format of a WAV file from its header."""
+    path = make_wav("a.wav", 1.5, frame_rate=22050, channels=2, sample_width=2)
+    info = probe(path)
+    assert info is not None
+    assert (info.frame_rate, info.channels, info.sample_width) == (22050, 2, 2)
+    assert info.format_tag == WAVE_FORMAT_PCM
+    assert info.data_offset == 44
+    assert info.duration_s == pytest.approx(1.5)
+    assert info.is_seekable
+
+
+def test_probe_rejects_non_audio(tmp_path):
+    """Test if probe returns None for files that are not audio."""
+    path = tmp_path / "notes.txt"
+    path.write_text("not audio")
+    assert probe(path) is None
+
+
+def test_check_format(make_wav):
+    """Test if check_format filters by duration, frame rate and channels."""
+    info = probe(make_wav("a.wav", 2.0, frame_rate=16000, channels=1))
+    assert check_format(info, min_duration_s=2.0, frame_rate=16000, channels=1)
+    assert not check_format(info, min_duration_s=2.5)
+    assert not check_format(info, frame_rate=44100)
+    assert not check_format(info, channels=2)
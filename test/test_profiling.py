@@ -0,0 +1,133 @@
+"""Tests for the profiling module."""
+
+import json
+import tracemalloc
+
+import numpy as np
+
+from sound_merge.benchmark import produce_benchmark
+from sound_merge.callables import (
+    NormalizeSegments,
+    PullAudioSegments,
+    ToArraySegments,
+)
+from sound_merge.profiling import (
+    audio_bytes,
+    disable_profiling,
+    enable_profiling,
+    get_profiler,
+    stage,
+)
+from sound_merge.segment import ArraySegment
+
+
+class LoudNormalize(NormalizeSegments):
+    def __call__(self, audio_segments):
+        return super().__call__(audio_segments)
+
+
+def _segments() -> list[ArraySegment]:
+    return [ArraySegment(np.full((800, 1), 0.1, dtype=np.float32), 8000)] * 2
+
+
+def test_steps_are_timed_only_while_enabled():
+    """Test if step calls are stages when enabled, once even through super()."""
+    NormalizeSegments(-14)(_segments())
+    assert get_profiler() is None
+
+    profiler = enable_profiling(trace_allocations=True)
+    try:
+        LoudNormalize(-14)(ToArraySegments()(_segments()))
+        profiler.count_item(_segments()[0])
+    finally:
+        assert disable_profiling() is profiler
+
+    stats = {stats.stage: stats for stats in profiler.stats()}
+    assert sorted(stats) == ["LoudNormalize", "ToArraySegments"]
+    assert stats["LoudNormalize"].calls == 1
+    assert stats["LoudNormalize"].bytes_in == stats["LoudNormalize"].bytes_out == 6400
+    assert stats["LoudNormalize"].alloc_peak > 0
+    assert "1 items" in profiler.report()
+
+
+def test_steps_accept_keyword_arguments(tmp_path, make_wav):
+    """Test if profiled steps can be called with keyword arguments only."""
+    make_wav("speech/0.wav", 1.0)
+    profiler = enable_profiling()
+    try:
+        segments = PullAudioSegments()(source_dirs=[tmp_path / "speech"])
+        normalized = NormalizeSegments(-14)(audio_segments=segments)
+    finally:
+        disable_profiling()
+
+    assert len(normalized) == 1
+    stats = {stats.stage: stats for stats in profiler.stats()}
+    assert stats["NormalizeSegments"].bytes_in == audio_bytes(segments)
+
+
+def test_nested_stages_keep_the_outer_peak():
+    """Test if a nested stage does not hide the allocation peak of the outer one."""
+    profiler = enable_profiling(trace_allocations=True)
+    try:
+        with stage("outer"):
+            buffer = np.ones(2**20)
+            del buffer
+            with stage("inner"):
+                np.ones(2**10)
+    finally:
+        disable_profiling()
+
+    stats = {stats.stage: stats for stats in profiler.stats()}
+    assert stats["outer"].alloc_peak >= 8 * 2**20
+    assert stats["inner"].alloc_peak < 2**20
+
+
+def test_produce_benchmark_profile_export(tmp_path, make_wav):
+    """Test if the stages of the pool workers are merged into the exported profile."""
+    sources = []
+    for name in ["music", "speech"]:
+        make_wav(f"{name}/0.wav", 11.0)
+        sources.append(tmp_path / name)
+    destination = tmp_path / "out"
+    destination.mkdir()
+
+    export = tmp_path / "profile.json"
+    produce_benchmark(
+        sources, destination, 2, workers=2, profile=True, profile_export=export
+    )
+    summary = json.loads(export.read_text())
+    assert summary["items"] == 2 and summary["audio_s"] == 20.0
+    calls = {stats["stage"]: stats["calls"] for stats in summary["stages"]}
+    assert calls["PullRandomExcerpts.plan"] == calls["WeightedMixSegments"] == 2
+    assert calls["export"] == 2
+
+    prometheus = tmp_path / "profile.prom"
+    produce_benchmark(sources, destination, 1, profile=True, profile_export=prometheus)
+    text = prometheus.read_text()
+    assert "sound_merge_items_total 1" in text
+    assert 'sound_merge_stage_calls_total{stage="NormalizeSegments"} 1' in text
+    assert get_profiler() is None
+
+
+def test_produce_benchmark_traces_allocations(tmp_path, make_wav):
+    """Test if trace_allocations profiles the allocation peaks of the workers."""
+    sources = []
+    for name in ["music", "speech"]:
+        make_wav(f"{name}/0.wav", 11.0)
+        sources.append(tmp_path / name)
+    destination = tmp_path / "out"
+    destination.mkdir()
+
+    export = tmp_path / "profile.json"
+    produce_benchmark(
+        sources,
+        destination,
+        2,
+        workers=2,
+        trace_allocations=True,
+        profile_export=export,
+    )
+    stages = json.loads(export.read_text())["stages"]
+    peaks = {stats["stage"]: stats["alloc_peak"] for stats in stages}
+    assert peaks["WeightedMixSegments"] > 0
+    assert get_profiler() is None and not tracemalloc.is_tracing()
@@ -0,0 +1,43 @@
+"""Tests for the reader module."""
+
+import numpy as np
+import pytest
+from pydub import AudioSegment  # type: ignore
+
+from sound_merge.probe import probe
+from sound_merge.reader import MappedAudio, as_float32, read_segment
+
+
+@pytest.mark.parametrize("sample_width,channels", [(1, 1), (2, 2), (4, 1)])
+def test_read_segment_matches_full_decode(make_wav, sample_width, channels):
+    """Test if a seeked frame range equals the same range of the fully decoded file."""
+    path = make_wav("a.wav", 2.0, channels=channels, sample_width=sample_width)
+    info = probe(path)
+
+    excerpt = read_segment(path, info, start_frame=1000, n_frames=8000)
+    full = AudioSegment.from_file(path)
+
+    assert excerpt.frame_count() == 8000
+    assert excerpt.raw_data == full.get_sample_slice(1000, 9000).raw_data
+
+
+def test_read_segment_clips_at_end_of_file(make_wav):
+    """Test if a range past the end of the file is cut at the last frame."""
+    path = make_wav("a.wav", 1.0)
+    info = probe(path)
+    excerpt = read_segment(path, info, start_frame=info.n_frames - 100, n_frames=1000)
+    assert excerpt.frame_count() == 100
+
+
+def test_mapped_audio_is_a_view(make_wav):
+    """Test if MappedAudio slices share memory with the mapping and match pydub."""
+    path = make_wav("a.wav", 2.0, channels=2)
+    mapped = MappedAudio.from_file(path, probe(path))
+    full = AudioSegment.from_file(path)
+
+    excerpt = mapped[500:1500]
+    assert len(mapped) == len(full) == 2000
+    assert np.shares_memory(excerpt.frames, mapped.frames)
+    assert excerpt.frames.tobytes() == full[500:1500].raw_data
+    assert excerpt.dBFS == pytest.approx(full[500:1500].dBFS, abs=1e-3)
+    assert np.array_equal(as_float32(excerpt), as_float32(full[500:1500]))
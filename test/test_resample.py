@@ -0,0 +1,60 @@
+"""Tests for the resample module."""
+
+import numpy as np
+import pytest
+from pydub import AudioSegment  # type: ignore
+
+from sound_merge.callables import HarmonizeSegments
+from sound_merge.resample import convert_channels, resample, resample_filter
+from sound_merge.segment import ArraySegment
+
+
+def _sine(frequency: float, frame_rate: int, duration_s: float = 1.0) -> np.ndarray:
+    t = np.arange(int(duration_s * frame_rate)) / frame_rate
+    return (0.5 * np.sin(2 * np.pi * frequency * t)).astype(np.float32)[:, np.newaxis]
+
+
+def test_resample_keeps_tone_and_caches_filter():
+    """Test if resampling keeps the level of a tone and designs the filter once."""
+    resample_filter.cache_clear()
+    samples = _sine(440, 44100)
+    for _ in range(2):
+        resampled = resample(samples, 44100, 16000)
+    assert resampled.shape == (16000, 1) and resampled.dtype == np.float32
+    assert np.sqrt(np.mean(resampled[1000:-1000] ** 2)) == pytest.approx(
+        0.5 / np.sqrt(2), rel=1e-2
+    )
+    assert resample_filter.cache_info().misses == 1
+
+
+def test_resample_removes_aliases():
+    """Test if a tone above the new Nyquist frequency is filtered out."""
+    resampled = resample(_sine(12000, 44100), 44100, 16000)
+    assert np.abs(resampled[1000:-1000]).max() < 0.01
+
+
+def test_convert_channels():
+    """Test if mono is repeated, layouts are averaged to mono and others rejected."""
+    stereo = np.array([[1.0, 0.0], [0.5, 0.5]], dtype=np.float32)
+    assert convert_channels(stereo, 1)[:, 0].tolist() == [0.5, 0.5]
+    assert convert_channels(stereo[:, :1], 2).tolist() == [[1.0, 1.0], [0.5, 0.5]]
+    with pytest.raises(ValueError):
+        convert_channels(stereo, 3)
+
+
+def test_harmonize_segments(make_wav):
+    """Test if all segments are converted to the target format."""
+    segments = [
+        AudioSegment.from_file(make_wav("a.wav", 1.0, frame_rate=16000)),
+        AudioSegment.from_file(make_wav("b.wav", 1.0, frame_rate=44100, channels=2)),
+    ]
+    harmonized = HarmonizeSegments(frame_rate=22050, channels=2)(segments)
+    assert all(isinstance(segment, ArraySegment) for segment in harmonized)
+    assert [(s.frame_rate, s.channels, s.frame_count()) for s in harmonized] == [
+        (22050, 2, 22050)
+    ] * 2
+
+    exported = HarmonizeSegments(frame_rate=16000, sample_width=4)(segments)
+    assert [(s.frame_rate, s.channels, s.sample_width) for s in exported] == [
+        (16000, 1, 4)
+    ] * 2
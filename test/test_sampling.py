@@ -0,0 +1,71 @@
+"""Tests for the sampling module."""
+
+import random
+from collections import Counter
+
+import pytest
+
+from sound_merge.callables import PullAudioSegments
+from sound_merge.index import IndexEntry, SourceIndex
+from sound_merge.sampling import AliasTable, SourceSampler
+
+
+def make_entry(path: str, duration_s: float) -> IndexEntry:
+    return IndexEntry(path, 0, 0, 1000, 1, 2, int(1000 * duration_s), 1, 44)
+
+
+def test_alias_table_follows_the_weights():
+    """Test if alias table draws follow the weights and never draw zero weights."""
+    random.seed(0)
+    table = AliasTable([1, 0, 3, 4])
+    counts = Counter(table.draw() for _ in range(40000))
+
+    assert counts[1] == 0
+    for i, weight in [(0, 1), (2, 3), (3, 4)]:
+        assert counts[i] / 40000 == pytest.approx(weight / 8, abs=0.01)
+    with pytest.raises(ValueError):
+        AliasTable([0, 0])
+
+
+def test_sampler_weights_by_duration_and_quotas():
+    """Test if duration weights and stratum quotas set the draw frequencies."""
+    entries = [make_entry("a/short.wav", 1), make_entry("a/long.wav", 3)]
+    entries += [make_entry(f"b/{i}.wav", 1) for i in range(10)]
+    random.seed(1)
+
+    sampler = SourceSampler(
+        entries, weight="duration", strata="directory", quotas={"a": 1, "b": 1}
+    )
+    counts = Counter(sampler.draw().path for _ in range(20000))
+
+    assert sampler.strata == ["a", "b"]
+    assert counts["a/long.wav"] / counts["a/short.wav"] == pytest.approx(3, rel=0.1)
+    in_a = counts["a/short.wav"] + counts["a/long.wav"]
+    assert in_a / 20000 == pytest.approx(0.5, abs=0.02)
+
+
+def test_sampler_without_replacement_draws_epochs():
+    """Test if every entry is drawn once per epoch without replacement."""
+    entries = [make_entry(f"{i}.wav", i + 1) for i in range(5)]
+    random.seed(2)
+    sampler = SourceSampler(entries, weight="duration", replacement=False)
+
+    for _ in range(3):
+        assert sorted(sampler.draw().path for _ in range(5)) == [
+            f"{i}.wav" for i in range(5)
+        ]
+
+
+def test_pull_audio_segments_samples_with_weights(tmp_path, make_wav):
+    """Test if the pull step draws through a sampler and respects its shard."""
+    make_wav("a/0.wav", 0.5)
+    make_wav("a/1.wav", 0.5)
+    make_wav("b/0.wav", 2.0)
+    SourceIndex.open(tmp_path)
+    step = PullAudioSegments(strata="directory", quotas={"b": 1}, memmap=True)
+    random.seed(3)
+
+    paths = {step.plan([tmp_path])[0][0].relative_to(tmp_path) for _ in range(20)}
+    assert {path.as_posix() for path in paths} == {"b/0.wav"}
+    with pytest.raises(ValueError):
+        PullAudioSegments(use_index=False, weight="duration")
@@ -0,0 +1,103 @@
+"""Tests for the segment module."""
+
+import numpy as np
+import pytest
+from pydub import AudioSegment  # type: ignore
+
+from sound_merge.callables import (
+    MixSegments,
+    NormalizeSegments,
+    SNRMixSegments,
+    WeightedMixSegments,
+)
+from sound_merge.segment import ArraySegment, db_to_gain, weighted_sum
+
+
+def test_array_segment_matches_pydub(make_wav):
+    """Test if length, slicing, dBFS and gain agree with AudioSegment."""
+    audio = AudioSegment.from_file(make_wav("a.wav", 2.0, channels=2))
+    segment = ArraySegment.from_audio(audio)
+
+    assert len(segment) == len(audio)
+    assert segment[250:750].frame_count() == audio[250:750].frame_count()
+    assert segment.dBFS == pytest.approx(audio.dBFS, abs=1e-3)
+    assert segment.apply_gain(-6).dBFS == pytest.approx(audio.dBFS - 6, abs=1e-3)
+
+
+def test_weighted_sum_keeps_length_of_first_segment():
+    """Test if weighted_sum pads shorter and cuts longer segments."""
+    first = ArraySegment(np.ones((4, 1), dtype=np.float32), 1000)
+    second = ArraySegment(np.ones((2, 1), dtype=np.float32), 1000)
+    mixed = weighted_sum([first, second], [1.0, 0.5])
+    assert mixed.samples[:, 0].tolist() == [1.5, 1.5, 1.0, 1.0]
+
+    with pytest.raises(ValueError):
+        weighted_sum([first, ArraySegment(first.samples, 2000)], [1.0, 1.0])
+
+
+def test_steps_accept_array_segments(make_wav):
+    """Test if NormalizeSegments and MixSegments process ArraySegments natively."""
+    segments = [
+        ArraySegment.from_audio(AudioSegment.from_file(make_wav(f"{i}.wav", 1.0)))
+        for i in range(2)
+    ]
+    normalized = NormalizeSegments(target_dBFS=-20)(segments)
+    assert all(isinstance(segment, ArraySegment) for segment in normalized)
+    assert [segment.dBFS for segment in normalized] == pytest.approx([-20, -20])
+    mixed = MixSegments()(normalized)
+    assert len(mixed) == 1 and isinstance(mixed[0], ArraySegment)
+
+
+def test_mix_segments_syncs_formats(make_wav):
+    """Test if MixSegments mixes ArraySegments of different rates and channels."""
+    stereo = ArraySegment.from_audio(
+        AudioSegment.from_file(make_wav("a.wav", 1.0, frame_rate=44100, channels=2))
+    )
+    mono = ArraySegment.from_audio(
+        AudioSegment.from_file(make_wav("b.wav", 1.0, frame_rate=16000, seed=1))
+    )
+
+    for segments in ([stereo, mono], [mono, stereo]):
+        (mixed,) = MixSegments()(segments)
+        assert (mixed.frame_rate, mixed.channels) == (44100, 2)
+        assert len(mixed) == 1000
+
+
+def test_weighted_mix_limits_peak_and_syncs_formats():
+    """Test if WeightedMixSegments applies gains, limits the peak and syncs formats."""
+    loud = ArraySegment(np.full((1000, 1), 0.95, dtype=np.float32), 1000)
+    quiet = ArraySegment(np.full((500, 2), 0.1, dtype=np.float32), 500)
+
+    (mixed,) = WeightedMixSegments(gains_db=[0, -6], peak_dBFS=-1)([loud, quiet])
+
+    assert (mixed.frame_rate, mixed.channels, mixed.frame_count()) == (1000, 2, 1000)
+    assert mixed.max_dBFS == pytest.approx(-1, abs=1e-3)
+    with pytest.raises(ValueError):
+        WeightedMixSegments(gains_db=[0])([loud, quiet])
+
+
+def test_snr_mix_reaches_the_drawn_snr():
+    """Test if SNRMixSegments mixes at the drawn SNR and records it."""
+    rng = np.random.default_rng(0)
+    speech = rng.uniform(-0.3, 0.3, (8000, 1)).astype(np.float32)
+    speech[:4000] = 0
+    music = [rng.uniform(-0.5, 0.5, (8000, 1)).astype(np.float32) for _ in range(2)]
+    segments = [ArraySegment(samples, 8000) for samples in [speech, *music]]
+
+    for active_only, speech_part in [(False, slice(None)), (True, slice(4000, None))]:
+        step = SNRMixSegments(snr_db=[5, 15], active_only=active_only, peak_dBFS=0)
+        (mixed,) = step(segments)
+        provenance = step.provenance()
+        assert 5 <= provenance["snr_db"] <= 15
+        assert provenance["realized_snr_db"] == pytest.approx(provenance["snr_db"])
+
+        noise = mixed.samples / db_to_gain(provenance["limiter_db"]) - speech
+        snr = 10 * np.log10(
+            np.mean(np.square(speech[speech_part])) / np.mean(np.square(noise))
+        )
+        assert snr == pytest.approx(provenance["snr_db"], abs=0.5)
+
+    silent = ArraySegment(np.zeros((8000, 1), dtype=np.float32), 8000)
+    step = SNRMixSegments(snr_db=10)
+    step([silent, segments[1]])
+    assert step.provenance()["realized_snr_db"] is None
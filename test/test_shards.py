@@ -0,0 +1,42 @@
+"""Tests for the shards module."""
+
+import pickle
+
+import numpy as np
+import pytest
+from pydub import AudioSegment  # type: ignore
+
+from sound_merge.segment import ArraySegment
+from sound_merge.shards import ShardReader, ShardWriter
+
+
+def _segment(n_frames: int, channels: int, value: float) -> ArraySegment:
+    return ArraySegment(np.full((n_frames, channels), value, dtype=np.float32), 8000)
+
+
+def test_shards_round_trip(tmp_path):
+    """Test if items of different formats are read back by index with their metadata."""
+    segments = [_segment(100 + i, 1 + i % 2, 0.1 * i) for i in range(5)]
+    with ShardWriter(tmp_path, items_per_shard=2) as writer:
+        for i, segment in enumerate(segments):
+            assert writer.write(segment, {"item": i}) == i
+        writer.write(segments[0].to_audio_segment(), {"item": 5})
+
+    assert sorted(path.name for path in tmp_path.glob("*.pcm")) == [
+        "shard-00000.pcm",
+        "shard-00001.pcm",
+        "shard-00002.pcm",
+    ]
+    reader = ShardReader(tmp_path)
+    assert len(reader) == 6
+    for i in (4, 1, 3, 0, 2):
+        item = reader[i]
+        assert (item.frame_count(), item.channels) == (100 + i, 1 + i % 2)
+        assert np.allclose(item.to_float32(), 0.1 * i, atol=1e-4)
+        assert reader.metadata(i) == {"item": i}
+    assert isinstance(reader[-1].to_audio_segment(), AudioSegment)
+    with pytest.raises(IndexError):
+        reader[6]
+
+    copied = pickle.loads(pickle.dumps(reader))
+    assert np.array_equal(copied[3].frames, reader[3].frames)
@@ -0,0 +1,159 @@
+"""Tests for the spec and cli modules."""
+
+import pytest
+
+from sound_merge.callables import SourceGroup
+from sound_merge.cli import main
+from sound_merge.manifest import MANIFEST_FILENAME, read_manifest
+from sound_merge.spec import SpecError, load_spec, parse_spec
+
+SPEC = """
+count = 3
+seed = 4
+
+[[sources]]
+path = "music"
+
+[[sources]]
+paths = ["speech", "noise"]
+weights = [1, 0]
+
+[output]
+directory = "out"
+
+[pull]
+step = "PullRandomExcerpts"
+len_s = 2
+memmap = true
+
+[[steps]]
+step = "RandomSilenceMask"
+total_silence_ms = 300
+silence_interval_ms = 100
+
+[[steps]]
+step = "WeightedMixSegments"
+"""
+
+
+def test_load_spec_resolves_sources(tmp_path, make_wav):
+    """Test if a valid spec resolves paths against its directory and groups sources."""
+    for name in ["music", "speech", "noise"]:
+        make_wav(f"{name}/0.wav", 3.0)
+    spec_path = tmp_path / "spec.toml"
+    spec_path.write_text(SPEC + "\n[profile]\ntrace_allocations = true\n")
+
+    spec = load_spec(spec_path)
+    assert spec.destination == tmp_path / "out"
+    assert spec.benchmark_kwargs()["trace_allocations"] is True
+    assert spec.sources[0] == tmp_path / "music"
+    assert spec.sources[1] == SourceGroup(
+        (tmp_path / "speech", tmp_path / "noise"), (1.0, 0.0)
+    )
+    assert spec.pipeline["steps"][0]["step"] == "RandomSilenceMask"
+
+
+def test_parse_spec_reports_all_errors(tmp_path):
+    """Test if every problem of an invalid spec is reported at once."""
+    data = {
+        "count": 0,
+        "sources": [{"paths": ["missing"], "weights": [1, 2]}],
+        "output": {"directory": "out", "format": "flac"},
+        "pull": {"step": "NormalizeSegments"},
+        "steps": [{"step": "Unknown"}, {"step": "RandomSilenceMask", "typo": 1}],
+    }
+    with pytest.raises(SpecError) as error:
+        parse_spec(data, tmp_path)
+
+    message = str(error.value)
+    for expected in [
+        "count:",
+        "is not a directory",
+        "one non-negative weight per path",
+        "output.format",
+        "pull: NormalizeSegments is not a FileBasedPipelineStep",
+        "Unknown step: Unknown",
+        "unknown parameter typo",
+        "missing parameter total_silence_ms",
+    ]:
+        assert expected in message
+
+
+def test_cli_runs_and_replays_a_spec(tmp_path, make_wav, capsys):
+    """Test if the cli validates a spec, produces its benchmark and replays an item."""
+    for i, name in enumerate(["music", "speech", "noise"]):
+        make_wav(f"{name}/0.wav", 3.0, seed=i)
+    spec_path = tmp_path / "spec.toml"
+    spec_path.write_text(SPEC)
+
+    assert main(["validate", str(spec_path)]) == 0
+    assert main(["run", str(spec_path)]) == 0
+    rows = read_manifest(tmp_path / "out" / MANIFEST_FILENAME)
+    assert len(rows) == 3
+    assert all("speech" in row["sources"][1]["path"] for row in rows)
+    assert all(row["silence_ms"] for row in rows)
+
+    assert main(["replay", str(spec_path), "--items", "2"]) == 0
+    replayed = tmp_path / "out" / "replay" / rows[2]["file"]
+    assert replayed.read_bytes() == (tmp_path / "out" / rows[2]["file"]).read_bytes()
+
+    spec_path.write_text(SPEC.replace("count = 3", "count = -1"))
+    assert main(["validate", str(spec_path)]) == 2
+    assert "count:" in capsys.readouterr().err
+
+
+def test_parse_spec_reports_bad_values_and_shapes(tmp_path):
+    """Test if bad step values, non-table sections and scalar weights are reported."""
+    (tmp_path / "music").mkdir()
+    data = {
+        "count": 1,
+        "sources": ["music", {"paths": ["music"], "weights": 3}],
+        "output": "out",
+        "cache": 1,
+        "pull": {"step": "PullRandomExcerpts", "len_s": "ten"},
+        "steps": [
+            {"step": "SNRMixSegments", "distribution": "laplace"},
+            {"step": "WeightedMixSegments", "gains_db": [0, "loud"]},
+        ],
+    }
+    with pytest.raises(SpecError) as error:
+        parse_spec(data, tmp_path)
+
+    message = str(error.value)
+    for expected in [
+        "output: expected a table",
+        "cache: expected a table",
+        "output.directory: missing",
+        "sources[1]: expected a list of weights",
+        "len_s of PullRandomExcerpts expected float, got 'ten'",
+        "steps[0]: invalid SNRMixSegments",
+        "gains_db of WeightedMixSegments expected",
+    ]:
+        assert expected in message
+
+
+def test_parse_spec_reports_out_of_range_values(tmp_path):
+    """Test if sizes out of range and a pipeline without a final mixer are reported."""
+    (tmp_path / "music").mkdir()
+    data = {
+        "count": 1,
+        "chunksize": 0,
+        "sources": ["music"],
+        "output": {"directory": "out", "shard_items": 0},
+        "cache": {"bytes": -1},
+        "steps": [
+            {"step": "WeightedMixSegments"},
+            {"step": "NormalizeSegments", "target_dBFS": -14},
+        ],
+    }
+    with pytest.raises(SpecError) as error:
+        parse_spec(data, tmp_path)
+
+    message = str(error.value)
+    for expected in [
+        "chunksize: expected at least 1",
+        "output.shard_items: expected at least 1",
+        "cache.bytes: expected a non-negative",
+        "steps[1]: the last step must mix the segments",
+    ]:
+        assert expected in message
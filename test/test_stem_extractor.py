@@ -0,0 +1,59 @@
+"""Tests for the tool_stem_extractor tool."""
+
+import sys
+import wave
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "tools"))
+
+from tool_stem_extractor import DONE_FILENAME, process_stems, sum_stems  # noqa: E402
+
+
+def fake_reader(stem_file: Path, stems: Sequence[int]) -> tuple[np.ndarray, int]:
+    """Stem i of every track is a constant 0.1 * i, track "bad" cannot be read."""
+    if stem_file.name.startswith("bad"):
+        raise ValueError("corrupt stem file")
+    data = np.ones((len(stems), 100, 2), dtype=np.float32)
+    return data * (0.1 * np.array(stems, dtype=np.float32))[:, None, None], 1000
+
+
+def read_wav(path: Path) -> np.ndarray:
+    with wave.open(str(path), "rb") as file:
+        data = np.frombuffer(file.readframes(file.getnframes()), dtype="<i2")
+        return data.reshape(-1, file.getnchannels()) / 32768
+
+
+def test_sum_stems():
+    """Test if stems are summed into one [frames, channels] track."""
+    data = np.arange(12, dtype=np.float32).reshape(3, 2, 2)
+    assert sum_stems(data).tolist() == [[12, 15], [18, 21]]
+
+
+def test_process_stems_names_tracks_and_resumes(tmp_path):
+    """Test if tracks are written under their own names and done tracks are skipped."""
+    stem_dir, output_dir = tmp_path / "musdb18", tmp_path / "out"
+    for name in ["train/A - Song.stem.mp4", "test/B - Tune.stem.mp4", "._A.mp4"]:
+        (stem_dir / name).parent.mkdir(parents=True, exist_ok=True)
+        (stem_dir / name).write_bytes(b"")
+
+    assert process_stems(stem_dir, output_dir, workers=2, reader=fake_reader) == 0
+    assert sorted(path.name for path in output_dir.glob("*.wav")) == [
+        "A - Song.wav",
+        "B - Tune.wav",
+    ]
+    assert np.allclose(read_wav(output_dir / "A - Song.wav"), 0.6, atol=1e-4)
+
+    (stem_dir / "train" / "bad.stem.mp4").write_bytes(b"")
+    (stem_dir / "test" / "C - New.stem.mp4").write_bytes(b"")
+    (output_dir / "A - Song.wav").unlink()
+    assert process_stems(stem_dir, output_dir, workers=2, reader=fake_reader) == 1
+    assert not (output_dir / "A - Song.wav").exists()
+    assert (output_dir / "C - New.wav").exists()
+    assert sorted((output_dir / DONE_FILENAME).read_text().splitlines()) == [
+        "test/B - Tune.stem.mp4",
+        "test/C - New.stem.mp4",
+        "train/A - Song.stem.mp4",
+    ]
@@ -1,7 +1,19 @@
+"""
+Copies the speech and music datasets into the source directories of tool_config.
+
+    python tools/tool_data_organizer.py --workers 16
+    python tools/tool_data_organizer.py --frame-rate 16000 --channels 1
+
+Copies run in a thread pool, an interrupted run resumes from the journal in each
+destination directory and the source indexes are written along the way.
+"""
+
+import argparse
 import os
 import shutil
 import tarfile
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from tool_config import (
@@ -15,8 +27,10 @@ from tool_config import (
     musan_music_src,
 )
 
+from sound_merge.ingest import Ingestor, TargetFormat
 
-# unpack .tar.gz archive
+
+# unpack .tar.gz archive, a gzip stream can only be read sequentially
 def unpack_tar(archive_path, dest_path):
     try:
         with tarfile.open(archive_path, "r:gz") as tar:
@@ -27,11 +41,29 @@ def unpack_tar(archive_path, dest_path):
         logger.error(f"Error during extraction: {e}")
 
 
-# unpack zip archive
-def unpack_zip(archive_path, dest_path):
+def _unpack_members(archive_path, dest_path, members):
+    with zipfile.ZipFile(archive_path, "r") as zip_ref:
+        for member in members:
+            target = Path(dest_path) / member.filename
+            # members already extracted by an interrupted run are skipped
+            if target.is_file() and target.stat().st_size == member.file_size:
+                continue
+            zip_ref.extract(member, dest_path)
+
+
+# unpack zip archive, members are extracted in parallel
+def unpack_zip(archive_path, dest_path, workers: int = 8):
     try:
         with zipfile.ZipFile(archive_path, "r") as zip_ref:
-            zip_ref.extractall(dest_path)
+            members = zip_ref.infolist()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [
+                executor.submit(
+                    _unpack_members, archive_path, dest_path, members[i::workers]
+                )
+                for i in range(workers)
+            ]:
+                future.result()
     except zipfile.error as e:
         logger.error(f"Error reading archive: {e}")
     except OSError as e:
@@ -39,17 +71,8 @@ def unpack_zip(archive_path, dest_path):
 
 
 # copy dir of wav files
-def copy_dir(src_dir: Path, dest_dir: Path, suffix: str):
-    for item in src_dir.iterdir():
-        src_path = src_dir / item.name
-        dest_path = dest_dir / item.name
-        if item.is_file() and item.suffix == f".{suffix}":
-            try:
-                shutil.copy(src_path, dest_path)
-            except shutil.Error as e:
-                logger.error(f"Error copying file: {e}")
-        elif item.is_dir():
-            copy_dir(src_path, dest_dir, suffix)
+def copy_dir(src_dir: Path, dest_dir: Path, suffix: str, **kwargs):
+    Ingestor(dest_dir, suffixes=[f".{suffix}"], **kwargs)([src_dir])
 
 
 # copy file
@@ -62,12 +85,33 @@ def copy_file(src_path: Path, dest_dir: Path, suffix):
             logger.error(f"Error copying file: {e}")
 
 
-# create necessary directories
-os.makedirs(data_dir, exist_ok=True)
-os.makedirs(music_dir_clean, exist_ok=True)
-os.makedirs(music_dir_mixed, exist_ok=True)
-os.makedirs(speech_dir, exist_ok=True)
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--frame-rate", type=int, help="convert to this frame rate")
+    parser.add_argument("--channels", type=int, help="convert to this channel count")
+    parser.add_argument("--sample-width", type=int, help="convert to this many bytes")
+    parser.add_argument(
+        "--check-hash",
+        action="store_true",
+        help="compare existing copies by content instead of size and mtime",
+    )
+    args = parser.parse_args()
+
+    target = None
+    if args.frame_rate or args.channels or args.sample_width:
+        target = TargetFormat(args.frame_rate, args.channels, args.sample_width)
+
+    # create necessary directories
+    os.makedirs(data_dir, exist_ok=True)
+    os.makedirs(music_dir_clean, exist_ok=True)
+    os.makedirs(music_dir_mixed, exist_ok=True)
+    os.makedirs(speech_dir, exist_ok=True)
+
+    options = {"target": target, "workers": args.workers, "check_hash": args.check_hash}
+    Ingestor(speech_dir, **options)([libri_testset_dir, musan_speech_src])
+    Ingestor(music_dir_mixed, **options)([musan_music_src])
+
 
-copy_dir(libri_testset_dir, speech_dir, "wav")
-copy_dir(musan_speech_src, speech_dir, "wav")
-copy_dir(musan_music_src, music_dir_mixed, "wav")
+if __name__ == "__main__":
+    main()
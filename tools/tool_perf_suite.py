@@ -0,0 +1,206 @@
+"""
+Performance suite of the pipeline steps.
+
+Synthesizes WAV fixtures of varied length, frame rate and channel count in a temporary
+directory, times every step on them and reports the real-time factor (seconds of audio
+processed per second), the best of several measurements of at least 100 ms each.
+The results are compared against a stored baseline and the
+script exits with status 1 if a step is slower than the baseline by more than the
+tolerance.
+
+    python tools/tool_perf_suite.py                    # compare against the baseline
+    python tools/tool_perf_suite.py --update-baseline  # store the current results
+
+The baseline depends on the machine, update it when moving the suite to a new one.
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+import tempfile
+import time
+import wave
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+from loguru import logger
+from pydub import AudioSegment  # type: ignore
+
+from sound_merge.augm import mix, random_silence_mask
+from sound_merge.benchmark import produce_benchmark
+from sound_merge.callables import (
+    MixSegments,
+    NormalizeSegments,
+    PullAudioSegments,
+    PullRandomExcerpts,
+    RandomSegment,
+)
+
+BASELINE_PATH = Path(__file__).with_name("perf_baseline.json")
+
+# (directory, frame rate, channels, durations in s) of the fixture files
+FIXTURES = [
+    ("music", 44100, 2, [30, 45, 60, 90, 120]),
+    ("speech", 16000, 1, [5, 10, 20, 30, 40]),
+    ("mixed", 22050, 1, [15, 25, 35, 50, 70]),
+]
+EXCERPT_S = 10
+# minimum wall time of one measurement, fast cases are looped to reach it
+MIN_MEASURE_S = 0.1
+
+
+def write_fixture(path: Path, duration_s: float, frame_rate: int, channels: int, seed):
+    """
+    Writes a 16-bit WAV of noise shaped by a slow envelope, so levels vary over time
+    """
+    rng = np.random.default_rng(seed)
+    n_frames = int(duration_s * frame_rate)
+    envelope = 0.1 + 0.4 * np.abs(np.sin(np.linspace(0, 3 * np.pi, n_frames)))
+    samples = rng.uniform(-1, 1, (n_frames, channels)) * envelope[:, np.newaxis]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with wave.open(str(path), "wb") as file:
+        file.setnchannels(channels)
+        file.setsampwidth(2)
+        file.setframerate(frame_rate)
+        file.writeframes((samples * 32767).astype("<i2").tobytes())
+
+
+def make_fixtures(root: Path) -> list[Path]:
+    directories = []
+    for seed, (name, frame_rate, channels, durations) in enumerate(FIXTURES):
+        for i, duration_s in enumerate(durations):
+            write_fixture(
+                root / name / f"{i}.wav", duration_s, frame_rate, channels, (seed, i)
+            )
+        directories.append(root / name)
+    return directories
+
+
+def build_cases(root: Path, directories: list[Path]) -> dict[str, tuple]:
+    """
+    Returns for every case the function to time and the seconds of audio it processes,
+    None if it is the duration of the segments returned by the function.
+    Inputs are prepared here so only the step itself is timed.
+    """
+    files = sorted(path for directory in directories for path in directory.glob("*"))
+    full = [AudioSegment.from_file(path) for path in files]
+    random.seed(0)
+    excerpts = RandomSegment(EXCERPT_S)(full)
+    pairs = list(zip(excerpts[::2], excerpts[1::2]))
+    excerpts_s = sum(segment.duration_seconds for segment in excerpts)
+    out_dir = root / "out"
+    out_dir.mkdir()
+    n_items = 8
+
+    pull = PullAudioSegments()
+    pull_excerpts = PullRandomExcerpts(len_s=EXCERPT_S, memmap=True)
+    normalize = NormalizeSegments(target_dBFS=-14)
+    mix_step = MixSegments()
+    return {
+        "PullAudioSegments": (
+            lambda: [segment for _ in files for segment in pull(directories)],
+            None,
+        ),
+        "PullRandomExcerpts": (
+            lambda: [segment for _ in files for segment in pull_excerpts(directories)],
+            None,
+        ),
+        "RandomSegment": (lambda: RandomSegment(EXCERPT_S)(full), excerpts_s),
+        "NormalizeSegments": (lambda: normalize(excerpts), excerpts_s),
+        "MixSegments": (
+            lambda: [mix_step(list(pair))[0] for pair in pairs],
+            sum(pair[0].duration_seconds for pair in pairs),
+        ),
+        "augm.mix": (
+            lambda: [mix(*pair) for pair in pairs],
+            sum(pair[0].duration_seconds for pair in pairs),
+        ),
+        "random_silence_mask": (
+            lambda: [
+                random_silence_mask(segment, 2000, 100, 20) for segment in excerpts
+            ],
+            excerpts_s,
+        ),
+        "produce_benchmark": (
+            lambda: produce_benchmark(directories, out_dir, n_items, seed=0),
+            n_items * EXCERPT_S,
+        ),
+    }
+
+
+def time_case(run: Callable, repeats: int) -> tuple[float, float]:
+    """
+    Wall time of one run, the minimum over repeats measurements after a warm-up run,
+    with a fixed seed. Every measurement loops the run for at least MIN_MEASURE_S, so
+    fast cases are not dominated by timer resolution and scheduling noise.
+    Also returns the duration of the segments returned by the warm-up run.
+    """
+    random.seed(0)
+    start = time.perf_counter()
+    output = run()
+    warm_up_s = time.perf_counter() - start
+    output_s = sum(segment.duration_seconds for segment in output or [])
+    loops = max(math.ceil(MIN_MEASURE_S / max(warm_up_s, 1e-6)), 1)
+    times = []
+    for _ in range(repeats):
+        random.seed(0)
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        times.append((time.perf_counter() - start) / loops)
+    return min(times), output_s
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--cases", nargs="*", help="run only these cases")
+    args = parser.parse_args()
+    logger.disable("sound_merge")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        cases = build_cases(root, make_fixtures(root / "sources"))
+        for name, (run, audio_s) in cases.items():
+            if args.cases and name not in args.cases:
+                continue
+            wall_s, output_s = time_case(run, args.repeats)
+            audio_s = output_s if audio_s is None else audio_s
+            results[name] = {"wall_s": wall_s, "rtf": audio_s / wall_s}
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    regressions = []
+    print(f"{'case':<24}{'wall ms':>10}{'RTF':>12}{'baseline':>12}{'change':>9}")
+    for name, result in results.items():
+        reference = baseline.get(name, {}).get("rtf")
+        change = result["rtf"] / reference - 1 if reference else 0.0
+        print(
+            f"{name:<24}{1000 * result['wall_s']:>10.1f}{result['rtf']:>12.1f}"
+            f"{reference or float('nan'):>12.1f}{change:>+9.1%}"
+        )
+        if reference and change < -args.tolerance:
+            regressions.append(name)
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps({**baseline, **results}, indent=1) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if regressions:
+        print(
+            f"REGRESSION: {', '.join(regressions)} slower than the baseline by more "
+            f"than {args.tolerance:.0%}",
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,59 +1,173 @@
+"""
+Converts the MUSDB18 .mp4 stem files into WAV files of the accompaniment.
+
+    python tools/tool_stem_extractor.py --workers 8
+    python tools/tool_stem_extractor.py --stems 1 2 3 --output /path/to/musdb-converted
+
+Every track is decoded once in a process pool, the selected stems (drums, bass and
+other by default) are summed in memory and only the sum is written, named after the
+track: "<track>.stem.mp4" becomes "<track>.wav", so names do not change when tracks are
+added. Finished tracks are listed in done.txt in the output directory, so a rerun
+skips them.
+"""
+
+import argparse
 import os
-import shutil
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-import logging
+from typing import Callable, Sequence
 
-import stempeg  # type: ignore
-from pydub import AudioSegment  # type: ignore
+import numpy as np
 from tool_config import dataset_dir, logger
 
+from sound_merge.reader import float32_to_pcm
+
+DONE_FILENAME = "done.txt"
+# MUSDB18 stem order: mixture, drums, bass, other, vocals
+ACCOMPANIMENT_STEMS = (1, 2, 3)
+
+
+def find_stem_files(stem_dir: Path) -> list[Path]:
+    """
+    Lists the .mp4 stem files below stem_dir in path order, without macOS ._ files
+    """
+    return sorted(
+        path
+        for path in stem_dir.rglob("*.mp4")
+        if path.is_file() and not path.name.startswith("._")
+    )
+
+
+def track_name(stem_file: Path) -> str:
+    """
+    Output file name of a track, its name without the .stem.mp4 suffixes
+    """
+    name = stem_file.name.removesuffix(".mp4").removesuffix(".stem")
+    return f"{name}.wav"
+
+
+def sum_stems(data: np.ndarray) -> np.ndarray:
+    """
+    Sums [stems, frames, channels] float samples into one [frames, channels] track
+    """
+    return data.sum(axis=0, dtype=np.float32)
+
 
-def extract_stems(stem_file, output_dir):
-    data, sample_rate = stempeg.read_stems(stem_file)
-    num_stems = len(data)
+def write_wav(path: Path, samples: np.ndarray, frame_rate: int, sample_width: int = 2):
+    """
+    Writes float [frames, channels] samples as a PCM WAV file, through a temporary file
+    so an interrupted write leaves no truncated output
+    """
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with wave.open(str(tmp_path), "wb") as file:
+        file.setnchannels(samples.shape[1])
+        file.setsampwidth(sample_width)
+        file.setframerate(frame_rate)
+        file.writeframes(float32_to_pcm(samples, sample_width).tobytes())
+    os.replace(tmp_path, path)
 
-    for i in range(num_stems):
-        stem_name = f"stem_{i+1}.wav"
-        output_path = output_dir / stem_name
-        stempeg.write_audio(str(output_path), data[i], sample_rate, codec="pcm_s16le")
 
+def read_stems(stem_file: Path, stems: Sequence[int]) -> tuple[np.ndarray, int]:
+    """
+    Decodes the selected stems of one file as [stems, frames, channels] float samples
+    """
+    import stempeg  # type: ignore
+
+    data, sample_rate = stempeg.read_stems(
+        str(stem_file), stem_id=list(stems), always_3d=True, dtype=np.float32
+    )
+    return data, int(sample_rate)
+
+
+StemReader = Callable[[Path, Sequence[int]], tuple[np.ndarray, int]]
+
+
+def extract_track(
+    stem_file: Path,
+    output_file: Path,
+    stems: Sequence[int],
+    reader: StemReader = read_stems,
+) -> Path:
+    """
+    Decodes the selected stems of one file and writes their sum
+    """
+    data, sample_rate = reader(stem_file, stems)
+    write_wav(output_file, sum_stems(data), sample_rate)
+    return output_file
+
+
+def read_done(output_dir: Path) -> set[str]:
+    try:
+        return set((output_dir / DONE_FILENAME).read_text().split("\n")) - {""}
+    except OSError:
+        return set()
+
+
+def process_stems(
+    stem_dir: Path,
+    output_dir: Path,
+    stems: Sequence[int] = ACCOMPANIMENT_STEMS,
+    workers: int = 4,
+    reader: StemReader = read_stems,
+) -> int:
+    """
+    Extracts every track below stem_dir that is not in the done-list of output_dir,
+    the stems are decoded by reader (stempeg by default). Returns the number of
+    tracks that failed.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    done = read_done(output_dir)
+    stem_files = find_stem_files(stem_dir)
+    todo = []
+    names: dict[str, Path] = {}
+    for stem_file in stem_files:
+        name = track_name(stem_file)
+        if name in names:
+            logger.warning(f"Skipping {stem_file}: {names[name]} has the same name")
+            continue
+        names[name] = stem_file
+        if stem_file.relative_to(stem_dir).as_posix() not in done:
+            todo.append((stem_file, output_dir / name))
+    logger.info(f"{len(names) - len(todo)} of {len(names)} tracks done")
 
-def process_stems(stem_dir: Path, output_dir: Path):
     files_failed = 0
-    i = 1
-    for item in stem_dir.iterdir():
-        if item.is_file():
+    with ProcessPoolExecutor(max_workers=workers) as executor, open(
+        output_dir / DONE_FILENAME, "a"
+    ) as done_file:
+        futures = {
+            executor.submit(
+                extract_track, stem_file, output_file, stems, reader
+            ): stem_file
+            for stem_file, output_file in todo
+        }
+        for future in as_completed(futures):
+            stem_file = futures[future]
             try:
-                if item.suffix == ".mp4" and not (item.name.startswith("._")):
-                    filename_new = f"musdb-sample{i}.wav"
-
-                    output_dir = stem_dir / filename_new
-                    os.makedirs(output_dir, exist_ok=True)
-                    extract_stems(str(stem_dir / item.name), output_dir)
-
-                    stem_2 = AudioSegment.from_wav(
-                        os.path.join(output_dir, "stem_2.wav")
-                    )
-                    stem_3 = AudioSegment.from_wav(
-                        os.path.join(output_dir, "stem_3.wav")
-                    )
-                    stem_4 = AudioSegment.from_wav(
-                        os.path.join(output_dir, "stem_4.wav")
-                    )
-                    combined_sound = stem_2 + stem_3 + stem_4
-
-                    output_file = output_dir / filename_new
-                    combined_sound.export(output_file, format="wav")
-
-                    i += 1
-                    logging.info(f"Extracted file {i-1}: {item.name}")
-            except shutil.Error as e:
-                logger.error(f"Error {files_failed} extracting file: {e}")
+                output_file = future.result()
+            except Exception as e:
                 files_failed += 1
-        elif item.is_dir():
-            process_stems(stem_dir / item.name, output_dir)
+                logger.error(f"Error {files_failed} extracting {stem_file}: {e}")
+                continue
+            done_file.write(stem_file.relative_to(stem_dir).as_posix() + "\n")
+            done_file.flush()
+            logger.info(f"Extracted {stem_file.name} to {output_file.name}")
+    return files_failed
+
 
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--input", type=Path, default=dataset_dir / "musdb18")
+    parser.add_argument(
+        "--output", type=Path, default=Path("/Volumes/Drive-1/musdb-converted")
+    )
+    parser.add_argument(
+        "--stems", type=int, nargs="+", default=list(ACCOMPANIMENT_STEMS)
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    process_stems(args.input, args.output, stems=args.stems, workers=args.workers)
 
-stem_dir = dataset_dir / "musdb18"
 
-process_stems(stem_dir, output_dir=Path("/Volumes/Drive-1/musdb-converted"))
+if __name__ == "__main__":
+    main()